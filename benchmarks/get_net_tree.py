@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+# Compares the old get_net tree builder (one tag query per network and a
+# rescan of all siblings for every row) with the current single pass builder.
+#
+# run it from the repository root:
+#     python -m benchmarks.get_net_tree [--sizes 1000 10000 100000]
+
+import argparse
+import time
+from ipaddress import ip_network
+from os import remove
+
+from minipam import server
+from minipam.server import *
+
+def get_net_old(net, depth=-1):
+    """
+    the get_net implementation before the single pass tree builder.
+    """
+    network = ip_network(net)
+    c = server.db_conn.cursor()
+    c.execute("SELECT net, address, netmask FROM networks "
+            "WHERE family = ? AND netmask >= ? AND address >= ? AND "
+            "address <= ? ORDER BY address ASC, netmask ASC",
+            (network.version, network.prefixlen,
+                network.network_address.packed,
+                network.broadcast_address.packed))
+    results = c.fetchall()
+
+    def add_tags(net):
+        c.execute("SELECT tag_name, tag_value FROM tags JOIN networks ON"
+                " network_id = id WHERE net = ?", (net["cidr"],))
+        net["tags"] = {l[0] : l[1] for l in c.fetchall()}
+
+    if len(results) == 0 or results[0]["net"] != str(network):
+        ret = { "address": str(network.network_address),
+                "cidr" : str(network),
+                "netmask": network.prefixlen,
+                "children": list(),
+                "network_in_database": False}
+        add_tags(ret)
+        start = 0
+        if len(results) == 0:
+            return ret
+    else:
+        ret = { "address" : results[0]["net"].split("/")[0],
+                "cidr" : results[0]["net"],
+                "netmask" : results[0]["netmask"],
+                "children" : list(),
+                "network_in_database": True}
+        add_tags(ret)
+        start = 1
+
+    def insert_in_netlist(ip_net, netlist, remaining_depth):
+        for c in netlist:
+            c_net = ip_network(c["cidr"])
+            if c_net.overlaps(ip_net):
+                if remaining_depth != 0:
+                    insert_in_netlist(ip_net, c["children"], remaining_depth-1)
+                return
+        netlist.append({"address" : n["net"].split("/")[0],
+            "cidr": n["net"],
+            "netmask" : n["netmask"],
+            "children" : list(),
+            "network_in_database" : True})
+        add_tags(netlist[-1])
+
+    if depth != 0:
+        for n in results[start:]:
+            n_net = ip_network(n["net"])
+            insert_in_netlist(n_net, ret["children"], depth-1)
+
+    return ret
+
+def synthetic_tree(size):
+    """
+    fills the database with size prefixes below 10.0.0.0/8:
+    /24 networks each containing up to 63 /30 networks, every /24 is tagged.
+    """
+    c = server.db_conn.cursor()
+    rows = [("10.0.0.0/8", address_to_bytes(10 << 24), 8)]
+    tags = list()
+    block = 0
+    while len(rows) < size:
+        base = (10 << 24) + (block << 8)
+        rows.append((str(ip_network((base, 24))), address_to_bytes(base), 24))
+        tags.append((str(ip_network((base, 24))), "name", "block %d" % block))
+        for i in range(min(63, size - len(rows))):
+            rows.append((str(ip_network((base + i*4, 30))), address_to_bytes(base + i*4), 30))
+        block += 1
+    c.executemany("INSERT INTO networks (net, family, address, netmask) VALUES (?,4,?,?)", rows)
+    c.executemany("INSERT INTO tags (network_id, tag_name, tag_value) "
+            "VALUES ((SELECT id FROM networks WHERE net = ?), ?, ?)", tags)
+    server.db_conn.commit()
+
+def count(net):
+    return 1 + sum(count(c) for c in net["children"])
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="get_net tree builder benchmark")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000])
+    parser.add_argument("--database", default="benchmark.db")
+    parser.add_argument("--old-limit", type=int, default=None,
+            help="skip the old builder for trees larger than this, "
+            "it needs about 20 minutes for 100000 prefixes")
+    args = parser.parse_args()
+
+    config.database_file = args.database
+    print("%10s %12s %12s %10s" % ("prefixes", "old [s]", "new [s]", "speedup"))
+    for size in args.sizes:
+        try:
+            remove(args.database)
+        except FileNotFoundError:
+            pass
+        start_database_connection()
+        synthetic_tree(size)
+
+        new_time, new = timed(get_net, "10.0.0.0/8")
+        assert count(new) == size
+        if args.old_limit is not None and size > args.old_limit:
+            print("%10d %12s %12.3f %10s" % (size, "-", new_time, "-"))
+        else:
+            old_time, old = timed(get_net_old, "10.0.0.0/8")
+            assert count(old) == size
+            print("%10d %12.3f %12.3f %9.1fx" % (size, old_time, new_time, old_time / new_time))
+        close_database_connection()
+    remove(args.database)
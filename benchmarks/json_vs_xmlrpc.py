@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# Compares the payload size and the round trip time of get_net over xmlrpc
+# and over the JSON front end for a large tree, in the tree and in the flat
+# format.
+#
+# run it from the repository root:
+#     python -m benchmarks.json_vs_xmlrpc [--size 10000] [--repeat 10]
+
+import argparse
+import json
+import multiprocessing
+import time
+import xmlrpc.client
+from os import remove
+
+from minipam import config
+from minipam.client import JSONClient
+from benchmarks.load_test import populate
+
+def run_servers(database, xmlrpc_port, json_port, ready):
+    config.database_file = database
+    config.xmlrpc_port = xmlrpc_port
+    config.json_port = json_port
+    from minipam.server import start_database_connection, create_xmlrpc_server
+    from minipam.json_server import start_json_server_thread
+    start_database_connection()
+    start_json_server_thread()
+    server = create_xmlrpc_server()
+    server.logRequests = False
+    ready.set()
+    server.serve_forever()
+
+def timed(function, repeat):
+    times = list()
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="json vs xmlrpc benchmark")
+    parser.add_argument("--size", type=int, default=10000, help="about how many nodes the tree has")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--xmlrpc-port", type=int, default=8765)
+    parser.add_argument("--json-port", type=int, default=8766)
+    parser.add_argument("--database", default="benchmark.db")
+    args = parser.parse_args()
+
+    try:
+        remove(args.database)
+    except FileNotFoundError:
+        pass
+    # every pool is a /16 with 64 /24 networks
+    populate(args.database, max(1, args.size // 65))
+
+    ready = multiprocessing.Event()
+    servers = multiprocessing.Process(target=run_servers,
+            args=(args.database, args.xmlrpc_port, args.json_port, ready), daemon=True)
+    servers.start()
+    ready.wait()
+    time.sleep(0.5)
+
+    proxy = xmlrpc.client.ServerProxy("http://localhost:%d/" % args.xmlrpc_port, allow_none=True)
+    client = JSONClient("http://localhost:%d/" % args.json_port)
+
+    xmlrpc_time, tree = timed(lambda: proxy.get_net("10.0.0.0/8"), args.repeat)
+    json_time, json_tree = timed(lambda: client.get_net("10.0.0.0/8"), args.repeat)
+    assert tree == json_tree
+    xmlrpc_flat_time, flat = timed(lambda: proxy.get_net("10.0.0.0/8", -1, "flat"), args.repeat)
+    json_flat_time, json_flat = timed(lambda: client.get_net("10.0.0.0/8", -1, "flat"), args.repeat)
+    assert flat == json_flat
+
+    xml_size = len(xmlrpc.client.dumps((tree,), methodresponse=True, allow_none=True).encode("utf-8"))
+    json_size = len(json.dumps({"result" : tree}, separators=(",", ":")).encode("utf-8"))
+    xml_flat_size = len(xmlrpc.client.dumps((flat,), methodresponse=True,
+        allow_none=True).encode("utf-8"))
+    json_flat_size = len(json.dumps({"result" : flat}, separators=(",", ":")).encode("utf-8"))
+
+    def count(net):
+        return 1 + sum(count(c) for c in net["children"])
+
+    print("get_net of a tree with %d nodes, best of %d" % (count(tree), args.repeat))
+    print("%12s %14s %14s" % ("", "payload [kB]", "round trip [ms]"))
+    print("%12s %14.1f %14.1f" % ("xmlrpc", xml_size / 1000, xmlrpc_time * 1000))
+    print("%12s %14.1f %14.1f" % ("json", json_size / 1000, json_time * 1000))
+    print("%12s %14.1f %14.1f" % ("xmlrpc flat", xml_flat_size / 1000, xmlrpc_flat_time * 1000))
+    print("%12s %14.1f %14.1f" % ("json flat", json_flat_size / 1000, json_flat_time * 1000))
+
+    client.close()
+    servers.terminate()
+    servers.join()
+    remove(args.database)
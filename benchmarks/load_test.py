@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+# Runs a mixed read/write workload against a minipam xmlrpc server and reports
+# the latency percentiles and the throughput for several numbers of
+# concurrent clients.
+#
+# run it from the repository root:
+#     python -m benchmarks.load_test [--workers 8] [--clients 1 8 64]
+
+import argparse
+import multiprocessing
+import random
+import threading
+import time
+from ipaddress import ip_network
+from os import remove
+from xmlrpc.client import ServerProxy
+
+from minipam import config
+
+def remove_database(database):
+    """
+    removes the database and the -wal and -shm files of WAL mode.
+    """
+    for f in [database, database + "-wal", database + "-shm"]:
+        try:
+            remove(f)
+        except FileNotFoundError:
+            pass
+
+def run_server(database, port, workers, ready):
+    config.database_file = database
+    config.xmlrpc_port = port
+    config.xmlrpc_workers = workers
+    from minipam.server import start_database_connection, create_xmlrpc_server
+    start_database_connection()
+    server = create_xmlrpc_server()
+    server.logRequests = False
+    ready.set()
+    server.serve_forever()
+
+def populate(database, pools):
+    """
+    creates pools /16 networks in 10.0.0.0/8 with 64 tagged /24 networks each.
+    """
+    config.database_file = database
+    from minipam import server
+    server.start_database_connection()
+    with server.transaction():
+        server.add_net("10.0.0.0/8")
+        for i in range(pools):
+            pool = str(ip_network(((10 << 24) + (i << 16), 16)))
+            server.add_net(pool)
+            for net in server.claim_nets(pool, 24, 64):
+                server.add_tag(net, "name", net)
+    server.close_database_connection()
+
+def client(url, pools, write_ratio, deadline, latencies):
+    rng = random.Random()
+    with ServerProxy(url, allow_none=True) as proxy:
+        while time.monotonic() < deadline:
+            pool = "10.%d.0.0/16" % rng.randrange(pools)
+            start = time.perf_counter()
+            if rng.random() < write_ratio:
+                net = proxy.claim_net(pool, 28)["cidr"]
+                proxy.delete_net(net)
+            else:
+                choice = rng.randrange(3)
+                if choice == 0:
+                    proxy.get_net(pool, 1)
+                elif choice == 1:
+                    proxy.get_tags("10.%d.%d.0/24" % (int(pool.split(".")[1]), rng.randrange(64)))
+                else:
+                    proxy.lookup_ip("10.%d.%d.1" % (int(pool.split(".")[1]), rng.randrange(256)))
+            latencies.append(time.perf_counter() - start)
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="minipam xmlrpc load test")
+    parser.add_argument("--workers", type=int, default=8,
+            help="worker threads of the server, 0 for the single threaded server")
+    parser.add_argument("--clients", nargs="+", type=int, default=[1, 8, 64])
+    parser.add_argument("--duration", type=float, default=10, help="seconds per run")
+    parser.add_argument("--write-ratio", type=float, default=0.1)
+    parser.add_argument("--pools", type=int, default=16)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--database", default="benchmark.db")
+    args = parser.parse_args()
+
+    remove_database(args.database)
+    populate(args.database, args.pools)
+
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=run_server,
+            args=(args.database, args.port, args.workers, ready), daemon=True)
+    server.start()
+    ready.wait()
+    url = "http://localhost:%d/" % args.port
+
+    print("workers: %d, write ratio: %.2f" % (args.workers, args.write_ratio))
+    print("%8s %10s %10s %10s %10s" % ("clients", "requests", "req/s", "p50 [ms]", "p99 [ms]"))
+    for clients in args.clients:
+        latencies = list()
+        deadline = time.monotonic() + args.duration
+        threads = [threading.Thread(target=client,
+            args=(url, args.pools, args.write_ratio, deadline, latencies))
+            for i in range(clients)]
+        start = time.monotonic()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - start
+        latencies.sort()
+        print("%8d %10d %10.1f %10.2f %10.2f" % (clients, len(latencies),
+            len(latencies) / elapsed, percentile(latencies, 0.5) * 1000,
+            percentile(latencies, 0.99) * 1000))
+
+    server.terminate()
+    server.join()
+    remove_database(args.database)
@@ -0,0 +1,124 @@
+# Synthetic address plans for the benchmarks.
+#
+# Every generator returns a dict with
+#     "rows": the (cidr, tags) pairs of the plan for import_nets
+#     "pools": networks with free space to claim networks of "claim_size" in
+#     "subtrees": disjoint networks with children for recursive deletes
+#     "tagged": networks which have the tag "tag"
+# The plans are generated from a seed, so the same arguments always give
+# the same plan.
+
+import random
+from ipaddress import IPv4Network
+
+def _cidr(address, prefixlen):
+    return str(IPv4Network((address, prefixlen)))
+
+def _tags(rng, count):
+    """
+    returns count tags with skewed values like they are found in real plans.
+    """
+    tags = {"site" : "site-%d" % int(rng.paretovariate(1.2)),
+            "vlan" : str(rng.randrange(1, 4095)),
+            "status" : rng.choice(["active", "active", "active", "reserved", "deprecated"]),
+            "customer" : "customer-%d" % int(rng.paretovariate(0.8)),
+            "role" : rng.choice(["access", "core", "transfer", "loopback", "management"]),
+            "owner" : "team-%d" % rng.randrange(20),
+            "ticket" : "T-%d" % rng.randrange(100000),
+            "description" : "network %d" % rng.randrange(1000000)}
+    return dict(list(tags.items())[:count])
+
+def deep(count, seed=0, tags_per_net=1):
+    """
+    a hierarchy from a /8 down to /32, every network has 6 children which
+    are 8 times smaller. The levels are filled one after the other until the
+    plan has count networks.
+    """
+    rng = random.Random(seed)
+    rows = [(_cidr(10 << 24, 8), _tags(rng, tags_per_net))]
+    level = [(10 << 24, 8)]
+    levels = [level]
+    while len(rows) < count and level[0][1] + 3 <= 32:
+        next_level = list()
+        for address, prefixlen in level:
+            for i in range(6):
+                if len(rows) >= count:
+                    break
+                child = (address + (i << (32 - prefixlen - 3)), prefixlen + 3)
+                next_level.append(child)
+                rows.append((_cidr(*child), _tags(rng, tags_per_net)))
+        level = next_level
+        levels.append(level)
+
+    # claim in the deepest full level which still has room for claims
+    pools = [n for l in levels if l[0][1] <= 26 for n in l][-1000:]
+    subtrees = levels[min(2, len(levels) - 1)]
+    return {"rows" : rows,
+            "pools" : [_cidr(*n) for n in pools],
+            "claim_size" : pools[-1][1] + 4,
+            "subtrees" : [_cidr(*n) for n in subtrees],
+            "tagged" : [cidr for cidr, tags in rows[::max(1, len(rows) // 1000)]],
+            "tag" : "site"}
+
+def flat(count, seed=0, tags_per_net=1):
+    """
+    /24 sprawl: count /24 networks directly in /8 networks, 65536 per /8.
+    Every /8 is kept half empty, so the plan has count / 32768 /8 networks.
+    """
+    rng = random.Random(seed)
+    rows = list()
+    roots = list()
+    per_root = 32768
+    for r in range((count + per_root - 1) // per_root):
+        root = (10 + r) << 24
+        roots.append(root)
+        rows.append((_cidr(root, 8), {}))
+        for i in range(min(per_root, count - r * per_root)):
+            rows.append((_cidr(root + (i << 8), 24), _tags(rng, tags_per_net)))
+    return {"rows" : rows,
+            "pools" : [_cidr(r, 8) for r in roots],
+            "claim_size" : 24,
+            "subtrees" : [_cidr(r, 8) for r in roots],
+            "tagged" : [cidr for cidr, tags in rows[1::max(1, len(rows) // 1000)]],
+            "tag" : "site"}
+
+def fragmented(count, seed=0, tags_per_net=1):
+    """
+    /16 pools of a /8 which are filled with randomly sized networks from
+    /25 to /30 and random gaps between them, so the free space is split
+    into many small blocks.
+    """
+    rng = random.Random(seed)
+    rows = [(_cidr(10 << 24, 8), {})]
+    pools = list()
+    pool = 0
+    while len(rows) < count and pool < 256:
+        base = (10 << 24) + (pool << 16)
+        pools.append(base)
+        rows.append((_cidr(base, 16), {}))
+        cursor = 0
+        while len(rows) < count:
+            prefixlen = rng.randrange(25, 31)
+            size = 1 << (32 - prefixlen)
+            # align the cursor to the network size and skip a random gap
+            cursor = (cursor + size - 1) // size * size
+            cursor += size * rng.randrange(2)
+            if cursor + size > 1 << 16:
+                break
+            rows.append((_cidr(base + cursor, prefixlen), _tags(rng, tags_per_net)))
+            cursor += size
+        pool += 1
+    return {"rows" : rows,
+            "pools" : [_cidr(p, 16) for p in pools],
+            "claim_size" : 29,
+            "subtrees" : [_cidr(p, 16) for p in pools],
+            "tagged" : [cidr for cidr, tags in rows[2::max(1, len(rows) // 1000)]],
+            "tag" : "site"}
+
+def tagged(count, seed=0):
+    """
+    the deep hierarchy with 8 tags on every network.
+    """
+    return deep(count, seed, tags_per_net=8)
+
+plans = {"deep" : deep, "flat" : flat, "fragmented" : fragmented, "tagged" : tagged}
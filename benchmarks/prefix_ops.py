@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+# Compares the time per operation of ipaddress.ip_network objects and of
+# minipam.ip_utils.Prefix for the operations minipam.server does on every
+# call: parsing a network, turning it back into a string, its first and last
+# address as integers and blobs, containment, overlap and the supernet.
+#
+# run it from the repository root:
+#     python -m benchmarks.prefix_ops [--number 100000]
+
+import argparse
+import random
+import timeit
+from ipaddress import ip_network
+
+from minipam.ip_utils import Prefix
+
+def networks(count, version):
+    """
+    returns count random networks in cidr notation.
+    """
+    max_prefixlen = 32 if version == 4 else 128
+    nets = list()
+    for i in range(count):
+        prefixlen = random.randint(8, max_prefixlen)
+        address = random.getrandbits(prefixlen) << (max_prefixlen - prefixlen)
+        nets.append(str(ip_network((address, prefixlen))))
+    return nets
+
+def operations(cidrs):
+    """
+    :returns: a list of (name, ipaddress function, Prefix function) tuples,
+    every function does its operation once for every cidr.
+    """
+    objects = [ip_network(n) for n in cidrs]
+    prefixes = [Prefix.parse(n) for n in cidrs]
+    object_pairs = list(zip(objects, objects[1:] + objects[:1]))
+    prefix_pairs = list(zip(prefixes, prefixes[1:] + prefixes[:1]))
+    return [
+        ("parse",
+            lambda: [ip_network(n) for n in cidrs],
+            lambda: [Prefix.parse(n) for n in cidrs]),
+        ("str",
+            lambda: [str(ip_network(n)) for n in cidrs],
+            lambda: [str(Prefix.parse(n)) for n in cidrs]),
+        ("first and last address",
+            lambda: [(int(n.network_address), int(n.broadcast_address)) for n in objects],
+            lambda: [(n.address, n.broadcast) for n in prefixes]),
+        ("address blobs",
+            lambda: [(n.network_address.packed, n.broadcast_address.packed)
+                for n in objects],
+            lambda: [(n.address_bytes(), n.broadcast_bytes()) for n in prefixes]),
+        ("contains",
+            lambda: [a.version == b.version and b.subnet_of(a) for a, b in object_pairs],
+            lambda: [a.contains(b) for a, b in prefix_pairs]),
+        ("overlaps",
+            lambda: [a.version == b.version and a.overlaps(b) for a, b in object_pairs],
+            lambda: [a.overlaps(b) for a, b in prefix_pairs]),
+        ("supernet",
+            lambda: [n.supernet() for n in objects if n.prefixlen],
+            lambda: [n.supernet() for n in prefixes if n.prefixlen]),
+    ]
+
+def best(function, repeat):
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ipaddress vs Prefix benchmark")
+    parser.add_argument("--number", type=int, default=100000,
+            help="the number of networks per version")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(0)
+    print("%-24s %12s %12s %8s" % ("operation", "ipaddress", "Prefix", "speedup"))
+    for version in [4, 6]:
+        cidrs = networks(args.number, version)
+        for name, old, new in operations(cidrs):
+            old_time = best(old, args.repeat) / args.number * 1e9
+            new_time = best(new, args.repeat) / args.number * 1e9
+            print("%-24s %9.0f ns %9.0f ns %7.1fx" % ("IPv%d %s" % (version, name),
+                old_time, new_time, old_time / new_time))
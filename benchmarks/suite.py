@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+# Times the main functions on synthetic address plans of different shapes and
+# sizes, in process and over xmlrpc, and writes the results as JSON. Two
+# result files can be compared to find regressions between commits.
+#
+# run it from the repository root:
+#     python -m benchmarks.suite [--plans deep flat] [--sizes 1000 10000 1000000]
+#         [--output results.json] [--compare old.json]
+
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import time
+from xmlrpc.client import ServerProxy
+
+from minipam import config
+from minipam import server
+from benchmarks.load_test import remove_database, run_server
+from benchmarks.plans import plans
+
+def build(database, plan):
+    """
+    imports the plan into a new database.
+    :returns: the seconds the import took
+    """
+    remove_database(database)
+    config.database_file = database
+    server.start_database_connection()
+    start = time.perf_counter()
+    server.import_nets(plan["rows"])
+    seconds = time.perf_counter() - start
+    server.close_database_connection()
+    return seconds
+
+def timed(call, args_list):
+    """
+    calls call with every argument tuple of args_list.
+    :returns: the seconds of every call
+    """
+    times = list()
+    for args in args_list:
+        start = time.perf_counter()
+        call(*args)
+        times.append(time.perf_counter() - start)
+    return times
+
+def operations(plan, repeat, heavy_repeat, seed=0):
+    """
+    returns the (name, function name, argument tuples) of the timed
+    operations. The operations change the database, so they have to run in
+    this order on a fresh copy of it.
+    """
+    rng = random.Random(seed)
+    pools = [rng.choice(plan["pools"]) for i in range(repeat)]
+    tagged = rng.sample(plan["tagged"], min(repeat, len(plan["tagged"])))
+    subtrees = plan["subtrees"][:heavy_repeat]
+    return [("get_net depth 1", "get_net", [(p, 1) for p in pools]),
+            ("get_net subtree", "get_net", [(s,) for s in subtrees]),
+            ("free_blocks", "free_blocks", [(p,) for p in pools]),
+            ("summarize query", "summarize", [([], plan["tag"])] * heavy_repeat),
+            ("claim_net", "claim_net", [(p, plan["claim_size"]) for p in pools]),
+            ("get_net_by_tag", "get_net_by_tag", [(plan["tag"],)] * heavy_repeat),
+            ("add_tag", "add_tag", [(n, "benchmark", "a") for n in tagged]),
+            ("modify_tag", "modify_tag", [(n, "benchmark", "b") for n in tagged]),
+            ("delete_tag", "delete_tag", [(n, "benchmark") for n in tagged]),
+            ("delete_net recursive", "delete_net", [(s, True) for s in subtrees])]
+
+def run_in_process(database, ops):
+    config.database_file = database
+    server.start_database_connection()
+    try:
+        return [(name, timed(server.rpc_functions[function], args))
+                for name, function, args in ops]
+    finally:
+        server.close_database_connection()
+
+def run_xmlrpc(database, ops, port):
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=run_server, args=(database, port, 0, ready),
+            daemon=True)
+    process.start()
+    ready.wait()
+    try:
+        with ServerProxy("http://localhost:%d/" % port, allow_none=True) as proxy:
+            return [(name, timed(getattr(proxy, function), args))
+                    for name, function, args in ops]
+    finally:
+        process.terminate()
+        process.join()
+
+def summary(times):
+    times = sorted(times)
+    return {"calls" : len(times),
+            "min" : times[0],
+            "median" : times[len(times) // 2],
+            "p95" : times[min(len(times) - 1, int(len(times) * 0.95))],
+            "mean" : sum(times) / len(times)}
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old, new, threshold):
+    """
+    prints the change of the median of every result which is in both runs.
+    """
+    def key(r):
+        return (r["plan"], r["size"], r["mode"], r["operation"])
+    old_results = {key(r) : r for r in old["results"]}
+    print("\ncompared with %s" % (old.get("commit") or "the old results"))
+    print("%-12s %8s %10s %-22s %12s %12s %8s" % ("plan", "size", "mode", "operation",
+        "old [ms]", "new [ms]", "change"))
+    for r in new["results"]:
+        o = old_results.get(key(r))
+        if o is None:
+            continue
+        ratio = r["median"] / o["median"] if o["median"] > 0 else float("inf")
+        print("%-12s %8d %10s %-22s %12.3f %12.3f %+7.0f%%%s" % (r["plan"], r["size"],
+            r["mode"], r["operation"], o["median"] * 1000, r["median"] * 1000,
+            (ratio - 1) * 100, "  slower" if ratio > threshold else ""))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="minipam benchmark suite")
+    parser.add_argument("--plans", nargs="+", choices=sorted(plans), default=sorted(plans))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000],
+            help="the numbers of networks of the plans, up to 1000000")
+    parser.add_argument("--modes", nargs="+", choices=["inprocess", "xmlrpc"],
+            default=["inprocess", "xmlrpc"])
+    parser.add_argument("--repeat", type=int, default=100,
+            help="calls of the cheap operations")
+    parser.add_argument("--heavy-repeat", type=int, default=3,
+            help="calls of get_net on subtrees, get_net_by_tag and recursive deletes")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--database", default="benchmark.db")
+    parser.add_argument("--output", default=None, help="write the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="compare with an older JSON file")
+    parser.add_argument("--threshold", type=float, default=1.2,
+            help="mark results whose median grew by more than this factor")
+    args = parser.parse_args()
+
+    results = list()
+    print("%-12s %8s %10s %-22s %6s %10s %10s %10s" % ("plan", "size", "mode", "operation",
+        "calls", "min [ms]", "med [ms]", "p95 [ms]"))
+    def report(plan_name, size, mode, name, times):
+        result = dict(plan=plan_name, size=size, mode=mode, operation=name, **summary(times))
+        results.append(result)
+        print("%-12s %8d %10s %-22s %6d %10.3f %10.3f %10.3f" % (plan_name, size, mode, name,
+            result["calls"], result["min"] * 1000, result["median"] * 1000,
+            result["p95"] * 1000), flush=True)
+
+    for plan_name in args.plans:
+        for size in args.sizes:
+            plan = plans[plan_name](size)
+            report(plan_name, size, "inprocess", "import_nets", [build(args.database, plan)])
+            ops = operations(plan, args.repeat, args.heavy_repeat)
+            del plan
+            for mode in args.modes:
+                copy = "%s-%s" % (args.database, mode)
+                remove_database(copy)
+                shutil.copyfile(args.database, copy)
+                if mode == "inprocess":
+                    timings = run_in_process(copy, ops)
+                else:
+                    timings = run_xmlrpc(copy, ops, args.port)
+                for name, times in timings:
+                    if times:
+                        report(plan_name, size, mode, name, times)
+                remove_database(copy)
+            remove_database(args.database)
+
+    output = {"commit" : commit(),
+            "date" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python" : platform.python_version(),
+            "sqlite" : sqlite3.sqlite_version,
+            "arguments" : vars(args),
+            "results" : results}
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=1)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(json.load(f), output, args.threshold)
@@ -4,20 +4,27 @@ import os
 import json
 import sys
 
-from xmlrpc.client import ServerProxy
 from pprint import PrettyPrinter
 
 parser = argparse.ArgumentParser(description="a CLI client for minipam")
 parser.add_argument("--server", nargs=1, type=str, metavar="SERVER")
+parser.add_argument("--database", nargs=1, type=str, metavar="FILE",
+        help="work directly on the minipam database FILE instead of a server")
 group = parser.add_mutually_exclusive_group()
 group.add_argument("--add-net","-an", nargs=1, type=str, metavar="NET",
         help="add the network NET")
 group.add_argument("--delete-net","-dn", nargs=1, type=str, metavar="NET",
         help="delete the network NET")
+group.add_argument("--delete-subtree","-ds", nargs=1, type=str, metavar="NET",
+        help="delete the network NET and all networks within it")
 group.add_argument("--get-net","-gn", nargs=1, type=str, metavar="NET",
         help="get a network and it's children")
 group.add_argument("--claim-net","-cn", nargs=2, type=str, metavar=("NET", "NETMASK"),
         help="claim a new network with a subnet mask of NETMASK in the network NET")
+group.add_argument("--claim-nets","-cns", nargs=3, type=str, metavar=("NET", "NETMASK", "COUNT"),
+        help="claim COUNT new networks with a subnet mask of NETMASK in the network NET")
+group.add_argument("--get-usage","-gu", nargs=1, type=str, metavar="NET",
+        help="get how many addresses of the network NET are used and free")
 group.add_argument("--add-tag","-at", nargs=3, type=str, metavar=("NET", "TAGNAME", "TAGVALUE"),
         help="add a tag to the network NET with the name TAGNAME and value TAGVALUE")
 group.add_argument("--delete-tag","-dt", nargs=2, type=str, metavar=("NET", "TAGNAME"),
@@ -28,51 +35,163 @@ group.add_argument("--get-tag","-gt", nargs=2, type=str, metavar=("NET", "TAGNAM
         help="get the value of the tag TAGNAME for network NETWORK")
 group.add_argument("--get-tags","-gts", nargs=1, type=str, metavar="NET",
         help="get all tags from the network NET")
-group.add_argument("--get-nets-by-tag","-gtt", nargs=1, type=str, metavar="TAGNAME",
-        help="get all networks with the tag TAGNAME")
+group.add_argument("--get-nets-by-tag","-gtt", nargs="+", type=str, metavar="QUERY",
+        help="get all networks whose tags match QUERY, with QUERY NET only those within NET. "
+        "QUERY is a tag name or an expression like \"vlan=10 AND site IN (a,b) AND NOT reserved\"")
+group.add_argument("--lookup-ip","-li", nargs=1, type=str, metavar="IP",
+        help="get the most specific network which contains the address IP")
+group.add_argument("--lookup-ips","-lis", nargs="+", type=str, metavar="IP",
+        help="get the most specific network for every address IP")
+group.add_argument("--free-blocks","-fb", nargs="+", type=str, metavar=("NET", "SIZE"),
+        help="get the unused parts of the network NET, with SIZE only blocks of a /SIZE or larger")
+group.add_argument("--summarize","-su", nargs="+", type=str, metavar="NET",
+        help="get the smallest list of networks which covers the networks NET")
+group.add_argument("--summarize-query","-sq", nargs=1, type=str, metavar="QUERY",
+        help="get the smallest list of networks which covers the networks matching the "
+        "tag query QUERY like \"site=x\"")
+group.add_argument("--import","-im", nargs=1, type=str, metavar="FILE", dest="import_file",
+        help="import the networks and tags from FILE (.csv or .jsonl)")
+group.add_argument("--export","-ex", nargs="+", type=str, metavar=("FILE", "NET"),
+        dest="export_file",
+        help="export all networks or with NET the networks within NET to FILE (.csv or .jsonl)")
+parser.add_argument("--dry-run", action="store_true",
+        help="with --delete-net or --delete-subtree only count what would be deleted")
 args = parser.parse_args()
+if args.export_file is not None and len(args.export_file) > 2:
+    parser.error("argument --export/-ex: expected FILE and at most one NET")
 
-if args.server is None:
-    # check for ~/.minipamcli.json and take the server param from there
+# how many rows are sent to the server with one import_nets call
+IMPORT_BATCH_SIZE = 10000
+# how many networks --delete-subtree deletes in one transaction
+DELETE_CHUNK_SIZE = 10000
+
+def import_minipam():
+    """
+    makes the minipam package next to the cli importable.
+    """
+    path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+def import_file(server, path):
+    import_minipam()
+    from minipam import bulk
+    added = tagged = done = 0
+    batch = list()
+    with open(path, newline="") as f:
+        for row in bulk.read_rows(f, bulk.file_format(path)):
+            batch.append(row)
+            if len(batch) == IMPORT_BATCH_SIZE:
+                result = server.import_nets(batch)
+                added, tagged, done = added + result["networks"], tagged + result["tags"], done + len(batch)
+                print("\r%d rows" % done, end="", file=sys.stderr, flush=True)
+                batch = list()
+        if batch:
+            result = server.import_nets(batch)
+            added, tagged, done = added + result["networks"], tagged + result["tags"], done + len(batch)
+    print("\r%d rows, added %d networks and %d tags" % (done, added, tagged), file=sys.stderr)
+
+def export_rows(server, net=None):
+    """
+    yields the (cidr, tags) pairs of all networks within net, or of all
+    networks if net is None, one page of get_net_page at a time.
+    """
+    for root in [net] if net is not None else ["0.0.0.0/0", "::/0"]:
+        cursor = None
+        while True:
+            page = server.get_net_page(root, -1, cursor, IMPORT_BATCH_SIZE)
+            for n in page["nodes"]:
+                if n["network_in_database"]:
+                    yield n["cidr"], n["tags"]
+            cursor = page["cursor"]
+            if cursor is None:
+                break
+
+def export_file(server, path, net=None):
+    import_minipam()
+    from minipam import bulk
+    format = bulk.file_format(path)
+    tag_names = ()
+    if format == "csv":
+        # the header of a csv file needs all tag names before the first row
+        tag_names = sorted({t for cidr, tags in export_rows(server, net) for t in tags})
+    with open(path, "w", newline="") as f:
+        bulk.write_rows(f, export_rows(server, net), format, tag_names)
+
+def is_read_only(args):
+    """
+    returns True if the command only reads from the database.
+    """
+    return any(getattr(args, name) is not None for name in ["get_net", "get_usage",
+        "get_tag", "get_tags", "get_nets_by_tag", "lookup_ip", "lookup_ips", "free_blocks",
+        "summarize", "summarize_query", "export_file"]) \
+                or args.dry_run
+
+def connect(args):
+    """
+    returns a LocalClient for --database or a ServerProxy for the server.
+    """
+    if args.database is not None:
+        import_minipam()
+        from minipam.local import LocalClient
+        return LocalClient(args.database[0], read_only=is_read_only(args))
+    from xmlrpc.client import ServerProxy
+    return ServerProxy(args.server[0], allow_none=True)
+
+if args.server is None and args.database is None:
+    # check for ~/.minipamcli.json and take the server or database param from there
     config_path = os.path.expanduser("~/.minipamcli.json")
     if os.path.isfile(config_path):
         with open(config_path, "r") as f:
             config = json.loads(f.read())
             if "server" in config:
                 args.server = [config["server"]]
+            elif "database" in config:
+                args.database = [config["database"]]
             else:
-                print("key 'server' not found in %s" % config_path)
+                print("key 'server' or 'database' not found in %s" % config_path)
                 sys.exit(1)
     else:
-        print("no --server argument and no %s found." % config_path)
+        print("no --server or --database argument and no %s found." % config_path)
         sys.exit(1)
 
-with ServerProxy(args.server[0]) as server:
+with connect(args) as server:
     pp = PrettyPrinter()
 
     if args.get_net is not None:
-        result = server.get_net(args.get_net[0])
-
-        def recursive_print(net, indent=0):
-            name = ""
-            if "name" in net["tags"]:
-                name = net["tags"]["name"]
-            if net["network_in_database"]:
-                print(" "*indent, net["cidr"] , name)
-            else:
-                print(" "*indent, "(%s) - not in database" % net["cidr"])
-            for child in net["children"]:
-                recursive_print(child, indent=indent+2)
-
-        recursive_print(result)
+        # read the tree page by page and print every network as soon as it arrives
+        cursor = None
+        while True:
+            page = server.get_net_page(args.get_net[0], -1, cursor)
+            for net in page["nodes"]:
+                indent = 2 * net["depth"]
+                name = net["tags"].get("name", "")
+                if net["network_in_database"]:
+                    print(" "*indent, net["cidr"] , name)
+                else:
+                    print(" "*indent, "(%s) - not in database" % net["cidr"])
+            cursor = page["cursor"]
+            if cursor is None:
+                break
     elif args.add_net is not None:
         server.add_net(args.add_net[0])
     elif args.delete_net is not None:
-        server.delete_net(args.delete_net[0])
+        pp.pprint(server.delete_net(args.delete_net[0], False, args.dry_run))
+    elif args.delete_subtree is not None:
+        # the server deletes large subtrees in batches, so it is not locked all the time
+        pp.pprint(server.delete_net(args.delete_subtree[0], True, args.dry_run,
+            DELETE_CHUNK_SIZE))
     elif args.claim_net is not None:
         result = server.claim_net(args.claim_net[0], int(args.claim_net[1]))
         pp.pprint(result)
+    elif args.claim_nets is not None:
+        result = server.claim_nets(args.claim_nets[0], int(args.claim_nets[1]),
+                int(args.claim_nets[2]))
+        for net in result:
+            print(net)
 
+    elif args.get_usage is not None:
+        pp.pprint(server.get_usage(args.get_usage[0]))
     elif args.add_tag is not None:
         server.add_tag(args.add_tag[0], args.add_tag[1], args.add_tag[2])
     elif args.get_tag is not None:
@@ -86,5 +205,36 @@ with ServerProxy(args.server[0]) as server:
     elif args.delete_tag is not None:
         server.delete_tag(args.delete_tag[0], args.delete_tag[1])
     elif args.get_nets_by_tag is not None:
-        pp.pprint(server.get_net_by_tag(args.get_nets_by_tag[0]))
+        query = args.get_nets_by_tag[0]
+        net = args.get_nets_by_tag[1] if len(args.get_nets_by_tag) > 1 else None
+        cursor = None
+        while True:
+            page = server.query_nets(query, net, cursor)
+            for n in page["nodes"]:
+                print(n["cidr"], " ".join("%s=%s" % t for t in sorted(n["tags"].items())))
+            cursor = page["cursor"]
+            if cursor is None:
+                break
+    elif args.lookup_ip is not None:
+        pp.pprint(server.lookup_ip(args.lookup_ip[0]))
+    elif args.lookup_ips is not None:
+        for ip, net in zip(args.lookup_ips, server.lookup_ips(args.lookup_ips)):
+            if net is None:
+                print(ip, "- not in database")
+            else:
+                print(ip, net["cidr"], net["tags"].get("name", ""))
+    elif args.free_blocks is not None:
+        size = int(args.free_blocks[1]) if len(args.free_blocks) > 1 else None
+        for net in server.free_blocks(args.free_blocks[0], size):
+            print(net)
+    elif args.summarize is not None:
+        for net in server.summarize(args.summarize):
+            print(net)
+    elif args.summarize_query is not None:
+        for net in server.summarize([], args.summarize_query[0]):
+            print(net)
+    elif args.import_file is not None:
+        import_file(server, args.import_file[0])
+    elif args.export_file is not None:
+        export_file(server, *args.export_file[:2])
 
@@ -0,0 +1,146 @@
+import argparse
+import contextlib
+import csv
+import json
+import sys
+import time
+
+from minipam import config
+from minipam import server
+
+# Reading and writing address plans as files and the command to import and
+# export them directly on the database:
+#
+#     python -m minipam.bulk import plan.csv
+#     python -m minipam.bulk export plan.jsonl [10.0.0.0/8]
+#
+# It also deletes large subtrees in batches, see delete_net. An interrupted
+# delete is continued by running it again, --dry-run only counts:
+#
+#     python -m minipam.bulk delete 10.0.0.0/8 [--chunk-size 10000] [--dry-run]
+#
+# A CSV file has a header line starting with the column cidr, the other
+# columns are tag names. Empty cells mean that the network does not have
+# that tag. A JSON Lines file has one {"cidr" : ..., "tags" : {...}} object
+# per line.
+
+def file_format(path):
+    """
+    returns "csv" or "jsonl" depending on the file name.
+    """
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+def read_rows(f, format="jsonl"):
+    """
+    yields the (cidr, tags) pairs of an open file.
+    """
+    if format == "csv":
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        for row in reader:
+            if row:
+                yield row[0], {k : v for k, v in zip(header[1:], row[1:]) if v != ""}
+    else:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                yield row["cidr"], row.get("tags", dict())
+
+def write_rows(f, rows, format="jsonl", tag_names=()):
+    """
+    writes (cidr, tags) pairs to an open file.
+    :param tag_names: the columns of a CSV file next to the cidr
+    """
+    if format == "csv":
+        writer = csv.writer(f)
+        writer.writerow(["cidr"] + list(tag_names))
+        for cidr, tags in rows:
+            writer.writerow([cidr] + [tags.get(t, "") for t in tag_names])
+    else:
+        for cidr, tags in rows:
+            f.write(json.dumps({"cidr" : cidr, "tags" : tags}, separators=(",", ":")) + "\n")
+
+def export_rows(net=None):
+    """
+    yields the (cidr, tags) pairs of all networks within net, or of all
+    networks if net is None, sorted like iter_net sorts them.
+    """
+    for root in [net] if net is not None else ["0.0.0.0/0", "::/0"]:
+        for node in server.iter_net(root, chunk_size=10000):
+            if node["network_in_database"]:
+                yield node["cidr"], node["tags"]
+
+def tag_names():
+    """
+    returns the sorted names of all tags in the database.
+    """
+    with server.reading() as c:
+        c.execute("SELECT DISTINCT tag_name FROM tags ORDER BY tag_name")
+        return [r["tag_name"] for r in c.fetchall()]
+
+def print_delete_progress(start):
+    """
+    returns a progress function for delete_net which prints to stderr.
+    """
+    def progress(counts):
+        print("\r%d networks and %d tags deleted, %.0f networks/s" % (counts["networks"],
+            counts["tags"], counts["networks"] / max(time.monotonic() - start, 1e-9)),
+            end="", file=sys.stderr, flush=True)
+    return progress
+
+def print_progress(start):
+    """
+    returns a progress function for import_nets which prints to stderr.
+    """
+    def progress(done):
+        print("\r%d rows, %.0f rows/s" % (done, done / max(time.monotonic() - start, 1e-9)),
+                end="", file=sys.stderr, flush=True)
+    return progress
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="imports, exports and deletes minipam networks")
+    parser.add_argument("command", choices=["import", "export", "delete"])
+    parser.add_argument("file", help="a .csv or .jsonl file, - for stdin or stdout, "
+            "the network to delete for delete")
+    parser.add_argument("net", nargs="?", help="only export the networks within NET")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None)
+    parser.add_argument("--database", default=None)
+    parser.add_argument("--chunk-size", type=int, default=10000,
+            help="how many networks delete deletes in one transaction")
+    parser.add_argument("--dry-run", action="store_true",
+            help="only count the networks and tags delete would delete")
+    args = parser.parse_args()
+
+    if args.database is not None:
+        config.database_file = args.database
+    server.start_database_connection()
+    try:
+        if args.command == "delete":
+            start = time.monotonic()
+            if args.dry_run:
+                result = server.delete_net(args.file, True, True)
+            else:
+                result = server.delete_net(args.file, True, False, args.chunk_size,
+                        progress=print_delete_progress(start))
+            print("\n%s %d networks and %d tags in %.1fs" % (
+                "would delete" if args.dry_run else "deleted", result["networks"],
+                result["tags"], time.monotonic() - start), file=sys.stderr)
+        elif args.command == "import":
+            format = args.format or file_format(args.file)
+            # only close the file if it was opened here
+            with (contextlib.nullcontext(sys.stdin) if args.file == "-"
+                    else open(args.file, newline="")) as f:
+                start = time.monotonic()
+                result = server.import_nets(read_rows(f, format), progress=print_progress(start))
+            print("\nadded %d networks and %d tags in %.1fs" % (result["networks"],
+                result["tags"], time.monotonic() - start), file=sys.stderr)
+        else:
+            format = args.format or file_format(args.file)
+            with (contextlib.nullcontext(sys.stdout) if args.file == "-"
+                    else open(args.file, "w", newline="")) as f:
+                write_rows(f, export_rows(args.net), format,
+                        tag_names() if format == "csv" else ())
+    finally:
+        server.close_database_connection()
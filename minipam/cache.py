@@ -0,0 +1,111 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+
+from minipam.ip_utils import MAX_PREFIXLEN, prefix_address, prefix_broadcast
+
+class ResponseCache:
+    """
+    A bounded LRU cache for the results of read functions. Every entry
+    belongs to a prefix, given as (version, address, prefixlen) tuple, and
+    invalidate() drops the entries whose prefixes overlap a changed network.
+
+    A result which was computed while a network was changed might already be
+    outdated. To not store such results, get the generation before the
+    result is computed and pass it to put(), put() ignores the result if
+    something was invalidated in between.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        # the keys of the entries by prefix and the sorted list of these prefixes
+        self.keys_by_prefix = dict()
+        self.prefixes = list()
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get(self, key, default=None):
+        """
+        returns the cached value of the key or default if it is not cached.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, prefix, value, generation):
+        """
+        stores the value of the key unless the cache was invalidated since
+        generation.
+        """
+        with self.lock:
+            if generation != self.generation or self.size <= 0:
+                return
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (prefix, value)
+            keys = self.keys_by_prefix.get(prefix)
+            if keys is None:
+                keys = self.keys_by_prefix[prefix] = set()
+                insort(self.prefixes, prefix)
+            keys.add(key)
+            while len(self.entries) > self.size:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        prefix, value = self.entries.pop(key)
+        keys = self.keys_by_prefix[prefix]
+        keys.discard(key)
+        if not keys:
+            del self.keys_by_prefix[prefix]
+            del self.prefixes[bisect_left(self.prefixes, prefix)]
+
+    def invalidate(self, version, address, prefixlen):
+        """
+        drops all entries whose prefixes contain address/prefixlen or lie
+        within it.
+        """
+        max_prefixlen = MAX_PREFIXLEN[version]
+        with self.lock:
+            self.generation += 1
+            # the prefixes which contain the network
+            overlapping = [(version, prefix_address(address, p, max_prefixlen), p)
+                    for p in range(prefixlen)]
+            # and the ones within it, they are sorted behind it
+            start = bisect_left(self.prefixes, (version, address, prefixlen))
+            end = bisect_right(self.prefixes,
+                    (version, prefix_broadcast(address, prefixlen, max_prefixlen), max_prefixlen))
+            overlapping.extend(self.prefixes[start:end])
+            for prefix in overlapping:
+                for key in list(self.keys_by_prefix.get(prefix, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        """
+        drops all entries.
+        """
+        with self.lock:
+            self.generation += 1
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+            self.keys_by_prefix.clear()
+            self.prefixes.clear()
+
+    def stats(self):
+        """
+        returns the size and the hit, miss, eviction and invalidation counts.
+        """
+        with self.lock:
+            return {"size" : self.size,
+                    "entries" : len(self.entries),
+                    "hits" : self.hits,
+                    "misses" : self.misses,
+                    "evictions" : self.evictions,
+                    "invalidations" : self.invalidations}
@@ -1,14 +1,172 @@
 #!/usr/bin/env python3
 
-# this is a little demo for the xmlrpc capabilities of minipam
+import json
+import socket
+from collections.abc import Mapping
+from urllib.parse import urlsplit
+from xmlrpc.client import Fault
 
-from xmlrpc.client import ServerProxy
+class JSONClient:
+    """
+    A client for the JSON over HTTP front end of minipam.
+    It can be used like xmlrpc.client.ServerProxy, e.g. client.get_net("10.0.0.0/8"),
+    faults are raised as xmlrpc.client.Fault as well.
+    The connection is kept open between calls.
+    """
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = parts.path or "/"
+        self.sock = None
+        self.file = None
 
-server = ServerProxy("http://localhost:8000/")
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return lambda *params: self.call(name, *params)
 
-print(server.system.listMethods())
-server.add_net("192.168.0.0/16")
-server.add_net("192.168.0.0/17")
-server.add_net("192.168.0.0/18")
-server.add_net("192.168.0.0/19")
-print(server.get_net("192.168.0.0/14", 2))
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.sock is not None:
+            self.file.close()
+            self.sock.close()
+            self.sock = None
+            self.file = None
+
+    def _connect(self):
+        if self.sock is None:
+            self.sock = socket.create_connection((self.host, self.port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.file = self.sock.makefile("rb")
+
+    def _request(self, method, params):
+        body = json.dumps({"method" : method, "params" : list(params)},
+                separators=(",", ":")).encode("utf-8")
+        head = ("POST %s HTTP/1.1\r\n"
+                "Host: %s:%d\r\n"
+                "Content-Type: application/json\r\n"
+                "Content-Length: %d\r\n\r\n" % (self.path, self.host, self.port, len(body)))
+        return head.encode("latin-1") + body
+
+    def _read_response(self):
+        status = self.file.readline().split()
+        if len(status) < 2:
+            self.close()
+            raise ConnectionError("connection closed by the server")
+        length = 0
+        close = False
+        while True:
+            line = self.file.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+            elif name.strip().lower() == "connection" and value.strip().lower() == "close":
+                close = True
+        body = self.file.read(length)
+        if close:
+            self.close()
+        if int(status[1]) != 200 and not body:
+            raise Fault(0, "HTTP status %s" % status[1].decode("latin-1"))
+        response = json.loads(body)
+        if "error" in response:
+            raise Fault(response["error"]["faultCode"], response["error"]["faultString"])
+        return response["result"]
+
+    def call(self, method, *params):
+        """
+        calls the function method on the server and returns its result.
+        """
+        return self.pipeline([(method, params)])[0]
+
+    def pipeline(self, calls):
+        """
+        sends all calls at once and then reads the responses.
+        :param calls: a list of (method, params) tuples
+        :returns: a list with the results. If a call raised a fault, the
+        fault is raised after all responses are read.
+        """
+        self._connect()
+        self.sock.sendall(b"".join(self._request(m, p) for m, p in calls))
+        results = list()
+        fault = None
+        for i in range(len(calls)):
+            try:
+                results.append(self._read_response())
+            except Fault as f:
+                fault = fault or f
+                results.append(None)
+        if fault is not None:
+            raise fault
+        return results
+
+_net_dict_keys = ("address", "cidr", "netmask", "children", "network_in_database", "tags")
+
+class FlatNet(Mapping):
+    """
+    a net_dict of a get_net result in the flat format. It can be used like
+    the net_dict of the tree format, but its fields and its children are
+    only created when they are accessed.
+    """
+    def __init__(self, flat, position, children):
+        self.flat = flat
+        self.position = position
+        # the positions of the children of every network, shared by all nodes
+        self.children = children
+
+    def __getitem__(self, key):
+        flat, i = self.flat, self.position
+        if key == "cidr":
+            return flat["cidr"][i]
+        elif key == "address":
+            return flat["cidr"][i].split("/")[0]
+        elif key == "netmask":
+            return int(flat["cidr"][i].split("/")[1])
+        elif key == "network_in_database":
+            return flat["network_in_database"] if i == 0 else True
+        elif key == "tags":
+            return {k : v[i] for k, v in flat["tags"].items() if v[i] is not None}
+        elif key == "children":
+            if self.children is None:
+                self.children = [list() for c in flat["cidr"]]
+                for child, parent in enumerate(flat["parent"]):
+                    if parent >= 0:
+                        self.children[parent].append(child)
+            return [FlatNet(flat, c, self.children) for c in self.children[i]]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(_net_dict_keys)
+
+    def __len__(self):
+        return len(_net_dict_keys)
+
+    def __repr__(self):
+        return "FlatNet(%r)" % self.flat["cidr"][self.position]
+
+def flat_tree(flat):
+    """
+    returns the root of a get_net result in the flat format as FlatNet.
+    """
+    return FlatNet(flat, 0, None)
+
+if __name__ == "__main__":
+    # this is a little demo for the xmlrpc capabilities of minipam
+
+    from xmlrpc.client import ServerProxy
+
+    server = ServerProxy("http://localhost:8000/")
+
+    print(server.system.listMethods())
+    server.add_net("192.168.0.0/16")
+    server.add_net("192.168.0.0/17")
+    server.add_net("192.168.0.0/18")
+    server.add_net("192.168.0.0/19")
+    print(server.get_net("192.168.0.0/14", 2))
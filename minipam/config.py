@@ -6,3 +6,51 @@ database_file = "minipam.db"
 # the address and port the server is listening on
 xmlrpc_address = "localhost"
 xmlrpc_port = 8000
+
+# keep an in-memory prefix trie of all networks and their tags.
+# Reads are then answered from the trie instead of the database, at the cost
+# of loading every network on startup. If another process writes the
+# database, the trie is loaded again on the next read.
+trie_index = False
+
+# the number of results of get_net, get_tag, get_tags and get_usage which are
+# kept in an LRU cache, 0 disables the cache. Writes only drop the cached
+# results of networks which overlap the changed network, writes of other
+# processes clear the whole cache.
+response_cache_size = 0
+
+# compare the free space index with the networks on startup and rebuild it
+# if it does not match. This reads the whole database.
+check_free_blocks = True
+
+# how long the entries of the change log of changes_since are kept in seconds
+# and how many of the newest entries are kept, None keeps all. Older entries
+# are deleted after every 1000 changes and by compact_changes.
+change_retention = None
+change_retention_entries = None
+
+# group commit window in seconds. If it is larger than 0, writes are only
+# committed once the oldest uncommitted write is older than the window.
+# This saves an fsync per write but writes of the last window are lost if
+# the server crashes.
+group_commit = 0
+
+# the number of worker threads of the xmlrpc server. With 0 the server
+# handles one request after the other. With more workers the database is
+# switched to WAL mode, every worker reads with its own connection and all
+# writes are serialized over one connection. With group commit the workers
+# only see the writes once they are committed.
+xmlrpc_workers = 0
+
+# record the calls, latencies, faults and sqlite queries of every function
+# called over xmlrpc or json, get_metrics returns them. If metrics_port is not
+# None they are also served as text for prometheus on /metrics. Has to be set
+# before the database connection is started.
+metrics = False
+metrics_address = "localhost"
+metrics_port = None
+
+# the address and port of the JSON over HTTP front end, it is only started
+# if json_port is not None.
+json_address = "localhost"
+json_port = None
@@ -1,17 +1,22 @@
-from xmlrpc.server import Fault
-
 fault_strings = { 1000: "InvalidFaultCode",
         1001: "InvalidNetworkDescription",
         1002: "NoMatchingGapAvailable",
         1003: "NetworkNotInDatabase",
         1004: "TagExists",
-        1005: "TagDoesNotExist"}
+        1005: "TagDoesNotExist",
+        1006: "InvalidBatchOperation",
+        1007: "InvalidTagQuery",
+        1008: "InvalidFormat",
+        1009: "ChangesCompacted",
+        1010: "InvalidLimit"}
 
 #inverse mapping of the fault strings
 fault_codes = {v : k for k,v in fault_strings.items()}
 
 
 def raise_fault(fault):
+    # imported here, xmlrpc.client is slow to import and not needed until something fails
+    from xmlrpc.client import Fault
     if isinstance(fault,int):
         if fault in fault_strings:
             raise Fault(fault, fault_strings[fault])
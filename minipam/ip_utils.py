@@ -1,5 +1,271 @@
-def network_address_to_int(net):
-    return int(net.network_address)
+import socket
+from ipaddress import IPv6Network, ip_address, ip_network
 
-def network_broadcast_to_int(net):
-    return int(net.broadcast_address)
+# the number of bits of an address by ip version
+MAX_PREFIXLEN = {4 : 32, 6 : 128}
+
+class Prefix:
+    """
+    a network as integers, the counterpart of the ip_network objects of
+    ipaddress without their parsing and allocations. minipam.server uses
+    it for all networks, ipaddress is only a fallback for unusual input.
+    Prefixes order by version, address and prefixlen.
+    """
+    __slots__ = ("version", "address", "prefixlen", "_cidr")
+
+    def __init__(self, address, prefixlen, version=4):
+        self.version = version
+        self.address = address
+        self.prefixlen = prefixlen
+        self._cidr = None
+
+    @classmethod
+    def parse(cls, cidr):
+        """
+        parses a network like ip_network does.
+        :raises ValueError: raised if cidr is not a valid network
+        """
+        try:
+            version, address, prefixlen = parse_prefix(cidr)
+        except (ValueError, AttributeError):
+            # netmask notation, ip_network objects and the like
+            network = ip_network(cidr)
+            return cls(int(network.network_address), network.prefixlen, network.version)
+        return cls(address, prefixlen, version)
+
+    @property
+    def max_prefixlen(self):
+        return MAX_PREFIXLEN[self.version]
+
+    @property
+    def broadcast(self):
+        """
+        the last address of the prefix as integer.
+        """
+        return self.address + (1 << (MAX_PREFIXLEN[self.version] - self.prefixlen)) - 1
+
+    @property
+    def num_addresses(self):
+        return 1 << (MAX_PREFIXLEN[self.version] - self.prefixlen)
+
+    def address_bytes(self):
+        """
+        the first address encoded like address_to_bytes.
+        """
+        return self.address.to_bytes(MAX_PREFIXLEN[self.version] >> 3, "big")
+
+    def broadcast_bytes(self):
+        max_prefixlen = MAX_PREFIXLEN[self.version]
+        return (self.address + (1 << (max_prefixlen - self.prefixlen)) - 1).to_bytes(
+                max_prefixlen >> 3, "big")
+
+    def contains(self, other):
+        """
+        returns True if the prefix other lies within this prefix.
+        """
+        return (self.version == other.version and self.prefixlen <= other.prefixlen and
+                prefix_address(other.address, self.prefixlen, MAX_PREFIXLEN[self.version])
+                == self.address)
+
+    def overlaps(self, other):
+        return (self.version == other.version and self.address <= other.broadcast and
+                other.address <= self.broadcast)
+
+    def supernet(self, prefixlen=None):
+        """
+        returns the prefix with the given shorter prefixlen which contains
+        this one, by default the one which is one bit shorter.
+        """
+        if prefixlen is None:
+            prefixlen = self.prefixlen - 1
+        return Prefix(prefix_address(self.address, prefixlen, MAX_PREFIXLEN[self.version]),
+                prefixlen, self.version)
+
+    def _key(self):
+        return (self.version, self.address, self.prefixlen)
+
+    def __eq__(self, other):
+        return isinstance(other, Prefix) and self._key() == other._key()
+
+    def __lt__(self, other):
+        return self._key() < other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __str__(self):
+        if self._cidr is None:
+            self._cidr = format_prefix(self.address, self.prefixlen, self.version)
+        return self._cidr
+
+    def __repr__(self):
+        return "Prefix(%r)" % str(self)
+
+def address_to_bytes(address, version=4):
+    """
+    encodes an integer address as big endian bytes of the fixed width of
+    its ip version. Addresses of one version compare like the integers.
+    """
+    return address.to_bytes(MAX_PREFIXLEN[version] // 8, "big")
+
+def bytes_to_address(data):
+    """
+    decodes an address encoded by address_to_bytes.
+    """
+    return int.from_bytes(data, "big")
+
+def count_to_bytes(count):
+    """
+    encodes a non negative integer of any size as big endian bytes.
+    The number of addresses in an IPv6 network does not fit into 64 bits.
+    """
+    # an empty BLOB would be read back as None
+    return count.to_bytes(max(1, (count.bit_length() + 7) // 8), "big")
+
+def bytes_to_count(data):
+    """
+    decodes a number encoded by count_to_bytes.
+    """
+    return int.from_bytes(data, "big")
+
+def prefix_broadcast(address, prefixlen, max_prefixlen=32):
+    """
+    returns the broadcast address of the prefix address/prefixlen as integer.
+    """
+    return address + (1 << (max_prefixlen - prefixlen)) - 1
+
+def prefix_address(address, prefixlen, max_prefixlen=32):
+    """
+    returns the address with all bits after the first prefixlen bits cleared.
+    """
+    return address >> (max_prefixlen - prefixlen) << (max_prefixlen - prefixlen)
+
+def range_to_prefixes(start, end, max_prefixlen=32):
+    """
+    splits the address range from start to end (both included) into the
+    smallest possible list of prefixes.
+    :returns: a list of (address, prefixlen) tuples sorted by address
+    """
+    prefixes = list()
+    while start <= end:
+        # the largest block which starts at start and fits into the range
+        size = start & -start if start else 1 << max_prefixlen
+        while size > end - start + 1:
+            size >>= 1
+        prefixes.append((start, max_prefixlen - size.bit_length() + 1))
+        start += size
+    return prefixes
+
+def free_prefixes(start, end, children, max_prefixlen=32):
+    """
+    returns the smallest list of prefixes which covers all addresses from
+    start to end that are not covered by children.
+    :param children: (address, prefixlen) tuples sorted by address, none of
+    them may contain another one.
+    """
+    free = list()
+    for address, prefixlen in children:
+        if address > start:
+            free.extend(range_to_prefixes(start, address - 1, max_prefixlen))
+        start = prefix_broadcast(address, prefixlen, max_prefixlen) + 1
+    free.extend(range_to_prefixes(start, end, max_prefixlen))
+    return free
+
+def merge_ranges(ranges):
+    """
+    merges overlapping and adjacent address ranges.
+    :param ranges: (start, end) tuples sorted by start, both included
+    :returns: the merged (start, end) tuples sorted by start
+    """
+    merged = list()
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+def subtract_ranges(ranges, removed):
+    """
+    returns the parts of the address ranges which are not in removed.
+    :param ranges: merged (start, end) tuples sorted by start
+    :param removed: merged (start, end) tuples sorted by start
+    :returns: the remaining (start, end) tuples sorted by start
+    """
+    result = list()
+    i = 0
+    for start, end in ranges:
+        while i < len(removed) and removed[i][1] < start:
+            i += 1
+        j = i
+        while start <= end and j < len(removed) and removed[j][0] <= end:
+            if removed[j][0] > start:
+                result.append((start, removed[j][0] - 1))
+            start = max(start, removed[j][1] + 1)
+            j += 1
+        if start <= end:
+            result.append((start, end))
+    return result
+
+def parse_prefix(cidr):
+    """
+    parses a network in cidr notation like ip_network does, but without
+    creating an ip_network object.
+    :returns: a (version, address, prefixlen) tuple
+    :raises ValueError: raised if cidr is not a valid network or has host bits set
+    """
+    address, slash, prefixlen = cidr.partition("/")
+    try:
+        if ":" in address:
+            version = 6
+            address = int.from_bytes(socket.inet_pton(socket.AF_INET6, address), "big")
+        else:
+            version = 4
+            address = int.from_bytes(socket.inet_pton(socket.AF_INET, address), "big")
+    except OSError:
+        raise ValueError("%r is not a valid network" % cidr)
+    max_prefixlen = MAX_PREFIXLEN[version]
+    if not slash:
+        prefixlen = max_prefixlen
+    elif prefixlen.isascii() and prefixlen.isdigit() and int(prefixlen) <= max_prefixlen:
+        prefixlen = int(prefixlen)
+    else:
+        raise ValueError("%r is not a valid network" % cidr)
+    if address & ((1 << (max_prefixlen - prefixlen)) - 1):
+        raise ValueError("%r has host bits set" % cidr)
+    return version, address, prefixlen
+
+def format_prefix(address, prefixlen, version=4):
+    """
+    returns the prefix address/prefixlen in cidr notation like str() of
+    its ip_network object.
+    """
+    if version == 4:
+        return "%d.%d.%d.%d/%d" % (address >> 24, address >> 16 & 255, address >> 8 & 255,
+                address & 255, prefixlen)
+    return str(IPv6Network((address, prefixlen)))
+
+def next_aligned(address, prefixlen, max_prefixlen=32):
+    """
+    returns the first address at or after address where a prefix with the
+    netmask prefixlen can start.
+    """
+    size = 1 << (max_prefixlen - prefixlen)
+    return (address + size - 1) & -size
+
+def parse_address(ip):
+    """
+    parses an ip address like ip_address does.
+    :returns: a (version, address) tuple
+    :raises ValueError: raised if ip is not a valid address
+    """
+    try:
+        if "/" not in ip:
+            version, address, prefixlen = parse_prefix(ip)
+            return version, address
+    except (ValueError, TypeError, AttributeError):
+        pass
+    # integers, scoped IPv6 addresses and the like
+    address = ip_address(ip)
+    return address.version, int(address)
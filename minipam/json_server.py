@@ -0,0 +1,269 @@
+import asyncio
+import json
+import threading
+import traceback
+from xmlrpc.client import Fault
+
+
+from minipam import config
+from minipam import metrics
+from minipam import server
+from minipam.fault_handling import raise_fault
+from minipam.ip_utils import Prefix
+
+# A JSON over HTTP front end for the functions of minipam.server.
+#
+# A request is a POST with a body like {"method" : "get_net", "params" : ["10.0.0.0/8", 1]},
+# the response body is {"result" : ...} or on a fault
+# {"error" : {"faultCode" : 1001, "faultString" : "InvalidNetworkDescription"}}.
+# Connections are kept alive and pipelined requests are answered in order.
+#
+# Next to the functions of minipam.server the json server offers the long
+# poll watch(net, since_seq, timeout). The waiting calls are futures on the
+# event loop, so they need no thread while they wait.
+
+_reasons = {200 : "OK", 400 : "Bad Request", 404 : "Not Found",
+        405 : "Method Not Allowed", 500 : "Internal Server Error"}
+
+def _response(status, body, keep_alive):
+    """
+    returns the bytes of a http response with the given status and body.
+    """
+    head = ("HTTP/1.1 %d %s\r\n"
+            "Content-Type: application/json\r\n"
+            "Content-Length: %d\r\n"
+            "Connection: %s\r\n\r\n" % (status, _reasons[status], len(body),
+                "keep-alive" if keep_alive else "close"))
+    return head.encode("latin-1") + body
+
+def _encode(data):
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+async def _run(function, *args):
+    """
+    calls a function of minipam.server.
+    """
+    if config.xmlrpc_workers > 0:
+        # the workers read with their own connections, so calls can run in parallel
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: function(*args))
+    return function(*args)
+
+class _Watchers:
+    """
+    the watch calls waiting on one event loop. After every commit of
+    minipam.server the new changes are read once and the calls whose
+    networks overlap a changed network are woken.
+    """
+    def __init__(self, loop):
+        self.loop = loop
+        # the futures of the waiting calls with the Prefix they watch
+        self.waiting = list()
+        self.seq = server.changes_since(None)["seq"]
+        self.scheduled = False
+        self.lock = asyncio.Lock()
+        server.add_change_listener(self.committed)
+
+    def committed(self):
+        # called in the thread which committed
+        if self.scheduled:
+            return
+        self.scheduled = True
+        try:
+            self.loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self.wake()))
+        except RuntimeError:
+            # the loop is closed
+            server.remove_change_listener(self.committed)
+
+    async def wake(self):
+        self.scheduled = False
+        # with workers the reads run in parallel, one wake at a time keeps
+        # self.seq at the end of the changes which were delivered
+        async with self.lock:
+            try:
+                page = await _run(server.changes_since, self.seq, 10000)
+            except Fault:
+                # the changes were compacted in between, let every call check itself
+                page = {"changes" : [], "seq" : None, "more" : True}
+            if not self.waiting:
+                changed = []
+            elif page["more"]:
+                changed = None
+            else:
+                changed = [Prefix.parse(change["net"]) for change in page["changes"]]
+            self.seq = page["seq"]
+            if self.seq is None:
+                self.seq = (await _run(server.changes_since, None))["seq"]
+
+            waiting = list()
+            for network, future in self.waiting:
+                if future.done():
+                    continue
+                if changed is None or any(network.overlaps(n) for n in changed):
+                    future.set_result(None)
+                else:
+                    waiting.append((network, future))
+            self.waiting = waiting
+
+    def wait(self, network):
+        """
+        :returns: a future which is done after the next commit which changed
+        a network overlapping network.
+        """
+        future = self.loop.create_future()
+        self.waiting.append((network, future))
+        return future
+
+    def discard(self, future):
+        """
+        stops waiting for a future of wait, after the call returned or
+        was cancelled.
+        """
+        future.cancel()
+        self.waiting = [w for w in self.waiting if w[1] is not future]
+
+# the _Watchers by event loop
+_watchers = dict()
+
+async def watch(net, since_seq=None, timeout=30):
+    """
+    waits until a change of a network which overlaps net is committed.
+    Changes made by other processes are only seen when the timeout is over.
+    :param net: the network in cidr notation
+    :param since_seq: the sequence number of the last change the consumer
+    has seen, None to wait for the next change.
+    :param timeout: the maximal time to wait in seconds
+    :returns: the changes after since_seq like minipam.server.changes_within,
+    the changes are empty if the timeout is over.
+    """
+    try:
+        network = Prefix.parse(net)
+    except ValueError:
+        raise_fault("InvalidNetworkDescription")
+    loop = asyncio.get_running_loop()
+    watchers = _watchers.get(loop)
+    if watchers is None:
+        watchers = _watchers[loop] = _Watchers(loop)
+    if since_seq is None:
+        since_seq = (await _run(server.changes_since, None))["seq"]
+    deadline = loop.time() + timeout
+    while True:
+        # wait before reading, so no commit is missed in between
+        woken = watchers.wait(network)
+        try:
+            result = await _run(server.changes_within, net, since_seq)
+            remaining = deadline - loop.time()
+            if result["changes"] or remaining <= 0:
+                return result
+            since_seq = result["seq"]
+            try:
+                await asyncio.wait_for(woken, remaining)
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            watchers.discard(woken)
+
+# the functions which are only offered by the json server
+async_functions = {"watch" : watch}
+
+async def call(method, params):
+    """
+    calls the function of minipam.server with the name method.
+    :returns: the http status and the response body
+    """
+    function = async_functions.get(method) or server.rpc_functions.get(method)
+    if function is None:
+        return 404, _encode({"error" : {"faultCode" : 0,
+            "faultString" : "unknown method %s" % method}})
+    if not isinstance(params, list):
+        return 400, _encode({"error" : {"faultCode" : 0, "faultString" : "params must be a list"}})
+    try:
+        if method in async_functions:
+            result = await function(*params)
+        else:
+            result = await _run(metrics.instrument(method, function), *params)
+    except Fault as f:
+        return 200, _encode({"error" : {"faultCode" : f.faultCode, "faultString" : f.faultString}})
+    except TypeError as e:
+        return 400, _encode({"error" : {"faultCode" : 0, "faultString" : str(e)}})
+    except Exception as e:
+        # like the xmlrpc server, answer with the error instead of dropping
+        # the connection, and keep the traceback in the log
+        traceback.print_exc()
+        return 500, _encode({"error" : {"faultCode" : 1,
+            "faultString" : "%s:%s" % (type(e).__name__, e)}})
+    return 200, _encode({"result" : result})
+
+async def handle_connection(reader, writer):
+    """
+    answers the requests of one connection until the client closes it.
+    """
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            try:
+                method, path, version = request_line.decode("latin-1").split()
+            except ValueError:
+                writer.write(_response(400, b"", False))
+                break
+
+            headers = dict()
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            connection = headers.get("connection", "").lower()
+            if version == "HTTP/1.0":
+                keep_alive = connection == "keep-alive"
+            else:
+                keep_alive = connection != "close"
+
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+            if method != "POST":
+                status, response = 405, b""
+            else:
+                try:
+                    request = json.loads(body)
+                    status, response = await call(request["method"], request.get("params", list()))
+                except (ValueError, KeyError, TypeError):
+                    status, response = 400, b""
+            writer.write(_response(status, response, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def start_json_server(address=None, port=None):
+    """
+    starts the json server on the running event loop.
+    :returns: the asyncio.Server
+    """
+    return await asyncio.start_server(handle_connection,
+            address or config.json_address,
+            config.json_port if port is None else port)
+
+def serve_json_forever():
+    """
+    runs the json server in this thread until the process ends.
+    """
+    async def serve():
+        json_server = await start_json_server()
+        async with json_server:
+            await json_server.serve_forever()
+    asyncio.run(serve())
+
+def start_json_server_thread():
+    """
+    runs the json server in a daemon thread next to the xmlrpc server.
+    """
+    thread = threading.Thread(target=serve_json_forever, daemon=True)
+    thread.start()
+    return thread
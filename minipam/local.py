@@ -0,0 +1,65 @@
+from minipam import config
+
+# Library mode: calls the functions of minipam.server directly on the sqlite
+# file, without a running server.
+#
+#     with LocalClient("minipam.db", read_only=True) as pam:
+#         pam.get_net("10.0.0.0/8", 1)
+#
+# A LocalClient is used like a xmlrpc.client.ServerProxy, so scripts and
+# cliclient can work with both. minipam.server keeps one connection per
+# process, so only one LocalClient can be open at a time.
+
+class LocalClient:
+    def __init__(self, database=None, read_only=False):
+        """
+        :param database: the sqlite file, config.database_file if None
+        :param read_only: open the database read only, all writes fail. The
+        schema of the database has to be up to date.
+        """
+        self.database = database
+        self.read_only = read_only
+        self._server = None
+
+    def _open(self):
+        # the server module is only imported on the first call, so creating
+        # a client and parsing arguments stays cheap
+        from minipam import server
+        if self.database is not None:
+            config.database_file = self.database
+        # the free space index is checked by the long running servers
+        try:
+            server.start_database_connection(read_only=self.read_only, check=False)
+        except Exception:
+            if server.db_conn is not None:
+                server.close_database_connection()
+            raise
+        self._server = server
+        return server
+
+    def call(self, method, *args):
+        """
+        calls the function of minipam.server with the name method.
+        """
+        server = self._server or self._open()
+        function = server.rpc_functions.get(method)
+        if function is None:
+            from xmlrpc.client import Fault
+            raise Fault(0, "unknown method %r" % method)
+        return function(*args)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return lambda *args: self.call(name, *args)
+
+    def close(self):
+        if self._server is not None:
+            self._server.close_database_connection()
+            self._server = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
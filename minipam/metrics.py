@@ -0,0 +1,265 @@
+import functools
+import sqlite3
+import threading
+import time
+
+from minipam import config
+
+# Call counts, latencies, faults and the sqlite queries of the functions
+# called over xmlrpc or json, see config.metrics.
+#
+# The servers wrap every function with instrument(). The connections of
+# minipam.server are created with connection_factory(), their cursors count
+# the queries and the fetched rows of the call running in the same thread.
+# If config.metrics is off, instrument() returns the functions unchanged
+# and the connections are plain sqlite3 connections.
+
+# the upper bounds of the latency histogram buckets in seconds
+buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+        1.0, 2.5, 5.0, 10.0)
+
+class MethodMetrics:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        # the number of faults by fault code
+        self.faults = dict()
+        # the number of calls by bucket, the last bucket is +Inf
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.seconds = 0.0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.rows = 0
+
+_methods = dict()
+_lock = threading.Lock()
+# the [queries, query_seconds, rows] of the call running in a thread
+_call = threading.local()
+_wrappers = dict()
+
+def instrument(name, function):
+    """
+    returns function wrapped so that its calls are recorded as name, or
+    function itself if config.metrics is off.
+    """
+    if not config.metrics:
+        return function
+    wrapper = _wrappers.get(name)
+    if wrapper is None or wrapper.__wrapped__ is not function:
+        wrapper = _wrappers[name] = _wrap(name, function)
+    return wrapper
+
+def _wrap(name, function):
+    from xmlrpc.client import Fault
+
+    @functools.wraps(function)
+    def instrumented(*args, **kwargs):
+        outer = getattr(_call, "stats", None)
+        stats = _call.stats = [0, 0.0, 0]
+        fault = None
+        error = False
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except Fault as f:
+            fault = f.faultCode
+            raise
+        except Exception:
+            error = True
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            _call.stats = outer
+            _record(name, seconds, stats, fault, error)
+    return instrumented
+
+def _record(name, seconds, stats, fault, error):
+    with _lock:
+        m = _methods.get(name)
+        if m is None:
+            m = _methods[name] = MethodMetrics()
+        m.calls += 1
+        m.seconds += seconds
+        for i, bound in enumerate(buckets):
+            if seconds <= bound:
+                break
+        else:
+            i = len(buckets)
+        m.bucket_counts[i] += 1
+        if fault is not None:
+            m.faults[fault] = m.faults.get(fault, 0) + 1
+        m.errors += error
+        m.queries += stats[0]
+        m.query_seconds += stats[1]
+        m.rows += stats[2]
+
+def _count(seconds, queries=0, rows=0):
+    stats = getattr(_call, "stats", None)
+    if stats is not None:
+        stats[0] += queries
+        stats[1] += seconds
+        stats[2] += rows
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    a cursor which counts the queries, the time spent in sqlite and the
+    fetched rows of the current call.
+    """
+    def execute(self, *args):
+        start = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            _count(time.perf_counter() - start, queries=1)
+
+    def executemany(self, *args):
+        start = time.perf_counter()
+        try:
+            return super().executemany(*args)
+        finally:
+            _count(time.perf_counter() - start, queries=1)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        _count(time.perf_counter() - start, rows=row is not None)
+        return row
+
+    def fetchmany(self, *args):
+        start = time.perf_counter()
+        rows = super().fetchmany(*args)
+        _count(time.perf_counter() - start, rows=len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        _count(time.perf_counter() - start, rows=len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        row = super().__next__()
+        _count(time.perf_counter() - start, rows=1)
+        return row
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+def connection_factory():
+    """
+    returns the class of new sqlite connections.
+    """
+    return InstrumentedConnection if config.metrics else sqlite3.Connection
+
+def snapshot():
+    """
+    returns the metrics of every called function by name. The buckets are
+    cumulative like in prometheus, their keys are the upper bounds.
+    """
+    with _lock:
+        result = dict()
+        for name, m in _methods.items():
+            cumulative = 0
+            counts = dict()
+            for bound, count in zip([str(b) for b in buckets] + ["+Inf"], m.bucket_counts):
+                cumulative += count
+                counts[bound] = cumulative
+            result[name] = {"calls" : m.calls,
+                    "errors" : m.errors,
+                    "faults" : {str(code) : n for code, n in m.faults.items()},
+                    "seconds" : m.seconds,
+                    "buckets" : counts,
+                    "queries" : m.queries,
+                    "query_seconds" : m.query_seconds,
+                    "rows" : m.rows}
+        return result
+
+def reset():
+    """
+    forgets all recorded calls.
+    """
+    with _lock:
+        _methods.clear()
+
+def render(metrics):
+    """
+    returns the metrics as returned by minipam.server.get_metrics in the
+    prometheus text format.
+    """
+    lines = list()
+    def family(name, kind, help, samples):
+        lines.append("# HELP %s %s" % (name, help))
+        lines.append("# TYPE %s %s" % (name, kind))
+        for labels, value in samples:
+            label_text = ",".join('%s="%s"' % l for l in labels)
+            lines.append("%s%s %s" % (name, "{%s}" % label_text if label_text else "", value))
+
+    methods = sorted(metrics["methods"].items())
+    family("minipam_rpc_calls_total", "counter", "calls by method",
+            [([("method", n)], m["calls"]) for n, m in methods])
+    family("minipam_rpc_errors_total", "counter", "calls which raised an exception but no fault",
+            [([("method", n)], m["errors"]) for n, m in methods])
+    family("minipam_rpc_faults_total", "counter", "faults by method and fault code",
+            [([("method", n), ("code", code)], count) for n, m in methods
+                for code, count in sorted(m["faults"].items())])
+    lines.append("# HELP minipam_rpc_duration_seconds call latency by method")
+    lines.append("# TYPE minipam_rpc_duration_seconds histogram")
+    for n, m in methods:
+        for bound, count in m["buckets"].items():
+            lines.append('minipam_rpc_duration_seconds_bucket{method="%s",le="%s"} %d'
+                    % (n, bound, count))
+        lines.append('minipam_rpc_duration_seconds_sum{method="%s"} %r' % (n, m["seconds"]))
+        lines.append('minipam_rpc_duration_seconds_count{method="%s"} %d' % (n, m["calls"]))
+    family("minipam_sqlite_queries_total", "counter", "sqlite statements by method",
+            [([("method", n)], m["queries"]) for n, m in methods])
+    family("minipam_sqlite_seconds_total", "counter", "time spent in sqlite by method",
+            [([("method", n)], repr(m["query_seconds"])) for n, m in methods])
+    family("minipam_sqlite_rows_total", "counter", "rows fetched from sqlite by method",
+            [([("method", n)], m["rows"]) for n, m in methods])
+
+    cache = metrics["cache"]
+    family("minipam_response_cache_size", "gauge", "the maximal number of cached results",
+            [([], cache["size"])])
+    family("minipam_response_cache_entries", "gauge", "the number of cached results",
+            [([], cache["entries"])])
+    for counter in ["hits", "misses", "evictions", "invalidations"]:
+        family("minipam_response_cache_%s_total" % counter, "counter",
+                "response cache %s" % counter, [([], cache[counter])])
+    return "\n".join(lines) + "\n"
+
+def start_metrics_server_thread(collect, address=None, port=None):
+    """
+    serves the metrics returned by collect as text on /metrics in a daemon
+    thread.
+    :returns: the http server
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.partition("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render(collect()).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((address or config.metrics_address,
+        config.metrics_port if port is None else port), MetricsHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
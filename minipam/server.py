@@ -1,30 +1,65 @@
+import functools
+import heapq
 import sqlite3
-import sys
-from xmlrpc.server import SimpleXMLRPCServer
-from ipaddress import ip_network, ip_address
+import threading
+import time
+from bisect import insort
+from contextlib import contextmanager
+from itertools import islice
+from urllib.parse import quote
 
 #from minipam import config
 from minipam import config
 from minipam.fault_handling import raise_fault
 from minipam.ip_utils import *
+from minipam import metrics
+from minipam import tag_query
+from minipam.cache import ResponseCache
+from minipam.trie import PrefixTrie
 
 db_conn = None;
 
-def start_database_connection():
-    global db_conn
-    """
-    Sets up the database connection and makes sure that the required tables exist.
-    """
-    if db_conn is None:
-        db_conn = sqlite3.connect(config.database_file)
-        db_conn.row_factory = sqlite3.Row
+# the in-memory prefix tries of all networks by ip version, only used if
+# config.trie_index is set. The values are dicts with the id, net, address,
+# netmask and tags of a network.
+_tries = None
 
-    c = db_conn.cursor()
+# the address columns are declared as ADDRESS and hold the addresses as
+# big endian bytes, see address_to_bytes. They are read back as integers.
+sqlite3.register_converter("ADDRESS", bytes_to_address)
+# the same for the address counts in COUNTER columns, see count_to_bytes
+sqlite3.register_converter("COUNTER", bytes_to_count)
 
-    # enable foreign key support in sqlite
-    c.execute("PRAGMA foreign_keys = ON");
+# the cache of the read functions, only used if config.response_cache_size is set
+_cache = None
+# the networks changed since the last real commit, see _cache_invalidate
+_uncommitted_changes = list()
+# PRAGMA data_version of db_conn when the tries and the cache were last
+# checked, it changes when another connection commits to the database file
+_data_version = None
+
+# all writes go through db_conn while holding this lock
+_write_lock = threading.RLock()
+# the read only connections of the xmlrpc workers by thread id
+_readers = dict()
+_readers_lock = threading.Lock()
+# per thread state, the nesting depth of the open transaction() blocks
+_local = threading.local()
+# functions which are called once the open transaction is committed
+_after_commit = list()
+# when the oldest change which is not committed yet because of group commit was made
+_pending_since = None
+# functions which are called after every commit, see add_change_listener
+_change_listeners = list()
+# the number of changes logged since the change log was last compacted
+_changes_since_compaction = 0
+# the change log is compacted after this many changes
+_compact_interval = 1000
 
-    # set up the tables if they do not exist yet
+def _create_tables(c):
+    """
+    schema version 1: the networks and tags tables.
+    """
     c.execute("CREATE TABLE IF NOT EXISTS networks"
             "(id INTEGER PRIMARY KEY AUTOINCREMENT,"
             "net TEXT UNIQUE," # the net field is redundant to the address and netmask fields,
@@ -43,20 +78,648 @@ def start_database_connection():
             "ON DELETE CASCADE"
             ")")
 
+def _create_indexes(c):
+    """
+    schema version 2: covering indexes for the range queries on networks
+    and for the tag name lookups.
+    """
+    c.execute("CREATE INDEX IF NOT EXISTS networks_address_netmask "
+            "ON networks(address, netmask, net)")
+    c.execute("CREATE INDEX IF NOT EXISTS tags_name_network_value "
+            "ON tags(tag_name, network_id, tag_value)")
+
+def _create_free_blocks(c):
+    """
+    schema version 3: the free space index.
+    Every network owns the maximal free blocks which are not used by its
+    children, so claim_net can pick the best fitting block with an index
+    lookup. The table is filled by the consistency check on startup.
+    """
+    c.execute("CREATE TABLE IF NOT EXISTS free_blocks"
+            "(parent_id INTEGER NOT NULL,"
+            "address INTEGER NOT NULL,"
+            "netmask INTEGER NOT NULL,"
+            "PRIMARY KEY (parent_id, address)"
+            "FOREIGN KEY (parent_id) REFERENCES networks(id)"
+            "ON UPDATE CASCADE "
+            "ON DELETE CASCADE"
+            ") WITHOUT ROWID")
+    c.execute("CREATE INDEX IF NOT EXISTS free_blocks_parent_netmask "
+            "ON free_blocks(parent_id, netmask, address)")
+
+def _add_address_family(c):
+    """
+    schema version 4: IPv6 support.
+    INTEGER columns only hold 64 bits, so the addresses are stored as
+    fixed width big endian BLOBs (4 bytes for IPv4, 16 bytes for IPv6),
+    which compare like the integers as long as both have the same width.
+    The new family column (4 or 6) keeps the range scans of the two
+    versions apart. SQLite can not change the type of a column, so both
+    tables with addresses are rebuilt.
+    """
+    c.execute("CREATE TABLE networks_new"
+            "(id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            "net TEXT UNIQUE,"
+            "family INTEGER NOT NULL,"
+            "address ADDRESS NOT NULL,"
+            "netmask INTEGER NOT NULL)")
+    c.execute("SELECT id, net FROM networks")
+    rows = list()
+    for r in c.fetchall():
+        network = Prefix.parse(r["net"])
+        rows.append((r["id"], r["net"], network.version,
+            network.address_bytes(), network.prefixlen))
+    c.executemany("INSERT INTO networks_new (id, net, family, address, netmask) "
+            "VALUES (?,?,?,?,?)", rows)
+    # keep the ids of deleted networks from being used again
+    c.execute("SELECT seq FROM sqlite_sequence WHERE name = 'networks'")
+    seq = c.fetchone()
+    c.execute("DROP TABLE networks")
+    c.execute("ALTER TABLE networks_new RENAME TO networks")
+    if seq is not None:
+        c.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'networks'", (seq[0],))
+    c.execute("CREATE INDEX networks_family_address_netmask "
+            "ON networks(family, address, netmask, net)")
+
+    c.execute("DROP TABLE free_blocks")
+    c.execute("CREATE TABLE free_blocks"
+            "(parent_id INTEGER NOT NULL,"
+            "address ADDRESS NOT NULL,"
+            "netmask INTEGER NOT NULL,"
+            "PRIMARY KEY (parent_id, address)"
+            "FOREIGN KEY (parent_id) REFERENCES networks(id)"
+            "ON UPDATE CASCADE "
+            "ON DELETE CASCADE"
+            ") WITHOUT ROWID")
+    c.execute("CREATE INDEX free_blocks_parent_netmask "
+            "ON free_blocks(parent_id, netmask, address)")
+    _rebuild_free_blocks(c, _expected_free_space(c)[0])
+
+def _create_tag_value_index(c):
+    """
+    schema version 5: the inverted index of the tag queries.
+    For every tag name and value it holds the sorted ids of the networks
+    with that tag, the posting list of name=value.
+    """
+    c.execute("CREATE INDEX IF NOT EXISTS tags_name_value_network "
+            "ON tags(tag_name, tag_value, network_id)")
+
+def _create_usage(c):
+    """
+    schema version 6: the usage counters of get_usage.
+    For every network they hold the number of its direct children and the
+    number of addresses these use. They are updated together with the free
+    blocks.
+    """
+    c.execute("CREATE TABLE IF NOT EXISTS usage"
+            "(network_id INTEGER PRIMARY KEY,"
+            "children INTEGER NOT NULL,"
+            "used COUNTER NOT NULL,"
+            "FOREIGN KEY (network_id) REFERENCES networks(id)"
+            "ON UPDATE CASCADE "
+            "ON DELETE CASCADE"
+            ")")
+    _insert_usage(c, _expected_free_space(c)[1])
+
+def _create_changes(c):
+    """
+    schema version 7: the change log of changes_since.
+    Every change of a network or tag is appended with a sequence number in
+    the transaction of the change. AUTOINCREMENT keeps the numbers of
+    compacted entries from being used again.
+    """
+    c.execute("CREATE TABLE IF NOT EXISTS changes"
+            "(seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            "time REAL NOT NULL,"
+            "operation TEXT NOT NULL,"
+            "net TEXT NOT NULL,"
+            "tag_name TEXT,"
+            "tag_value TEXT)")
+
+def _create_change_time_index(c):
+    """
+    schema version 8: the index of the change log by time, for
+    config.change_retention.
+    """
+    c.execute("CREATE INDEX IF NOT EXISTS changes_time ON changes(time)")
+
+# the migrations which bring the database schema from one version to the next.
+# The schema version of a database is stored in its user_version and the
+# database is at version n after schema_migrations[n-1] was applied.
+# Databases created before the schema was versioned have the version 0.
+schema_migrations = [
+        _create_tables,
+        _create_indexes,
+        _create_free_blocks,
+        _add_address_family,
+        _create_tag_value_index,
+        _create_usage,
+        _create_changes,
+        _create_change_time_index,
+        ]
+
+def start_database_connection(read_only=False, check=True):
+    global db_conn
+    """
+    Sets up the database connection and makes sure that the schema is up to date.
+    :param read_only: open the database read only, writes then raise
+    sqlite3.OperationalError. The schema has to be up to date already.
+    :param check: check the free space index if config.check_free_blocks
+    is set. This reads the whole database, short lived processes can skip it.
+    """
+    if db_conn is None:
+        # the connection is shared by all threads, they use it while holding _write_lock
+        if read_only:
+            db_conn = sqlite3.connect("file:%s?mode=ro" % quote(config.database_file), uri=True,
+                    check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES,
+                    factory=metrics.connection_factory())
+        else:
+            db_conn = sqlite3.connect(config.database_file, check_same_thread=False,
+                    detect_types=sqlite3.PARSE_DECLTYPES, factory=metrics.connection_factory())
+        db_conn.row_factory = sqlite3.Row
+
+    c = db_conn.cursor()
+
+    # with WAL the readers of the workers do not block the writer and the other way round
+    if config.xmlrpc_workers > 0 and not read_only:
+        c.execute("PRAGMA journal_mode = WAL")
+
+    # the schema version is stored in the database, so once it is up to date
+    # a start only reads it and does not run any DDL or commit
+    c.execute("PRAGMA user_version")
+    version = c.fetchone()[0]
+    if version < len(schema_migrations):
+        if read_only:
+            raise sqlite3.OperationalError("the schema of %s is out of date, it has to be "
+                    "opened for writing once" % config.database_file)
+        _migrate(c, version)
+
+    # enable foreign key support in sqlite
+    c.execute("PRAGMA foreign_keys = ON");
+
+    if config.check_free_blocks and check and not read_only:
+        _check_free_blocks(c)
 
-    # save possible changes
+    if config.trie_index:
+        _load_trie(c)
+
+    global _cache, _data_version
+    if config.response_cache_size > 0:
+        _cache = ResponseCache(config.response_cache_size)
+    c.execute("PRAGMA data_version")
+    _data_version = c.fetchone()[0]
+
+def _migrate(c, version):
+    """
+    applies all migrations the database has not seen yet.
+    :param version: the current schema version of the database
+    """
+    # the migrations rebuild tables which are referenced by foreign keys
+    c.execute("PRAGMA foreign_keys = OFF")
+    for version, migration in enumerate(schema_migrations[version:], version + 1):
+        migration(c)
+        c.execute("PRAGMA user_version = %d" % version)
     db_conn.commit()
 
+def _load_trie(c):
+    """
+    loads all networks and their tags into the prefix tries.
+    """
+    global _tries
+    _tries = {v : PrefixTrie(p) for v, p in MAX_PREFIXLEN.items()}
+    records = dict()
+    c.execute("SELECT id, net, family, address, netmask FROM networks")
+    for r in c.fetchall():
+        records[r["id"]] = _trie_record(r["id"], r["net"], r["address"], r["netmask"], r["family"])
+    c.execute("SELECT network_id, tag_name, tag_value FROM tags")
+    for r in c.fetchall():
+        records[r["network_id"]]["tags"][r["tag_name"]] = r["tag_value"]
+
+def _trie_record(id, net, address, netmask, version=4):
+    """
+    creates the trie entry for a network and inserts it into the trie of its
+    ip version.
+    """
+    record = {"id" : id,
+            "net" : net,
+            "address" : address,
+            "netmask" : netmask,
+            "tags" : dict()}
+    _tries[version].insert(address, netmask, record)
+    return record
+
+def _read_trie(version=4):
+    """
+    returns the trie of the ip version if reads can be answered from it.
+    Inside of a transaction the trie does not know the uncommitted changes yet.
+    """
+    if _tries is None or _transaction_depth() > 0:
+        return None
+    _check_data_version()
+    return _tries[version]
+
+def _check_data_version():
+    """
+    loads the tries again and clears the response cache if another
+    connection, like a LocalClient, minipam.bulk or another server, committed
+    to the database since the last check. The check is skipped while another
+    thread holds the write lock, the next read repeats it.
+    """
+    global _data_version
+    if not _write_lock.acquire(blocking=False):
+        return
+    try:
+        c = db_conn.cursor()
+        c.execute("PRAGMA data_version")
+        version = c.fetchone()[0]
+        if version == _data_version:
+            return
+        _data_version = version
+        if _tries is not None:
+            _load_trie(c)
+        if _cache is not None:
+            _cache.clear()
+    finally:
+        _write_lock.release()
+
+def _transaction_depth():
+    """
+    returns the nesting depth of the transaction() blocks of this thread.
+    """
+    return getattr(_local, "depth", 0)
+
+def _reader_connection():
+    """
+    returns the read only connection of this thread and opens it if needed.
+    """
+    ident = threading.get_ident()
+    with _readers_lock:
+        conn = _readers.get(ident)
+        if conn is None:
+            conn = sqlite3.connect(config.database_file, check_same_thread=False,
+                    detect_types=sqlite3.PARSE_DECLTYPES, factory=metrics.connection_factory())
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA query_only = ON")
+            _readers[ident] = conn
+    return conn
+
+@contextmanager
+def reading():
+    """
+    returns a cursor for read only queries.
+    Inside of a transaction it belongs to the connection of the transaction
+    so that the uncommitted changes are visible. If the xmlrpc server has
+    workers, every worker reads with its own connection. Otherwise the reads
+    are serialized with the writes.
+    """
+    if config.xmlrpc_workers > 0 and _transaction_depth() == 0:
+        yield _reader_connection().cursor()
+    else:
+        with _write_lock:
+            yield db_conn.cursor()
+
+def _trie_add(id, net, address, netmask, tags=None, version=4):
+    """
+    adds a network to the trie once the transaction is committed.
+    """
+    if _tries is not None:
+        _after_commit.append(lambda: _trie_record(id, net, address, netmask, version)["tags"].update(tags or dict()))
+
+def _trie_remove(address, netmask, recursive=False, version=4):
+    """
+    removes a network or with recursive all networks within it from the
+    trie once the transaction is committed.
+    """
+    def remove():
+        trie = _tries[version]
+        if recursive:
+            for a, p, r in list(trie.subtree(address, netmask)):
+                trie.remove(a, p)
+        else:
+            trie.remove(address, netmask)
+    if _tries is not None:
+        _after_commit.append(remove)
+
+def _trie_set_tag(address, netmask, tag_name, tag_value, delete=False, version=4):
+    """
+    sets or with delete deletes a tag in the trie once the transaction is committed.
+    """
+    def set_tag():
+        record = _tries[version].get(address, netmask)
+        if record is None:
+            return
+        if delete:
+            record["tags"].pop(tag_name, None)
+        else:
+            record["tags"][tag_name] = tag_value
+    if _tries is not None:
+        _after_commit.append(set_tag)
+
+def _cache_invalidate(version=None, address=0, prefixlen=0):
+    """
+    drops the cached results of all networks which overlap a changed
+    network once the transaction is committed, without version all cached
+    results.
+    """
+    def invalidate():
+        if version is None:
+            _cache.clear()
+        else:
+            _cache.invalidate(version, address, prefixlen)
+        if config.group_commit > 0 and config.xmlrpc_workers > 0:
+            # the workers only see the change once it is really committed
+            # and might cache the old state again until then
+            _uncommitted_changes.append((version, address, prefixlen))
+    if _cache is not None:
+        _after_commit.append(invalidate)
+
+def _committed():
+    """
+    is called after db_conn was really committed.
+    """
+    while _uncommitted_changes:
+        version, address, prefixlen = _uncommitted_changes.pop()
+        if _cache is None:
+            continue
+        if version is None:
+            _cache.clear()
+        else:
+            _cache.invalidate(version, address, prefixlen)
+    for listener in list(_change_listeners):
+        listener()
+
+def add_change_listener(listener):
+    """
+    calls listener without arguments after every commit, in the thread which
+    committed. The changes are visible to all connections then and
+    changes_since tells what changed. Listeners must not block.
+    """
+    _change_listeners.append(listener)
+
+def remove_change_listener(listener):
+    _change_listeners.remove(listener)
+
+_missing = object()
+
+def _cached(function):
+    """
+    caches the results of a read function whose first parameter is a
+    network. The cached results are shared by all callers and must not be
+    changed. Inside of a transaction the cache is not used.
+    """
+    signature = None
+
+    @functools.wraps(function)
+    def cached(*args, **kwargs):
+        nonlocal signature
+        cache = _cache
+        if cache is None or _transaction_depth() > 0:
+            return function(*args, **kwargs)
+        _check_data_version()
+        if signature is None:
+            # inspect is slow to import and only needed with the cache
+            import inspect
+            signature = inspect.signature(function)
+        try:
+            arguments = signature.bind(*args, **kwargs)
+            arguments.apply_defaults()
+            values = list(arguments.arguments.values())
+            network = Prefix.parse(values[0])
+            key = (function.__name__, str(network)) + tuple(values[1:])
+            hash(key)
+        except (TypeError, ValueError):
+            # let the function raise the fault
+            return function(*args, **kwargs)
+
+        result = cache.get(key, _missing)
+        if result is _missing:
+            generation = cache.generation
+            result = function(*args, **kwargs)
+            cache.put(key, (network.version, network.address, network.prefixlen),
+                    result, generation)
+        return result
+    return cached
+
+@contextmanager
+def transaction(immediate=False):
+    """
+    groups all changes made within the block into one transaction.
+    Blocks can be nested, the outermost block commits when it is left.
+    If an exception leaves a block all changes since the outermost block
+    was entered are rolled back.
+    :param immediate: take the write lock of the database when the outermost
+    block is entered instead of at the first change, so no other process
+    can change what the block reads.
+    :returns: a cursor of the database connection
+    """
+    with _write_lock:
+        c = db_conn.cursor()
+        outermost = _transaction_depth() == 0
+        if outermost and immediate and not db_conn.in_transaction:
+            c.execute("BEGIN IMMEDIATE")
+        if outermost and config.group_commit > 0:
+            # the uncommitted changes of previous transactions have to survive a
+            # rollback of this one, so this one only rolls back to a savepoint
+            if not db_conn.in_transaction:
+                c.execute("BEGIN")
+            c.execute("SAVEPOINT minipam_transaction")
+        _local.depth = _transaction_depth() + 1
+        try:
+            yield c
+        except BaseException:
+            _local.depth -= 1
+            if outermost:
+                _rollback(c)
+            raise
+        _local.depth -= 1
+        if outermost:
+            _commit(c)
+
+def _commit(c):
+    """
+    commits the outermost transaction, with group commit only if the
+    oldest uncommitted change is older than the group commit window.
+    """
+    global _pending_since
+    if config.group_commit > 0:
+        c.execute("RELEASE minipam_transaction")
+        if _pending_since is None:
+            _pending_since = time.monotonic()
+        if time.monotonic() - _pending_since >= config.group_commit:
+            db_conn.commit()
+            _pending_since = None
+            _committed()
+        while _after_commit:
+            _after_commit.pop(0)()
+    else:
+        try:
+            db_conn.commit()
+        except sqlite3.OperationalError:
+            # another process holds a lock, the changes are dropped
+            db_conn.rollback()
+            _after_commit.clear()
+            raise
+        while _after_commit:
+            _after_commit.pop(0)()
+        _committed()
+
+def _rollback(c):
+    """
+    rolls back the outermost transaction.
+    """
+    if config.group_commit > 0:
+        c.execute("ROLLBACK TO minipam_transaction")
+        c.execute("RELEASE minipam_transaction")
+    else:
+        db_conn.rollback()
+    _after_commit.clear()
+
+def flush_group_commit(force=False):
+    """
+    commits the changes which are held back by group commit once the group
+    commit window is over or at once with force.
+    """
+    global _pending_since
+    with _write_lock:
+        if _pending_since is None or _transaction_depth() > 0:
+            return
+        if force or time.monotonic() - _pending_since >= config.group_commit:
+            db_conn.commit()
+            _pending_since = None
+            _committed()
+
 def close_database_connection():
     """
     closes the database connection
     """
 
-    global db_conn
+    global db_conn, _tries, _cache
+    flush_group_commit(force=True)
+    with _readers_lock:
+        for conn in _readers.values():
+            conn.close()
+        _readers.clear()
     db_conn.close()
     db_conn = None
+    _tries = None
+    _cache = None
+
+def _net_dict(row):
+    """
+    creates the net_dict for a row of the networks table.
+    """
+    return {"address" : row["net"].split("/")[0],
+            "cidr" : row["net"],
+            "netmask" : row["netmask"],
+            "children" : list(),
+            "network_in_database" : True}
+
+def _chunked_in(c, sql, values):
+    """
+    runs a query with an IN list once per chunk of values, to stay below the
+    default limit of 999 variables per statement.
+    :param sql: the query, with %s in place of the IN list
+    :returns: the rows of all chunks
+    """
+    values = list(values)
+    rows = list()
+    for i in range(0, len(values), 900):
+        chunk = values[i:i+900]
+        c.execute(sql % ",".join("?" * len(chunk)), chunk)
+        rows.extend(c.fetchall())
+    return rows
+
+def _add_tags(c, nodes):
+    """
+    fetches the tags for all given networks with a few set based queries
+    and stores them in the "tags" field of each net_dict.
+    :param nodes: a dict mapping network ids to net_dicts
+    """
+    for n in nodes.values():
+        n["tags"] = dict()
+    for r in _chunked_in(c, "SELECT network_id, tag_name, tag_value FROM tags "
+            "WHERE network_id IN (%s)", nodes):
+        nodes[r["network_id"]]["tags"][r["tag_name"]] = r["tag_value"]
 
-def get_net(net, depth=-1):
+def _walk_tree(root_broadcast, rows, depth, max_prefixlen):
+    """
+    yields the rows which are at most depth levels below the root together
+    with the position of their parent, the root has position 0 and the
+    yielded rows the positions 1, 2, ...
+    The rows have to be sorted by address and netmask. Because of that a
+    network always directly follows its parent or one of its siblings, so a
+    stack of the currently open networks is enough to find the parent of
+    every row in a single pass.
+    """
+    stack = [(0, root_broadcast)]
+    position = 0
+    for row in rows:
+        while len(stack) > 1 and row["address"] > stack[-1][1]:
+            stack.pop()
+        if depth >= 0 and len(stack) > depth:
+            continue
+        yield row, stack[-1][0]
+        position += 1
+        stack.append((position,
+            prefix_broadcast(row["address"], row["netmask"], max_prefixlen)))
+
+def _build_tree(root, root_broadcast, rows, depth, max_prefixlen):
+    """
+    nests the rows below the root net_dict.
+    :returns: a dict mapping network ids to the created net_dicts
+    """
+    nodes = dict()
+    positions = [root]
+    for row, parent in _walk_tree(root_broadcast, rows, depth, max_prefixlen):
+        node = _net_dict(row)
+        nodes[row["id"]] = node
+        positions[parent]["children"].append(node)
+        positions.append(node)
+    return nodes
+
+def _build_flat(network, rows, depth, trie):
+    """
+    creates the flat format of get_net from the rows within the network.
+    :param trie: whether the rows are records of the trie and have tags.
+    """
+    in_database = len(rows) > 0 and rows[0]["net"] == str(network)
+    cidrs = [str(network)]
+    parents = [-1]
+    ids = [rows[0]["id"] if in_database else None]
+    if depth != 0:
+        for row, parent in _walk_tree(network.broadcast,
+                rows[1 if in_database else 0:], depth, network.max_prefixlen):
+            cidrs.append(row["net"])
+            parents.append(parent)
+            ids.append(row["id"])
+
+    tags = dict()
+    def set_tag(position, tag_name, tag_value):
+        column = tags.get(tag_name)
+        if column is None:
+            column = tags[tag_name] = [None] * len(ids)
+        column[position] = tag_value
+
+    positions = {id : i for i, id in enumerate(ids) if id is not None}
+    if trie:
+        for row in rows:
+            i = positions.get(row["id"])
+            if i is not None:
+                for k, v in row["tags"].items():
+                    set_tag(i, k, v)
+    else:
+        with reading() as c:
+            for r in _chunked_in(c, "SELECT network_id, tag_name, tag_value FROM tags "
+                    "WHERE network_id IN (%s)", positions):
+                set_tag(positions[r["network_id"]], r["tag_name"], r["tag_value"])
+
+    return {"cidr" : cidrs,
+            "parent" : parents,
+            "network_in_database" : in_database,
+            "tags" : tags}
+
+@_cached
+def get_net(net, depth=-1, format="tree"):
     """
     returns networks within the given network.
     This network does not have to exist in the database
@@ -65,75 +728,521 @@ def get_net(net, depth=-1):
     :param net: the network (ip/subnet maks) which should be returned
     :param depth: how many levels of children should be added. Default is -1 (return everything)
     means add all children.
+    :param format: "tree" returns nested net_dicts. "flat" returns a dict of
+    parallel lists which is much smaller on the wire: "cidr" has the cidrs
+    of the network and of all returned networks below it in depth first
+    order, "parent" the position of the parent of each of them (-1 for the
+    network itself) and "tags" has a list per tag name with the value of
+    every network or None. "network_in_database" is the same as in the tree.
+    minipam.client.flat_tree turns it back into a tree.
     :returns: net_dict dictionary, might by empty
+    :raises InvalidFormat: raised if format is neither "tree" nor "flat".
     """
+    if format not in ("tree", "flat"):
+        raise_fault("InvalidFormat")
     try:
-        network = ip_network(net)
-        c = db_conn.cursor()
-        c.execute("SELECT net, address, netmask FROM networks "
-                "WHERE netmask >= ? AND address >= ? AND "
-                "address <= ? ORDER BY address ASC, netmask ASC",
-                (network.prefixlen,
-                    network_address_to_int(network),
-                    network_broadcast_to_int(network)))
-        results = c.fetchall()
-        #if len(results) == 0:
-        #    raise_fault("NetworkNotInDatabase")
-
-        def add_tags(net):
-            c.execute("SELECT tag_name, tag_value FROM tags JOIN networks ON"
-                    " network_id = id WHERE net = ?", (net["cidr"],))
-            net["tags"] = {l[0] : l[1] for l in c.fetchall()}
+        network = Prefix.parse(net)
+        trie = _read_trie(network.version)
+        if trie is not None:
+            results = [r for a, p, r in trie.subtree(
+                network.address, network.prefixlen)]
+        else:
+            with reading() as c:
+                c.execute("SELECT id, net, address, netmask FROM networks "
+                        "WHERE family = ? AND netmask >= ? AND address >= ? AND "
+                        "address <= ? ORDER BY address ASC, netmask ASC",
+                        (network.version, network.prefixlen,
+                            network.address_bytes(),
+                            network.broadcast_bytes()))
+                results = c.fetchall()
+
+        if format == "flat":
+            return _build_flat(network, results, depth, trie is not None)
 
         if len(results) == 0 or results[0]["net"] != str(network):
-            ret = { "address": str(network.network_address),
+            ret = { "address": str(network).partition("/")[0],
                     "cidr" : str(network),
                     "netmask": network.prefixlen,
                     "children": list(),
-                    "network_in_database": False}
-            add_tags(ret)
+                    "network_in_database": False,
+                    "tags": dict()}
+            nodes = dict()
             start = 0
-            if len(results) == 0:
-                return ret
         else:
-            ret = { "address" : results[0]["net"].split("/")[0],
-                    "cidr" : results[0]["net"],
-                    "netmask" : results[0]["netmask"],
-                    "children" : list(),
-                    "network_in_database": True}
-            add_tags(ret)
+            ret = _net_dict(results[0])
+            nodes = {results[0]["id"] : ret}
             start = 1
 
-        def insert_in_netlist(ip_net, netlist, remaining_depth):
-            """
-            This function creates a network dictionary and appends it recursive
-            in one of the network dictionaries in the netlist or appends it to
-            the netlist if it does not fit into the dicts already in the list.
-            If the remaining_depth reaches 0 it aborts.
-            """
-            for c in netlist:
-                c_net = ip_network(c["cidr"])
-                if c_net.overlaps(ip_net):
-                    if remaining_depth != 0:
-                        insert_in_netlist(ip_net, c["children"], remaining_depth-1)
-                    return
-            netlist.append({"address" : n["net"].split("/")[0],
-                "cidr": n["net"],
-                "netmask" : n["netmask"],
-                "children" : list(),
-                "network_in_database" : True})
-            add_tags(netlist[-1])
-
         if depth != 0:
-            for n in results[start:]:
-                n_net = ip_network(n["net"])
-                insert_in_netlist(n_net, ret["children"], depth-1)
+            nodes.update(_build_tree(ret, network.broadcast,
+                results[start:], depth, network.max_prefixlen))
+        if trie is not None:
+            records = {r["id"] : r for r in results}
+            for i, n in nodes.items():
+                n["tags"] = dict(records[i]["tags"])
+        else:
+            with reading() as c:
+                _add_tags(c, nodes)
 
         return ret
 
     except ValueError:
         raise_fault("InvalidNetworkDescription");
 
+def _containing_nets(c, address, prefixlen, min_prefixlen=0, version=4):
+    """
+    returns the rows (id, net, address, netmask) of all networks in the
+    database which contain address/prefixlen and have a netmask between
+    min_prefixlen and prefixlen, sorted by netmask.
+    """
+    max_prefixlen = MAX_PREFIXLEN[version]
+    # every network which contains the prefix starts at one of these addresses
+    candidates = sorted({prefix_address(address, p, max_prefixlen)
+        for p in range(min_prefixlen, prefixlen + 1)})
+    c.execute("SELECT id, net, address, netmask FROM networks "
+            "WHERE family = ? AND address IN (%s) AND netmask >= ? AND netmask <= ? "
+            "ORDER BY netmask ASC" % ",".join("?" * len(candidates)),
+            [version] + [address_to_bytes(a, version) for a in candidates]
+            + [min_prefixlen, prefixlen])
+    return [r for r in c.fetchall()
+            if prefix_address(address, r["netmask"], max_prefixlen) == r["address"]]
+
+def _containing_net(c, address, prefixlen, version=4):
+    """
+    returns the row (id, net, address, netmask) of the most specific network
+    in the database which contains address/prefixlen and has a netmask of at
+    most prefixlen. Returns None if there is no such network.
+    """
+    nets = _containing_nets(c, address, prefixlen, version=version)
+    return nets[-1] if nets else None
+
+def _top_level_nets(c, address, prefixlen, inclusive=False, version=4):
+    """
+    returns the networks directly below address/prefixlen as sorted list of
+    (address, netmask) tuples, regardless if address/prefixlen itself is in
+    the database or not.
+    :param inclusive: if set, address/prefixlen itself is returned if it is
+    in the database.
+    """
+    max_prefixlen = MAX_PREFIXLEN[version]
+    broadcast = prefix_broadcast(address, prefixlen, max_prefixlen)
+    c.execute("SELECT address, netmask FROM networks "
+            "WHERE family = ? AND netmask >= ? AND address >= ? AND address <= ? "
+            "ORDER BY address ASC, netmask ASC",
+            (version, prefixlen if inclusive else prefixlen + 1,
+                address_to_bytes(address, version), address_to_bytes(broadcast, version)))
+    nets = list()
+    end = address - 1
+    for r in c.fetchall():
+        if r["address"] > end:
+            nets.append((r["address"], r["netmask"]))
+            end = prefix_broadcast(r["address"], r["netmask"], max_prefixlen)
+    return nets
+
+def _insert_free_blocks(c, blocks, version=4):
+    """
+    inserts (parent_id, address, netmask) tuples into the free_blocks table.
+    :param version: the ip version of the addresses
+    """
+    c.executemany("INSERT INTO free_blocks (parent_id, address, netmask) VALUES (?,?,?)",
+            [(i, address_to_bytes(a, version), p) for i, a, p in blocks])
+
+def _reserve_block(c, parent_id, address, prefixlen, version=4):
+    """
+    removes address/prefixlen from the free blocks of the parent.
+    """
+    max_prefixlen = MAX_PREFIXLEN[version]
+    broadcast = prefix_broadcast(address, prefixlen, max_prefixlen)
+    c.execute("SELECT address, netmask FROM free_blocks WHERE parent_id = ? "
+            "AND address <= ? ORDER BY address DESC LIMIT 1",
+            (parent_id, address_to_bytes(address, version)))
+    block = c.fetchone()
+    if block is not None and block["netmask"] < prefixlen and \
+            prefix_broadcast(block["address"], block["netmask"], max_prefixlen) >= address:
+        # the free block contains the network, split it up
+        c.execute("DELETE FROM free_blocks WHERE parent_id = ? AND address = ?",
+                (parent_id, address_to_bytes(block["address"], version)))
+        _insert_free_blocks(c, [(parent_id, a, p) for a, p in free_prefixes(block["address"],
+                    prefix_broadcast(block["address"], block["netmask"], max_prefixlen),
+                    [(address, prefixlen)], max_prefixlen)], version)
+    else:
+        c.execute("DELETE FROM free_blocks WHERE parent_id = ? AND address >= ? AND address <= ?",
+                (parent_id, address_to_bytes(address, version), address_to_bytes(broadcast, version)))
+
+def _release_block(c, parent, address, prefixlen, version=4):
+    """
+    adds address/prefixlen to the free blocks of the parent and merges it
+    with its buddies.
+    :param parent: the row of the parent network
+    """
+    while prefixlen > parent["netmask"]:
+        buddy = address ^ (1 << (MAX_PREFIXLEN[version] - prefixlen))
+        c.execute("DELETE FROM free_blocks WHERE parent_id = ? AND address = ? AND netmask = ?",
+                (parent["id"], address_to_bytes(buddy, version), prefixlen))
+        if c.rowcount == 0:
+            break
+        address = min(address, buddy)
+        prefixlen -= 1
+    _insert_free_blocks(c, [(parent["id"], address, prefixlen)], version)
+
+class _Conflict(Exception):
+    """
+    raised if the free space a claim picked was taken by another process
+    before the claim could write.
+    """
+
+def _best_free_block(c, parent_id, size):
+    """
+    returns the (address, netmask) of the smallest free block of the parent
+    into which a network with the netmask size fits. If there are several,
+    the first one is used. Returns None if there is no such block.
+    :raises _Conflict: raised if the blocks changed while they were read.
+    """
+    c.execute("SELECT MAX(netmask) FROM free_blocks WHERE parent_id = ? AND netmask <= ?",
+            (parent_id, size))
+    netmask = c.fetchone()[0]
+    if netmask is None:
+        return None
+    c.execute("SELECT address FROM free_blocks WHERE parent_id = ? AND netmask = ? "
+            "ORDER BY address ASC LIMIT 1", (parent_id, netmask))
+    row = c.fetchone()
+    if row is None:
+        # another process took the block between the two queries
+        raise _Conflict()
+    return (row["address"], netmask)
+
+def _take_free_blocks(c, parent_id, blocks, version):
+    """
+    deletes the free blocks of the parent from which new networks are
+    claimed. The first delete takes the write lock of the database, so a
+    block which is gone was taken by another process after it was read.
+    :raises _Conflict: raised if a block is gone, the blocks deleted up to
+    then are restored.
+    """
+    taken = list()
+    for a, p in blocks:
+        c.execute("DELETE FROM free_blocks WHERE parent_id = ? AND address = ? AND netmask = ?",
+                (parent_id, address_to_bytes(a, version), p))
+        if c.rowcount == 0:
+            _insert_free_blocks(c, [(parent_id, a, p) for a, p in taken], version)
+            raise _Conflict()
+        taken.append((a, p))
+
+def _expected_free_space(c, version=None, address=0, prefixlen=0):
+    """
+    computes the free blocks and the usage counters of all networks from the
+    networks table.
+    :param version: if set, only the networks within address/prefixlen of
+    this ip version are looked at.
+    :returns: a dict mapping (parent_id, address, netmask) tuples of the
+    free blocks to their ip version and a dict mapping the network ids to
+    [children, used] lists.
+    """
+    expected = dict()
+    usage = dict()
+    # the open networks as [id, next free address, broadcast]
+    stack = list()
+    family = None
+
+    def add(id, start, end):
+        expected.update(((id, a, p), family) for a, p in
+                range_to_prefixes(start, end, MAX_PREFIXLEN[family]))
+
+    if version is None:
+        c.execute("SELECT id, family, address, netmask FROM networks ORDER BY family, address, netmask")
+    else:
+        c.execute("SELECT id, family, address, netmask FROM networks "
+                "WHERE family = ? AND netmask >= ? AND address >= ? AND address <= ? "
+                "ORDER BY address, netmask",
+                (version, prefixlen, address_to_bytes(address, version), address_to_bytes(
+                    prefix_broadcast(address, prefixlen, MAX_PREFIXLEN[version]), version)))
+    for r in c.fetchall():
+        while stack and (r["family"] != family or r["address"] > stack[-1][2]):
+            add(*stack.pop())
+        family = r["family"]
+        broadcast = prefix_broadcast(r["address"], r["netmask"], MAX_PREFIXLEN[family])
+        usage[r["id"]] = [0, 0]
+        if stack:
+            add(stack[-1][0], stack[-1][1], r["address"] - 1)
+            stack[-1][1] = broadcast + 1
+            usage[stack[-1][0]][0] += 1
+            usage[stack[-1][0]][1] += broadcast - r["address"] + 1
+        stack.append([r["id"], r["address"], broadcast])
+    while stack:
+        add(*stack.pop())
+    return expected, usage
+
+def _rebuild_free_blocks(c, expected):
+    """
+    inserts the free blocks computed by _expected_free_space.
+    """
+    for version in MAX_PREFIXLEN:
+        _insert_free_blocks(c, sorted(b for b, v in expected.items() if v == version), version)
+
+def _insert_usage(c, usage):
+    """
+    inserts or replaces usage counters.
+    :param usage: a dict mapping network ids to (children, used) tuples
+    """
+    c.executemany("INSERT OR REPLACE INTO usage (network_id, children, used) VALUES (?,?,?)",
+            [(i, children, count_to_bytes(used)) for i, (children, used) in usage.items()])
+
+def _change_usage(c, id, children, used):
+    """
+    adds children and used to the usage counters of a network.
+    """
+    c.execute("SELECT children, used FROM usage WHERE network_id = ?", (id,))
+    row = c.fetchone()
+    c.execute("UPDATE usage SET children = ?, used = ? WHERE network_id = ?",
+            (row["children"] + children, count_to_bytes(row["used"] + used), id))
+
+def _check_free_blocks(c):
+    """
+    compares the free_blocks and the usage table with the free space
+    computed from the networks table and rebuilds them if they differ.
+    :returns: True if a table had to be rebuilt.
+    """
+    if not db_conn.in_transaction:
+        # other processes must not write between the reads of the tables
+        c.execute("BEGIN IMMEDIATE")
+    expected, usage = _expected_free_space(c)
+    c.execute("SELECT parent_id, address, netmask FROM free_blocks")
+    blocks_differ = expected.keys() != {tuple(r) for r in c.fetchall()}
+    c.execute("SELECT network_id, children, used FROM usage")
+    usage_differs = {i : tuple(u) for i, u in usage.items()} != \
+            {r["network_id"] : (r["children"], r["used"]) for r in c.fetchall()}
+    if blocks_differ:
+        c.execute("DELETE FROM free_blocks")
+        _rebuild_free_blocks(c, expected)
+    if usage_differs:
+        c.execute("DELETE FROM usage")
+        _insert_usage(c, usage)
+    db_conn.commit()
+    return blocks_differ or usage_differs
+
+def _insert_net(c, network, claimed_from=None):
+    """
+    inserts the network and updates the free blocks without committing.
+    :param network: a Prefix
+    :param claimed_from: the prefixlen of the network, which is not in the
+    database, in whose free space the network was picked. The network has
+    to be free then.
+    :returns: the id of the new network or None if it already existed.
+    :raises _Conflict: raised if a claimed network is not free anymore.
+    """
+    address = network.address
+    version = network.version
+    c.execute("INSERT OR IGNORE INTO networks (net, family, address, netmask) VALUES (?,?,?,?)",
+            (str(network), version, network.address_bytes(), network.prefixlen))
+    if c.rowcount == 0:
+        if claimed_from is not None:
+            raise _Conflict()
+        return None
+    id = c.lastrowid
+
+    # the new network takes its space from the free blocks of its parent
+    # and its free blocks are the space not used by its new children
+    children = _top_level_nets(c, address, network.prefixlen, version=version)
+    used = sum(1 << (network.max_prefixlen - p) for a, p in children)
+    parent = None
+    if network.prefixlen > 0:
+        parent = _containing_net(c, address, network.prefixlen - 1, version)
+    if claimed_from is not None and (children or
+            (parent is not None and parent["netmask"] >= claimed_from)):
+        # the insert took the write lock, so this is the current state
+        c.execute("DELETE FROM networks WHERE id = ?", (id,))
+        raise _Conflict()
+    if network.prefixlen > 0:
+        if parent is not None:
+            _reserve_block(c, parent["id"], address, network.prefixlen, version)
+            # the children of the new network were children of the parent
+            _change_usage(c, parent["id"], 1 - len(children),
+                    network.num_addresses - used)
+    _insert_free_blocks(c, [(id, a, p) for a, p in free_prefixes(address,
+        network.broadcast, children, network.max_prefixlen)], version)
+    _insert_usage(c, {id : (len(children), used)})
+    return id
+
+def _delete_claimed(c, id, network):
+    """
+    deletes a network without children which was inserted by _insert_net
+    and gives its space back to its parent.
+    """
+    address = network.address
+    c.execute("DELETE FROM networks WHERE id = ?", (id,))
+    if network.prefixlen > 0:
+        parent = _containing_net(c, address, network.prefixlen - 1, network.version)
+        if parent is not None:
+            _release_block(c, parent, address, network.prefixlen, network.version)
+            _change_usage(c, parent["id"], -1, -network.num_addresses)
+
+def _allocate_blocks(blocks, size, count, max_prefixlen=32):
+    """
+    takes count networks with the netmask size out of the free blocks.
+    Every network is taken from the smallest block it fits in and from the
+    first of those if there are several, the rest of the block stays free.
+    :param blocks: a list of free (address, netmask) tuples
+    :returns: the list of the allocated addresses and the list of the free
+    blocks afterwards or None if the networks do not fit into the blocks.
+    """
+    if sum(1 << (size - p) for a, p in blocks if p <= size) < count:
+        return None
+
+    # the blocks which are large enough by netmask, the addresses are stored
+    # negated and sorted so the first block of each netmask is at the end
+    levels = dict()
+    for a, p in blocks:
+        if p <= size:
+            levels.setdefault(p, list()).append(-a)
+    for l in levels.values():
+        l.sort()
+
+    allocated = list()
+    for i in range(count):
+        netmask = max(p for p, l in levels.items() if l)
+        address = -levels[netmask].pop()
+        # the block is split into the network and its buddies
+        for p in range(netmask + 1, size + 1):
+            insort(levels.setdefault(p, list()), -(address + (1 << (max_prefixlen - p))))
+        allocated.append(address)
+
+    free = [b for b in blocks if b[1] > size]
+    free.extend((-a, p) for p, l in levels.items() for a in l)
+    return allocated, free
+
+def iter_net(net, depth=-1, after=None, chunk_size=1000):
+    """
+    yields the given network and the networks within it as flat dicts, every
+    network before its children and all sorted by address. Next to the
+    fields of a net_dict (without "children") every dict has the "parent"
+    field with the cidr of its parent (None for the given network) and the
+    "depth" field with its level below the given network.
+    The networks are read in chunks, so the memory needed does not depend on
+    the size of the tree.
+    :param net: the network in cidr notation
+    :param depth: how many levels of children should be returned, -1 for all.
+    :param after: the cidr of a network which was already returned, the
+    iteration continues after it.
+    :param chunk_size: how many networks are read from the database at once.
+    """
+    try:
+        network = Prefix.parse(net)
+        position = Prefix.parse(after) if after is not None else network
+    except ValueError:
+        raise_fault("InvalidNetworkDescription")
+    version = network.version
+    max_prefixlen = network.max_prefixlen
+    broadcast = network.broadcast
+
+    with reading() as c:
+        c.execute("SELECT id, net, address, netmask FROM networks WHERE net = ?", (str(network),))
+        row = c.fetchone()
+        if row is not None:
+            root = _net_dict(row)
+            del root["children"]
+            _add_tags(c, {row["id"] : root})
+        else:
+            root = { "address": str(network).partition("/")[0],
+                    "cidr" : str(network),
+                    "netmask": network.prefixlen,
+                    "network_in_database": False,
+                    "tags": dict()}
+        root["parent"] = None
+        root["depth"] = 0
+
+        # the open networks as (cidr, broadcast) tuples
+        stack = [(root["cidr"], broadcast)]
+        if after is not None:
+            for r in _containing_nets(c, position.address,
+                    position.prefixlen, network.prefixlen + 1, version):
+                stack.append((r["net"], prefix_broadcast(r["address"], r["netmask"], max_prefixlen)))
+
+    if after is None:
+        yield root
+    position = (position.address, position.prefixlen)
+
+    while depth != 0:
+        with reading() as c:
+            c.execute("SELECT id, net, address, netmask FROM networks "
+                    "WHERE family = ? AND netmask > ? AND address <= ? AND (address, netmask) > (?, ?) "
+                    "ORDER BY address ASC, netmask ASC LIMIT ?",
+                    (version, network.prefixlen, address_to_bytes(broadcast, version),
+                        address_to_bytes(position[0], version), position[1], chunk_size))
+            rows = c.fetchall()
+            nodes = dict()
+            for r in rows:
+                while len(stack) > 1 and r["address"] > stack[-1][1]:
+                    stack.pop()
+                if depth >= 0 and len(stack) > depth:
+                    continue
+                node = _net_dict(r)
+                del node["children"]
+                node["parent"] = stack[-1][0]
+                node["depth"] = len(stack)
+                nodes[r["id"]] = node
+                stack.append((r["net"], prefix_broadcast(r["address"], r["netmask"], max_prefixlen)))
+            _add_tags(c, nodes)
+
+        yield from nodes.values()
+        if len(rows) < chunk_size:
+            break
+        position = (rows[-1]["address"], rows[-1]["netmask"])
+
+def get_net_page(net, depth=-1, cursor=None, limit=1000):
+    """
+    returns one page of iter_net. To get the whole tree, call it again with
+    the returned cursor until the cursor is None.
+    :param net: the network in cidr notation
+    :param depth: how many levels of children should be returned, -1 for all.
+    :param cursor: the cursor returned with the previous page, None for the first page.
+    :param limit: the maximum number of networks on the page
+    :returns: a dict with the list of networks in "nodes" and the cursor for
+    the next page in "cursor".
+    :raises InvalidLimit: raised if limit is not a positive integer.
+    """
+    if not isinstance(limit, int) or limit < 1:
+        raise_fault("InvalidLimit")
+    nodes = list(islice(iter_net(net, depth, cursor, chunk_size=limit), limit))
+    return {"nodes" : nodes,
+            "cursor" : nodes[-1]["cidr"] if len(nodes) == limit else None}
+
+def _log_changes(c, changes):
+    """
+    appends changes to the change log and compacts it every
+    _compact_interval changes.
+    :param changes: a list of (operation, cidr, tag name, tag value) tuples
+    """
+    global _changes_since_compaction
+    now = time.time()
+    c.executemany("INSERT INTO changes (time, operation, net, tag_name, tag_value) "
+            "VALUES (?,?,?,?,?)", [(now,) + change for change in changes])
+    _changes_since_compaction += len(changes)
+    if _changes_since_compaction >= _compact_interval:
+        _compact_changes(c)
+
+def _compact_changes(c):
+    """
+    deletes the entries of the change log which are older than
+    config.change_retention or beyond config.change_retention_entries.
+    :returns: the number of deleted entries
+    """
+    global _changes_since_compaction
+    _changes_since_compaction = 0
+    deleted = 0
+    if config.change_retention is not None:
+        # the entries are in time order, so everything before the first
+        # entry which is new enough is deleted
+        c.execute("DELETE FROM changes WHERE seq < coalesce("
+                "(SELECT seq FROM changes WHERE time >= ? ORDER BY time, seq LIMIT 1),"
+                "(SELECT max(seq) + 1 FROM changes))",
+                (time.time() - config.change_retention,))
+        deleted += c.rowcount
+    if config.change_retention_entries is not None:
+        c.execute("DELETE FROM changes WHERE seq <= (SELECT max(seq) FROM changes) - ?",
+                (config.change_retention_entries,))
+        deleted += c.rowcount
+    return deleted
+
 def add_net(net):
     """
     adds a network to the database.
@@ -144,32 +1253,211 @@ def add_net(net):
     :raises Fault: raises a xmlrpc.server.Fault with an error code and message
     """
     try:
-        network = ip_network(net)
-        c = db_conn.cursor()
-        c.execute("INSERT OR IGNORE INTO networks (net, address, netmask) VALUES (?,?,?)", (str(network), network_address_to_int(network), network.prefixlen))
-        db_conn.commit()
+        network = Prefix.parse(net)
+        with transaction() as c:
+            id = _insert_net(c, network)
+            if id is not None:
+                _trie_add(id, str(network), network.address, network.prefixlen,
+                        version=network.version)
+                _cache_invalidate(network.version, network.address,
+                        network.prefixlen)
+                _log_changes(c, [("add_net", str(network), None, None)])
 
     except ValueError:
         raise_fault("InvalidNetworkDescription");
 
-def delete_net(net, recursive=False):
+def delete_net(net, recursive=False, dry_run=False, chunk_size=None, *, progress=None):
     """
     deletes the given network.
     :param net: a network in cidr notation
     :param recursive: whether to delete all children or not
+    :param dry_run: only count the networks and tags which would be deleted
+    :param chunk_size: with recursive, delete the networks in batches of at
+    most about chunk_size networks in address order. Every batch is deleted
+    in its own transaction, so other writes do not wait for the whole
+    subtree. If the deletion is interrupted, the same call deletes the rest.
+    :param progress: if given, it is called with the counts of the deleted
+    networks and tags after every batch. Only for calls within the process,
+    so it is keyword only.
+    :returns: a dict with the number of deleted "networks" and "tags".
     """
     try:
-        network = ip_network(net)
-        c = db_conn.cursor()
-        if recursive:
-            c.execute("DELETE FROM networks WHERE netmask >= ? AND address >= ? and address <= ?",
-                    (network.prefixlen, network_address_to_int(network), network_broadcast_to_int(network)))
-        else:
-            c.execute("DELETE FROM networks WHERE net = ?" , (str(network),))
-        db_conn.commit()
+        network = Prefix.parse(net)
+        if dry_run:
+            with reading() as c:
+                return _count_deleted(c, *_deleted_condition(network, recursive))
+        if recursive and chunk_size is not None:
+            return _delete_chunked(network, max(1, chunk_size), progress)
+        with transaction() as c:
+            return _delete_net(c, network, recursive)
     except ValueError:
         raise_fault("InvalidNetworkDescription")
 
+def _deleted_condition(network, recursive):
+    """
+    returns the condition on the networks table and its arguments which
+    selects the networks delete_net deletes.
+    """
+    if recursive:
+        return ("family = ? AND netmask >= ? AND address >= ? AND address <= ?",
+                (network.version, network.prefixlen, network.address_bytes(),
+                    network.broadcast_bytes()))
+    return "net = ?", (str(network),)
+
+def _count_deleted(c, condition, args):
+    """
+    returns the numbers of networks and tags which match condition.
+    """
+    c.execute("SELECT count(*) FROM networks WHERE " + condition, args)
+    networks = c.fetchone()[0]
+    c.execute("SELECT count(*) FROM tags WHERE network_id IN "
+            "(SELECT id FROM networks WHERE " + condition + ")", args)
+    return {"networks" : networks, "tags" : c.fetchone()[0]}
+
+def _delete_net(c, network, recursive):
+    """
+    deletes a network or with recursive all networks within it.
+    :returns: the counts of the deleted networks and tags
+    """
+    address = network.address
+    version = network.version
+    # the space of the deleted networks goes back to the parent
+    parent = None
+    if network.prefixlen > 0:
+        parent = _containing_net(c, address, network.prefixlen - 1, version)
+    condition, args = _deleted_condition(network, recursive)
+    c.execute("SELECT count(*) FROM tags WHERE network_id IN "
+            "(SELECT id FROM networks WHERE " + condition + ")", args)
+    tags = c.fetchone()[0]
+    if recursive:
+        if parent is not None:
+            released = _top_level_nets(c, address, network.prefixlen, True, version)
+            # all top level networks within the range are gone
+            children = -len(released)
+        c.execute("SELECT net FROM networks WHERE " + condition + " ORDER BY address, netmask",
+                args)
+        deleted = [r["net"] for r in c.fetchall()]
+        c.execute("DELETE FROM networks WHERE " + condition, args)
+    else:
+        c.execute("SELECT address, netmask FROM free_blocks WHERE parent_id = "
+                "(SELECT id FROM networks WHERE net = ?)", (str(network),))
+        released = [(r["address"], r["netmask"]) for r in c.fetchall()]
+        # the children of the network become children of the parent
+        c.execute("SELECT children FROM usage WHERE network_id = "
+                "(SELECT id FROM networks WHERE net = ?)", (str(network),))
+        row = c.fetchone()
+        children = row["children"] - 1 if row is not None else 0
+        c.execute("DELETE FROM networks WHERE net = ?" , (str(network),))
+        deleted = [str(network)] if c.rowcount > 0 else []
+        if c.rowcount == 0:
+            released = list()
+    if parent is not None:
+        for a, p in released:
+            _release_block(c, parent, a, p, version)
+        if released or children:
+            _change_usage(c, parent["id"], children,
+                    -sum(1 << (network.max_prefixlen - p) for a, p in released))
+    _trie_remove(address, network.prefixlen, recursive, version)
+    _cache_invalidate(version, address, network.prefixlen)
+    # the tags of the deleted networks are gone with them
+    _log_changes(c, [("delete_net", n, None, None) for n in deleted])
+    return {"networks" : len(deleted), "tags" : tags}
+
+def _delete_chunked(network, chunk_size, progress=None):
+    """
+    deletes a network and all networks within it in batches of at most
+    about chunk_size networks, see delete_net.
+    Subtrees with up to chunk_size networks are deleted as a whole, several
+    neighbouring ones together. Larger subtrees are emptied the same way
+    first and their top network is deleted on its own afterwards. Every
+    batch leaves the database consistent, so an interrupted deletion can
+    be started again.
+    :returns: the counts of the deleted networks and tags
+    """
+    version = network.version
+    max_prefixlen = network.max_prefixlen
+    counts = {"networks" : 0, "tags" : 0}
+
+    def deleted(result):
+        counts["networks"] += result["networks"]
+        counts["tags"] += result["tags"]
+        if progress is not None:
+            progress(dict(counts))
+
+    def flush(address, prefixlen, run):
+        if run:
+            with transaction() as c:
+                deleted(_delete_tops(c, address, prefixlen, run[0][0],
+                    prefix_broadcast(*run[-1], max_prefixlen), version))
+
+    def empty(address, prefixlen):
+        # deletes all networks within address/prefixlen but itself
+        with reading() as c:
+            tops = _top_level_nets(c, address, prefixlen, version=version)
+        run = list()
+        run_size = 0
+        for a, p in tops:
+            with reading() as c:
+                c.execute("SELECT count(*) FROM (SELECT 1 FROM networks WHERE family = ? AND "
+                        "netmask >= ? AND address >= ? AND address <= ? LIMIT ?)",
+                        (version, p, address_to_bytes(a, version),
+                            address_to_bytes(prefix_broadcast(a, p, max_prefixlen), version),
+                            chunk_size + 1))
+                size = c.fetchone()[0]
+            if run and (size > chunk_size or run_size + size > chunk_size):
+                flush(address, prefixlen, run)
+                run = list()
+                run_size = 0
+            if size > chunk_size:
+                empty(a, p)
+                with transaction() as c:
+                    deleted(_delete_net(c, Prefix(a, p, version), False))
+            else:
+                run.append((a, p))
+                run_size += size
+        flush(address, prefixlen, run)
+
+    empty(network.address, network.prefixlen)
+    with transaction() as c:
+        result = _delete_net(c, network, False)
+    if result["networks"]:
+        deleted(result)
+    return counts
+
+def _delete_tops(c, address, prefixlen, first, last, version=4):
+    """
+    deletes all networks between the addresses first and last which lie
+    within address/prefixlen. first and last have to be the bounds of top
+    level networks of address/prefixlen.
+    :returns: the counts of the deleted networks and tags
+    """
+    max_prefixlen = MAX_PREFIXLEN[version]
+    condition = "family = ? AND netmask > ? AND address >= ? AND address <= ?"
+    args = (version, prefixlen, address_to_bytes(first, version), address_to_bytes(last, version))
+    c.execute("SELECT net, address, netmask FROM networks WHERE " + condition +
+            " ORDER BY address, netmask", args)
+    rows = c.fetchall()
+    # the rows are read in the transaction, so the top level networks are current
+    tops = list()
+    end = first - 1
+    for r in rows:
+        if r["address"] > end:
+            tops.append((r["address"], r["netmask"]))
+            end = prefix_broadcast(r["address"], r["netmask"], max_prefixlen)
+    counts = _count_deleted(c, condition, args)
+    c.execute("DELETE FROM networks WHERE " + condition, args)
+    parent = _containing_net(c, address, prefixlen, version)
+    if parent is not None:
+        for a, p in tops:
+            _release_block(c, parent, a, p, version)
+        _change_usage(c, parent["id"], -len(tops),
+                -sum(1 << (max_prefixlen - p) for a, p in tops))
+    for a, p in tops:
+        _trie_remove(a, p, True, version)
+    _cache_invalidate(version, address, prefixlen)
+    _log_changes(c, [("delete_net", r["net"], None, None) for r in rows])
+    return counts
+
 def claim_net(net, size):
     """
     claims a network of size directly in the given network.
@@ -180,84 +1468,419 @@ def claim_net(net, size):
     this size in this network.
     """
     try:
+        network = Prefix.parse(net)
 
-        network = ip_network(net)
-        required_gap = 2**(network.max_prefixlen - size)
+        if size < network.prefixlen:
+            raise_fault("NoMatchingGapAvailable")
+        if size > network.max_prefixlen:
+            raise_fault("InvalidNetworkDescription")
+
+        return _claim(lambda c: get_net(_claim_nets(c, network, size, 1)[0]))
+
+    except ValueError:
+        raise_fault("InvalidNetworkDescription")
+
+def claim_nets(net, size, count, tags=None):
+    """
+    claims count networks of size directly in the given network in one
+    transaction. The networks are picked like claim_net would pick them.
+    :param net: the network in which the new networks should be added
+    :param size: the subnet mask, for example 8 or 27
+    :param count: the number of networks to claim
+    :param tags: a dict of tags which is added to every new network
+    :returns: a list with the cidrs of the new networks
+    :raises NoMatchingGapAvailable: raised if there is no space for count
+    subnets of this size in this network, also if size is the netmask of
+    the network itself and it is in the database. Nothing is claimed then.
+    :raises InvalidNetworkDescription: raised if size is longer than the
+    addresses of the network.
+    """
+    try:
+        network = Prefix.parse(net)
 
         if size < network.prefixlen:
             raise_fault("NoMatchingGapAvailable")
+        if size > network.max_prefixlen:
+            raise_fault("InvalidNetworkDescription")
 
-        nets = get_net(net, depth=1)
-
-        if len(nets["children"]) == 0:
-            network_string = str(network.network_address) + "/" + str(size)
-            add_net(network_string)
-            return get_net(network_string, depth=0)
-        else: #at least one child exists.
-
-            def next_start_address(net, size):
-                if size >= net.prefixlen:
-                    start_addr = network_broadcast_to_int(net) + 1
-                else:
-                    size_diff = net.prefixlen - size
-                    supernet = net.supernet(size_diff)
-                    start_addr = int(supernet.network_address) + 2**(supernet.max_prefixlen-supernet.prefixlen)
-                return start_addr
-
-            smallest_gap = None
-
-            # start and end gaps
-            first_block = ip_network(nets["children"][0]["cidr"])
-            first_gap = network_address_to_int(first_block) - network_address_to_int(network)
-
-            if first_gap >= required_gap:
-                smallest_gap = { "address" : network.network_address,
-                        "length" : first_gap }
-
-            # add all gaps between blocks
-            for i, n in enumerate(nets["children"][:-1]):
-                net1 = ip_network(n["cidr"])
-                net2 = ip_network(nets["children"][i+1]["cidr"])
-                start_addr = next_start_address(net1, size)
-                gap = network_address_to_int(net2) - start_addr
-                if gap >= required_gap and (smallest_gap is None or gap < smallest_gap["length"]):
-                    smallest_gap = {"address" : ip_address(start_addr),
-                            "length": gap}
-
-            # the last gap
-            last_block = ip_network(nets["children"][-1]["cidr"])
-            last_gap_start = next_start_address(last_block, size)
-            last_gap =  network_broadcast_to_int(network) - last_gap_start + 1
-            if last_gap >= required_gap and (smallest_gap is None or last_gap < smallest_gap["length"]):
-                smallest_gap = { "address" : ip_address(last_gap_start),
-                        "length" :last_gap}
-
-            if smallest_gap is None:
-                raise_fault("NoMatchingGapAvailable")
-
-            network_string = str(smallest_gap["address"]) + "/" + str(size)
-            add_net(network_string)
-            return get_net(network_string)
+        return _claim(lambda c: _claim_nets(c, network, size, count, tags))
 
     except ValueError:
         raise_fault("InvalidNetworkDescription")
 
+def _claim(claim):
+    """
+    calls claim with the cursor of a transaction. The first attempt does
+    not lock the database while the claim reads the free space. If another
+    process took the space in between, or holds the write lock and waits
+    for this one, the claim is repeated with the database locked.
+    :returns: the result of claim
+    """
+    try:
+        with transaction() as c:
+            return claim(c)
+    except (_Conflict, sqlite3.OperationalError):
+        pass
+    with transaction(immediate=True) as c:
+        return claim(c)
+
+def _claim_nets(c, network, size, count, tags=None):
+    """
+    picks count networks of size in the free space of network and inserts
+    them. The space is read before the write lock is taken, so the inserts
+    check that it is still free.
+    :returns: a list with the cidrs of the new networks
+    :raises _Conflict: raised if another process took the space in between,
+    nothing is changed then.
+    """
+    address = network.address
+    version = network.version
+
+    c.execute("SELECT id FROM networks WHERE net = ?", (str(network),))
+    parent = c.fetchone()
+    if parent is not None and size == network.prefixlen:
+        # the only network of that size is the parent itself
+        raise_fault("NoMatchingGapAvailable")
+    if parent is None:
+        blocks = free_prefixes(address, network.broadcast,
+                _top_level_nets(c, address, network.prefixlen, version=version),
+                network.max_prefixlen)
+    elif count == 1:
+        best = _best_free_block(c, parent["id"], size)
+        blocks = [best] if best is not None else []
+    else:
+        c.execute("SELECT address, netmask FROM free_blocks "
+                "WHERE parent_id = ? AND netmask <= ?", (parent["id"], size))
+        blocks = [(r["address"], r["netmask"]) for r in c.fetchall()]
+
+    allocation = _allocate_blocks(blocks, size, count, network.max_prefixlen)
+    if allocation is None:
+        raise_fault("NoMatchingGapAvailable")
+    allocated, free = allocation
+    networks = [Prefix(a, size, version) for a in allocated]
+
+    ids = list()
+    if parent is not None:
+        # the new networks lie in free blocks of the parent, so they have
+        # no children and the parent is the only network which changes.
+        blocks, free = set(blocks), set(free)
+        _take_free_blocks(c, parent["id"], sorted(blocks - free), version)
+        _insert_free_blocks(c, [(parent["id"], a, p) for a, p in free - blocks], version)
+        for n in networks:
+            c.execute("INSERT INTO networks (net, family, address, netmask) VALUES (?,?,?,?)",
+                    (str(n), version, n.address_bytes(), size))
+            ids.append(c.lastrowid)
+        _insert_free_blocks(c, [(i, n.address, size)
+            for i, n in zip(ids, networks)], version)
+        _insert_usage(c, {i : (0, 0) for i in ids})
+        _change_usage(c, parent["id"], count, count << (network.max_prefixlen - size))
+    else:
+        for n in networks:
+            try:
+                ids.append(_insert_net(c, n, claimed_from=network.prefixlen))
+            except _Conflict:
+                # undo the networks inserted so far
+                for i, inserted in zip(ids, networks):
+                    _delete_claimed(c, i, inserted)
+                raise
+
+    if tags:
+        c.executemany("INSERT INTO tags (network_id, tag_name, tag_value) VALUES (?,?,?)",
+                [(i, k, v) for i in ids for k, v in tags.items()])
+    for i, n in zip(ids, networks):
+        _trie_add(i, str(n), n.address, size, tags, version)
+    _cache_invalidate(version, address, network.prefixlen)
+    _log_changes(c, [(operation, str(n), k, v) for n in networks
+        for operation, k, v in [("add_net", None, None)] +
+            [("set_tag", k, v) for k, v in (tags or dict()).items()]])
+
+    return [str(n) for n in networks]
+
+@_cached
+def get_usage(net):
+    """
+    returns how much of a network is used by its direct children.
+    For networks in the database this is read from the usage counters and
+    the free blocks with a few index lookups, no matter how many networks
+    are within it. For other networks it is computed from their children.
+    The address counts are strings, they do not fit into xmlrpc integers.
+
+    :param net: the network in cidr notation
+    :returns: a dict with the "cidr", "network_in_database", the number of
+    "addresses", the number of "used" and "free" addresses, the number of
+    direct "children" and the cidr of the "largest_free" block (the first
+    one if there are several, None if the network is full).
+    """
+    try:
+        network = Prefix.parse(net)
+    except ValueError:
+        raise_fault("InvalidNetworkDescription")
+    address = network.address
+    version = network.version
+
+    with reading() as c:
+        c.execute("SELECT usage.children, usage.used, id FROM networks "
+                "JOIN usage ON network_id = id WHERE net = ?", (str(network),))
+        row = c.fetchone()
+        if row is not None:
+            children, used = row["children"], row["used"]
+            c.execute("SELECT address, netmask FROM free_blocks WHERE parent_id = ? "
+                    "ORDER BY netmask ASC, address ASC LIMIT 1", (row["id"],))
+            largest = c.fetchone()
+            if largest is not None:
+                largest = (largest["address"], largest["netmask"])
+        else:
+            nets = _top_level_nets(c, address, network.prefixlen, version=version)
+            children = len(nets)
+            used = sum(1 << (network.max_prefixlen - p) for a, p in nets)
+            free = free_prefixes(address, network.broadcast, nets,
+                    network.max_prefixlen)
+            largest = min(free, key=lambda b: (b[1], b[0])) if free else None
+
+    return {"cidr" : str(network),
+            "network_in_database" : row is not None,
+            "addresses" : str(network.num_addresses),
+            "used" : str(used),
+            "free" : str(network.num_addresses - used),
+            "children" : children,
+            "largest_free" : str(Prefix(*largest, version)) if largest is not None else None}
+
 def get_net_by_tag(tag_name):
     """
     :param tag_name: the tag to be searched for
     : returns : all networks with the given tag and the tag value.
     """
-    c = db_conn.cursor()
-
-    c.execute("SELECT net, tag_name, tag_value FROM networks JOIN tags ON id = network_id WHERE tag_name = ?", (tag_name,))
+    with reading() as c:
+        c.execute("SELECT net, tag_name, tag_value FROM networks JOIN tags ON id = network_id WHERE tag_name = ?", (tag_name,))
+        res = c.fetchall()
 
     data = list()
-    res = c.fetchall()
     for d in res:
         data.append({ k:d[k] for k in d.keys()})
 
     return data
 
+def _posting_list(c, tag_name, values=None):
+    """
+    returns the set of the ids of all networks with the tag, with values
+    only those where the tag has one of the values.
+    """
+    if values is None:
+        c.execute("SELECT network_id FROM tags WHERE tag_name = ?", (tag_name,))
+    else:
+        c.execute("SELECT network_id FROM tags WHERE tag_name = ? AND tag_value IN (%s)"
+                % ",".join("?" * len(values)), [tag_name] + list(values))
+    return {r[0] for r in c.fetchall()}
+
+def _evaluate_query(c, node, universe):
+    """
+    returns the set of the ids of the networks which match the tree of a
+    tag query. AND intersects the posting lists of its parts, starting
+    with the smallest one, and removes the ones of its negated parts.
+    :param universe: a function which returns the ids of all networks in
+    question, it is only called for negations without positive parts.
+    """
+    kind = node[0]
+    if kind == "has":
+        return _posting_list(c, node[1])
+    if kind == "in":
+        return _posting_list(c, node[1], node[2])
+    if kind == "or":
+        ids = set()
+        for n in node[1]:
+            ids |= _evaluate_query(c, n, universe)
+        return ids
+    if kind == "not":
+        return universe() - _evaluate_query(c, node[1], universe)
+
+    positives = sorted((_evaluate_query(c, n, universe) for n in node[1] if n[0] != "not"), key=len)
+    ids = set(positives[0]) if positives else universe()
+    for p in positives[1:]:
+        ids &= p
+    for n in node[1]:
+        if n[0] == "not" and ids:
+            ids -= _evaluate_query(c, n[1], universe)
+    return ids
+
+def _query_rows(c, tree, scope=None):
+    """
+    returns the rows (id, net, family, address, netmask) of the networks
+    which match a parsed query, unsorted.
+    :param scope: if given, only networks within this Prefix are returned.
+    """
+    scope_ids = None
+    def universe():
+        nonlocal scope_ids
+        if scope_ids is None:
+            if scope is None:
+                c.execute("SELECT id FROM networks")
+            else:
+                c.execute("SELECT id FROM networks WHERE family = ? AND netmask >= ? AND "
+                        "address >= ? AND address <= ?",
+                        (scope.version, scope.prefixlen, scope.address_bytes(),
+                            scope.broadcast_bytes()))
+            scope_ids = {r[0] for r in c.fetchall()}
+        return set(scope_ids)
+
+    ids = _evaluate_query(c, tree, universe)
+    if scope is not None and scope_ids is None:
+        # with a small scope it is cheaper to drop the ids outside of
+        # it before their networks are read
+        c.execute("SELECT COUNT(*) FROM networks WHERE family = ? AND netmask >= ? AND "
+                "address >= ? AND address <= ?",
+                (scope.version, scope.prefixlen, scope.address_bytes(),
+                    scope.broadcast_bytes()))
+        if c.fetchone()[0] < len(ids):
+            ids &= universe()
+
+    rows = _chunked_in(c, "SELECT id, net, family, address, netmask FROM networks "
+            "WHERE id IN (%s)", ids)
+    if scope is not None:
+        start, end = scope.address, scope.broadcast
+        rows = [r for r in rows if r["family"] == scope.version and
+                r["netmask"] >= scope.prefixlen and start <= r["address"] <= end]
+    return rows
+
+def query_nets(query, net=None, cursor=None, limit=1000):
+    """
+    returns the networks whose tags match a query expression like
+    vlan=10 AND site IN (a, b) AND NOT reserved, see minipam.tag_query for
+    the syntax. The query is answered from the posting lists of the tag
+    index. The networks are sorted by address and returned in pages like
+    get_net_page returns them.
+
+    :param query: the query expression
+    :param net: if given, only networks within this network are returned.
+    :param cursor: the cursor returned with the previous page, None for the first page.
+    :param limit: the maximum number of networks on the page
+    :returns: a dict with the list of net_dicts (without children) in
+    "nodes" and the cursor for the next page in "cursor".
+    :raises InvalidTagQuery: raised if the query is not a valid expression.
+    :raises InvalidLimit: raised if limit is not a positive integer.
+    """
+    try:
+        tree = tag_query.parse(query)
+    except ValueError:
+        raise_fault("InvalidTagQuery")
+    if not isinstance(limit, int) or limit < 1:
+        raise_fault("InvalidLimit")
+    try:
+        scope = Prefix.parse(net) if net is not None else None
+        position = Prefix.parse(cursor) if cursor is not None else None
+    except ValueError:
+        raise_fault("InvalidNetworkDescription")
+
+    with reading() as c:
+        rows = _query_rows(c, tree, scope)
+        rows.sort(key=lambda r: (r["family"], r["address"], r["netmask"]))
+        if position is not None:
+            position = (position.version, position.address, position.prefixlen)
+            rows = [r for r in rows if (r["family"], r["address"], r["netmask"]) > position]
+
+        nodes = dict()
+        for r in rows[:limit]:
+            nodes[r["id"]] = _net_dict(r)
+            del nodes[r["id"]]["children"]
+        _add_tags(c, nodes)
+
+    nodes = list(nodes.values())
+    return {"nodes" : nodes,
+            "cursor" : nodes[-1]["cidr"] if len(rows) > limit else None}
+
+def _net_ranges(nets, rows=()):
+    """
+    returns the merged address ranges of a cidr or a list of cidrs as dict
+    of sorted (start, end) lists by ip version.
+    :param rows: rows of the networks table whose ranges are added
+    """
+    ranges = {4 : list(), 6 : list()}
+    try:
+        for net in [nets] if isinstance(nets, str) else nets:
+            network = Prefix.parse(net)
+            ranges[network.version].append((network.address, network.broadcast))
+    except (ValueError, TypeError):
+        raise_fault("InvalidNetworkDescription")
+    for r in rows:
+        ranges[r["family"]].append((r["address"],
+            prefix_broadcast(r["address"], r["netmask"], MAX_PREFIXLEN[r["family"]])))
+    return {version : merge_ranges(sorted(r)) for version, r in ranges.items()}
+
+def _range_cidrs(ranges):
+    """
+    returns the smallest list of cidrs which covers the address ranges of
+    _net_ranges, IPv4 first.
+    """
+    return [format_prefix(address, prefixlen, version) for version in (4, 6)
+            for start, end in ranges[version]
+            for address, prefixlen in range_to_prefixes(start, end, MAX_PREFIXLEN[version])]
+
+def summarize(nets=(), query=None):
+    """
+    returns the smallest list of cidrs which covers exactly the addresses
+    of the given networks, like ipaddress.collapse_addresses.
+    :param nets: a network in cidr notation or a list of them
+    :param query: if given, the networks matching this tag query expression
+    like site=x are summarized together with nets, see query_nets.
+    :returns: a list of cidrs sorted by address, IPv4 first.
+    :raises InvalidTagQuery: raised if query is not a valid query expression.
+    """
+    if nets is None:
+        nets = ()
+    if query is None:
+        return _range_cidrs(_net_ranges(nets))
+    try:
+        tree = tag_query.parse(query)
+    except ValueError:
+        raise_fault("InvalidTagQuery")
+    with reading() as c:
+        rows = _query_rows(c, tree)
+    return _range_cidrs(_net_ranges(nets, rows))
+
+def free_blocks(net, min_size=None):
+    """
+    returns the parts of a network which are not used by the networks
+    within it as smallest list of cidrs. For networks in the database they
+    are read from the free space index.
+    :param net: the network in cidr notation
+    :param min_size: if given, only free blocks of at least this size are
+    returned, for example 24 for blocks of a /24 or larger.
+    :returns: a list of cidrs sorted by address
+    """
+    try:
+        network = Prefix.parse(net)
+    except ValueError:
+        raise_fault("InvalidNetworkDescription")
+    address = network.address
+    version = network.version
+    max_prefixlen = network.max_prefixlen
+    if min_size is None:
+        min_size = max_prefixlen
+    with reading() as c:
+        c.execute("SELECT id FROM networks WHERE net = ?", (str(network),))
+        row = c.fetchone()
+        if row is not None:
+            c.execute("SELECT address, netmask FROM free_blocks "
+                    "WHERE parent_id = ? AND netmask <= ? ORDER BY address", (row["id"], min_size))
+            blocks = [(r["address"], r["netmask"]) for r in c.fetchall()]
+        else:
+            children = _top_level_nets(c, address, network.prefixlen, version=version)
+            blocks = [(a, p) for a, p in free_prefixes(address, network.broadcast,
+                children, max_prefixlen) if p <= min_size]
+    return [format_prefix(a, p, version) for a, p in blocks]
+
+def diff(net_a, net_b):
+    """
+    returns the addresses of net_a which are not in net_b as smallest list
+    of cidrs.
+    :param net_a: a network in cidr notation or a list of them
+    :param net_b: a network in cidr notation or a list of them
+    :returns: a list of cidrs sorted by address, IPv4 first.
+    """
+    ranges_a = _net_ranges(net_a)
+    ranges_b = _net_ranges(net_b)
+    return _range_cidrs({version : subtract_ranges(ranges_a[version], ranges_b[version])
+        for version in (4, 6)})
+
 def add_tag(net, tag_name, tag_value):
     """
     adds a tag to the network
@@ -268,17 +1891,20 @@ def add_tag(net, tag_name, tag_value):
     :raises TagExists: raises a TagExists error if the tag already exists
     """
     try:
-        network = ip_network(net)
-        c = db_conn.cursor()
-        c.execute("INSERT INTO tags (network_id, tag_name, tag_value) "
-        "VALUES ((SELECT id FROM networks WHERE net = ?), ?, ?)",
-        (net, tag_name, tag_value));
+        network = Prefix.parse(net)
+        with transaction() as c:
+            c.execute("INSERT INTO tags (network_id, tag_name, tag_value) "
+            "VALUES ((SELECT id FROM networks WHERE net = ?), ?, ?)",
+            (str(network), tag_name, tag_value));
+            _trie_set_tag(network.address, network.prefixlen, tag_name, tag_value,
+                    version=network.version)
+            _cache_invalidate(network.version, network.address, network.prefixlen)
+            _log_changes(c, [("set_tag", str(network), tag_name, tag_value)])
     except ValueError:
         raise_fault("InvalidNetworkDescription")
     except sqlite3.IntegrityError:
         # TODO This captures to much, e.g. if someone wants to add a tag for a net that does not exist.
         raise_fault("TagExists")
-    db_conn.commit()
 
 def delete_tag(net, tag_name):
     """
@@ -289,15 +1915,19 @@ def delete_tag(net, tag_name):
     :returns: name and value of the deleted tag.
     """
     try:
-        network = ip_network(net)
-        c = db_conn.cursor()
-        c.execute("DELETE FROM tags WHERE network_id IN "
-                "(SELECT id AS network_id FROM networks WHERE net = ?) AND "
-                "tag_name = ?",
-                (str(network), tag_name))
+        network = Prefix.parse(net)
+        with transaction() as c:
+            c.execute("DELETE FROM tags WHERE network_id IN "
+                    "(SELECT id AS network_id FROM networks WHERE net = ?) AND "
+                    "tag_name = ?",
+                    (str(network), tag_name))
+            if c.rowcount > 0:
+                _log_changes(c, [("delete_tag", str(network), tag_name, None)])
+            _trie_set_tag(network.address, network.prefixlen, tag_name, None,
+                    delete=True, version=network.version)
+            _cache_invalidate(network.version, network.address, network.prefixlen)
     except ValueError:
         raise_fault("InvalidNetworkDescription")
-    db_conn.commit()
 
 def modify_tag(net, tag_name, tag_value):
     """
@@ -310,18 +1940,22 @@ def modify_tag(net, tag_name, tag_value):
     exist.
     """
     try:
-        network = ip_network(net)
-        c = db_conn.cursor()
-        c.execute("UPDATE tags SET tag_value = ? "
-                "WHERE network_id = (SELECT id FROM networks WHERE net = ?) "
-                "AND tag_name=?",
-                (tag_value, str(network), tag_name))
-        db_conn.commit()
-        if c.rowcount == 0:
-            raise_fault("TagDoesNotExist")
+        network = Prefix.parse(net)
+        with transaction() as c:
+            c.execute("UPDATE tags SET tag_value = ? "
+                    "WHERE network_id = (SELECT id FROM networks WHERE net = ?) "
+                    "AND tag_name=?",
+                    (tag_value, str(network), tag_name))
+            if c.rowcount == 0:
+                raise_fault("TagDoesNotExist")
+            _trie_set_tag(network.address, network.prefixlen, tag_name, tag_value,
+                    version=network.version)
+            _cache_invalidate(network.version, network.address, network.prefixlen)
+            _log_changes(c, [("set_tag", str(network), tag_name, tag_value)])
     except ValueError:
         raise_fault("InvalidNetworkDescription")
 
+@_cached
 def get_tag(net, tag_name):
     """
     returns the value of a tag for the given network.
@@ -333,21 +1967,27 @@ def get_tag(net, tag_name):
     exist.
     """
     try:
-        network = ip_network(net)
-        c = db_conn.cursor()
-        c.execute("SELECT tag_value FROM tags WHERE "
-                "network_id = (SELECT id FROM networks WHERE net = ?) AND "
-                "tag_name = ?",
-                (str(network), tag_name))
-        result = c.fetchone()
+        network = Prefix.parse(net)
+        trie = _read_trie(network.version)
+        if trie is not None:
+            record = trie.get(network.address, network.prefixlen)
+            if record is None or tag_name not in record["tags"]:
+                raise_fault("TagDoesNotExist")
+            return record["tags"][tag_name]
+        with reading() as c:
+            c.execute("SELECT tag_value FROM tags WHERE "
+                    "network_id = (SELECT id FROM networks WHERE net = ?) AND "
+                    "tag_name = ?",
+                    (str(network), tag_name))
+            result = c.fetchone()
         if result is None:
             raise_fault("TagDoesNotExist")
-        db_conn.commit()
         return result["tag_value"];
 
     except ValueError:
         raise_fault("InvalidNetworkDescription")
 
+@_cached
 def get_tags(net):
     """
     returns a dict of all tags for the given network.
@@ -358,34 +1998,455 @@ def get_tags(net):
     exist.
     """
     try:
-        network = ip_network(net)
-        c = db_conn.cursor()
-        c.execute("SELECT tag_name, tag_value FROM tags WHERE "
-                "network_id = (SELECT id FROM networks WHERE net = ?)",
-                (str(network),))
-        result = { r["tag_name"]:r["tag_value"] for r in c.fetchall() }
+        network = Prefix.parse(net)
+        trie = _read_trie(network.version)
+        if trie is not None:
+            record = trie.get(network.address, network.prefixlen)
+            return dict(record["tags"]) if record is not None else dict()
+        with reading() as c:
+            c.execute("SELECT tag_name, tag_value FROM tags WHERE "
+                    "network_id = (SELECT id FROM networks WHERE net = ?)",
+                    (str(network),))
+            result = { r["tag_name"]:r["tag_value"] for r in c.fetchall() }
         return result;
 
     except ValueError:
         raise_fault("InvalidNetworkDescription")
 
-def setup_xmlrpc_server():
-    server = SimpleXMLRPCServer((config.xmlrpc_address, config.xmlrpc_port), allow_none=True)
+def lookup_ip(ip):
+    """
+    returns the most specific network which contains the given ip address.
+
+    :param ip: an ip address
+    :returns: the net_dict of the network without children.
+    :raises NetworkNotInDatabase: raised if no network contains the address.
+    """
+    try:
+        version, address = parse_address(ip)
+    except ValueError:
+        raise_fault("InvalidNetworkDescription")
+
+    trie = _read_trie(version)
+    if trie is not None:
+        match = trie.longest_match(address)
+        if match is None:
+            raise_fault("NetworkNotInDatabase")
+        return get_net(match[2]["net"], depth=0)
+
+    with reading() as c:
+        match = _containing_net(c, address, MAX_PREFIXLEN[version], version)
+    if match is None:
+        raise_fault("NetworkNotInDatabase")
+    return get_net(match["net"], depth=0)
+
+# a merge join of the addresses with the networks between them is only done
+# if there are at most this many networks per address, otherwise every
+# address is looked up with its own index lookup
+_merge_join_factor = 32
+
+def _longest_matches(c, addresses, version=4):
+    """
+    finds the most specific network for every address with one scan over
+    the networks between the first and the last address. Both are walked in
+    order while a stack holds the networks which contain the current address.
+    :param addresses: a sorted list of distinct integer addresses
+    :returns: a dict mapping the addresses to the rows (id, net, address,
+    netmask) of their networks, addresses without a network are left out.
+    """
+    max_prefixlen = MAX_PREFIXLEN[version]
+    bounds = (version, address_to_bytes(addresses[0], version),
+            address_to_bytes(addresses[-1], version))
+    matches = dict()
+
+    c.execute("SELECT COUNT(*) FROM networks WHERE family = ? AND address > ? AND address <= ?",
+            bounds)
+    if c.fetchone()[0] > _merge_join_factor * len(addresses):
+        for a in addresses:
+            match = _containing_net(c, a, max_prefixlen, version)
+            if match is not None:
+                matches[a] = match
+        return matches
+
+    # the networks which contain the current address as (row, broadcast)
+    # tuples, each one contains the next one
+    stack = [(r, prefix_broadcast(r["address"], r["netmask"], max_prefixlen))
+            for r in _containing_nets(c, addresses[0], max_prefixlen, version=version)]
+    c.execute("SELECT id, net, address, netmask FROM networks "
+            "WHERE family = ? AND address > ? AND address <= ? "
+            "ORDER BY address ASC, netmask ASC", bounds)
+    row = c.fetchone()
+    for a in addresses:
+        while row is not None and row["address"] <= a:
+            while stack and stack[-1][1] < row["address"]:
+                stack.pop()
+            stack.append((row, prefix_broadcast(row["address"], row["netmask"], max_prefixlen)))
+            row = c.fetchone()
+        while stack and stack[-1][1] < a:
+            stack.pop()
+        if stack:
+            matches[a] = stack[-1][0]
+    return matches
+
+def lookup_ips(ips):
+    """
+    returns the most specific network for every address of a list.
+    All addresses are looked up together, see _longest_matches.
+
+    :param ips: a list of ip addresses
+    :returns: a list with the net_dict (without children) of the network of
+    every address in the order of ips, None for addresses which are not
+    within any network.
+    :raises InvalidNetworkDescription: raised if one of the ips is not an
+    ip address.
+    """
+    try:
+        addresses = [parse_address(ip) for ip in ips]
+    except ValueError:
+        raise_fault("InvalidNetworkDescription")
+
+    nodes = dict()
+    for version in MAX_PREFIXLEN:
+        wanted = sorted({a for v, a in addresses if v == version})
+        if not wanted:
+            continue
+        trie = _read_trie(version)
+        if trie is not None:
+            for a in wanted:
+                match = trie.longest_match(a)
+                if match is not None:
+                    nodes[version, a] = _net_dict(match[2])
+                    nodes[version, a]["tags"] = dict(match[2]["tags"])
+            continue
+        with reading() as c:
+            matches = _longest_matches(c, wanted, version)
+            by_id = {r["id"] : _net_dict(r) for r in matches.values()}
+            _add_tags(c, by_id)
+        nodes.update(((version, a), by_id[r["id"]]) for a, r in matches.items())
+
+    result = list()
+    for a in addresses:
+        node = nodes.get(a)
+        result.append(dict(node) if node is not None else None)
+    return result
+
+# if an import has more top level networks than this, the free blocks of all
+# networks are rebuilt instead of the ones around every top level network
+_import_rebuild_limit = 100000
+
+def _merge_tops(tops, prefixes):
+    """
+    merges (version, address, prefixlen) tuples into the sorted list of top
+    level prefixes. Prefixes within another prefix are dropped.
+    :returns: the new list of top level prefixes
+    """
+    merged = list()
+    broadcast = None
+    for version, address, prefixlen in heapq.merge(tops, sorted(prefixes)):
+        if merged and merged[-1][0] == version and address <= broadcast:
+            continue
+        merged.append((version, address, prefixlen))
+        broadcast = prefix_broadcast(address, prefixlen, MAX_PREFIXLEN[version])
+    return merged
+
+def _update_free_blocks(c, tops):
+    """
+    recomputes the free blocks of all networks within the top level prefixes
+    and of the networks which directly contain them.
+    :param tops: the top level prefixes of _merge_tops or None to rebuild
+    the free blocks of all networks.
+    """
+    if tops is None:
+        blocks, usage = _expected_free_space(c)
+        c.execute("DELETE FROM free_blocks")
+        c.execute("DELETE FROM usage")
+        _rebuild_free_blocks(c, blocks)
+        _insert_usage(c, usage)
+        return
+
+    parents = dict()
+    for version, address, prefixlen in tops:
+        c.execute("DELETE FROM free_blocks WHERE parent_id IN "
+                "(SELECT id FROM networks WHERE family = ? AND netmask >= ? AND "
+                "address >= ? AND address <= ?)",
+                (version, prefixlen, address_to_bytes(address, version), address_to_bytes(
+                    prefix_broadcast(address, prefixlen, MAX_PREFIXLEN[version]), version)))
+        blocks, usage = _expected_free_space(c, version, address, prefixlen)
+        _rebuild_free_blocks(c, blocks)
+        _insert_usage(c, usage)
+        if prefixlen > 0:
+            parent = _containing_net(c, address, prefixlen - 1, version)
+            if parent is not None:
+                parents[parent["id"]] = (parent, version)
+
+    # the parents lost the space of their new children
+    for id, (parent, version) in parents.items():
+        max_prefixlen = MAX_PREFIXLEN[version]
+        children = _top_level_nets(c, parent["address"], parent["netmask"], version=version)
+        c.execute("DELETE FROM free_blocks WHERE parent_id = ?", (id,))
+        _insert_free_blocks(c, [(id, a, p) for a, p in free_prefixes(parent["address"],
+            prefix_broadcast(parent["address"], parent["netmask"], max_prefixlen),
+            children, max_prefixlen)], version)
+        _insert_usage(c, {id : (len(children),
+            sum(1 << (max_prefixlen - p) for a, p in children))})
+
+def _import_tags(c, tags):
+    """
+    sets the tags of a batch of imported networks. The ids of the networks
+    are looked up with one query per 900 networks instead of one per tag.
+    :param tags: a list of (cidr, tag name, tag value) tuples
+    :returns: the number of set tags
+    """
+    ids = {r["net"] : r["id"] for r in _chunked_in(c,
+            "SELECT id, net FROM networks WHERE net IN (%s)", {n for n, k, v in tags})}
+    c.executemany("INSERT OR REPLACE INTO tags (network_id, tag_name, tag_value) VALUES (?,?,?)",
+            [(ids[n], k, v) for n, k, v in tags])
+    return len(tags)
+
+def _reload_trie():
+    """
+    loads the tries again after many networks were changed at once.
+    """
+    if _tries is not None:
+        _load_trie(db_conn.cursor())
+
+def import_nets(rows, *, progress=None, batch_size=10000):
+    """
+    adds many networks and their tags in one transaction. Networks which
+    already exist are kept, the imported tags replace existing tags with the
+    same name. The rows are read and validated in batches, so rows can be an
+    iterator over a large file.
+
+    :param rows: an iterable of (cidr, tags) pairs, tags is a dict of tag
+    names and values.
+    :param progress: if given, it is called with the number of imported rows
+    after every batch. Like batch_size it is keyword only, so clients of
+    the rpc servers can not pass them.
+    :param batch_size: how many rows are validated and inserted at once.
+    :returns: a dict with the number of added "networks" and of set "tags".
+    :raises InvalidNetworkDescription: raised if a row is not a valid
+    network. Nothing is imported then.
+    """
+    added = tagged = done = 0
+    tops = list()
+    rows = iter(rows)
+    with transaction() as c:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            networks = list()
+            prefixes = list()
+            tags = list()
+            try:
+                for cidr, net_tags in batch:
+                    network = Prefix.parse(cidr)
+                    networks.append((str(network), network.version,
+                        network.address_bytes(), network.prefixlen))
+                    prefixes.append((network.version, network.address,
+                        network.prefixlen))
+                    tags.extend((str(network), str(k), str(v)) for k, v in net_tags.items())
+            except (ValueError, TypeError, AttributeError):
+                raise_fault("InvalidNetworkDescription")
+
+            c.executemany("INSERT OR IGNORE INTO networks (net, family, address, netmask) "
+                    "VALUES (?,?,?,?)", networks)
+            added += c.rowcount
+            tagged += _import_tags(c, tags)
+            # existing networks are logged too, add_net entries only say that a network exists
+            _log_changes(c, [("add_net", n[0], None, None) for n in networks] +
+                    [("set_tag", n, k, v) for n, k, v in tags])
+            if tops is not None:
+                tops = _merge_tops(tops, prefixes)
+                if len(tops) > _import_rebuild_limit:
+                    tops = None
+            done += len(batch)
+            if progress is not None:
+                progress(done)
+
+        _update_free_blocks(c, tops)
+        if _tries is not None:
+            _after_commit.append(_reload_trie)
+        _cache_invalidate()
+    return {"networks" : added, "tags" : tagged}
+
+def changes_since(seq=None, limit=1000):
+    """
+    returns the changes made after the change with the sequence number seq,
+    oldest first. A consumer takes the current sequence number with
+    changes_since(None) before it reads the networks and then passes the
+    returned "seq" to the next call.
+    The operations are "add_net" and "delete_net" with the cidr in "net"
+    and "set_tag" and "delete_tag" with the tag in "tag_name" and
+    "tag_value". The tags of deleted networks are deleted without entries
+    of their own and add_net entries can name networks which existed before.
+    :param seq: the sequence number of the last change the consumer has seen
+    or None to only get the current sequence number.
+    :param limit: the maximal number of returned changes
+    :returns: a dict with the "changes", each a dict with "seq", "time",
+    "operation", "net", "tag_name" and "tag_value", "seq", the sequence
+    number of the last returned change, and "more", True if there are
+    more changes.
+    :raises ChangesCompacted: raised if changes after seq were already
+    deleted by the compaction of the change log. The consumer has to read
+    the networks again then.
+    :raises InvalidLimit: raised if limit is not a positive integer.
+    """
+    if not isinstance(limit, int) or limit < 1:
+        raise_fault("InvalidLimit")
+    with reading() as c:
+        c.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'")
+        row = c.fetchone()
+        latest = row["seq"] if row is not None else 0
+        if seq is None:
+            return {"changes" : [], "seq" : latest, "more" : False}
+        c.execute("SELECT seq, time, operation, net, tag_name, tag_value FROM changes "
+                "WHERE seq > ? ORDER BY seq LIMIT ?", (seq, limit + 1))
+        rows = c.fetchall()
+    # the sequence numbers have no gaps, compaction deletes from the start
+    if (rows and rows[0]["seq"] != seq + 1) or (not rows and seq < latest):
+        raise_fault("ChangesCompacted")
+    changes = [dict(r) for r in rows[:limit]]
+    return {"changes" : changes,
+            "seq" : changes[-1]["seq"] if changes else seq,
+            "more" : len(rows) > limit}
+
+def changes_within(net, seq=None, limit=1000):
+    """
+    returns the changes after seq of the networks which overlap net, like
+    changes_since. All changes after seq are read, so this is only cheap for
+    consumers which keep up.
+    :param net: the network in cidr notation
+    :param seq: the sequence number of the last change the consumer has seen
+    or None to only get the current sequence number.
+    :param limit: the maximal number of returned changes
+    :returns: a dict with the "changes", "seq", the sequence number of the
+    last read change, and "more", True if there can be more changes.
+    :raises ChangesCompacted: see changes_since
+    """
+    try:
+        network = Prefix.parse(net)
+    except ValueError:
+        raise_fault("InvalidNetworkDescription")
+    changes = list()
+    while True:
+        page = changes_since(seq, limit)
+        for change in page["changes"]:
+            seq = change["seq"]
+            if network.overlaps(Prefix.parse(change["net"])):
+                changes.append(change)
+                if len(changes) == limit:
+                    return {"changes" : changes, "seq" : seq, "more" : True}
+        if not page["more"]:
+            return {"changes" : changes, "seq" : page["seq"], "more" : False}
+        seq = page["seq"]
+
+def compact_changes():
+    """
+    deletes the entries of the change log which are older than
+    config.change_retention or beyond config.change_retention_entries.
+    This is also done after every 1000 changes.
+    :returns: the number of deleted entries
+    """
+    with transaction() as c:
+        return _compact_changes(c)
+
+def get_cache_stats():
+    """
+    returns the statistics of the response cache.
+    :returns: a dict with the "size" of the cache, the number of cached
+    "entries" and the numbers of "hits", "misses", "evictions" and
+    "invalidations". All are 0 if the cache is disabled.
+    """
+    cache = _cache
+    if cache is None:
+        return ResponseCache(0).stats()
+    return cache.stats()
+
+def get_metrics():
+    """
+    returns the metrics of the called functions, see config.metrics.
+    :returns: a dict with "methods", the calls, errors, faults by fault code,
+    latency histogram, sqlite queries, sqlite seconds and fetched rows of
+    every called function by name, and "cache", see get_cache_stats.
+    """
+    return {"methods" : metrics.snapshot(), "cache" : get_cache_stats()}
+
+def batch(ops):
+    """
+    applies a list of calls in one transaction. If one of them fails, none
+    of the changes are applied.
+
+    :param ops: a list of {"methodName" : name, "params" : [parameters]}
+    dicts, the same format system.multicall uses.
+    :returns: a list with the results of the calls.
+    :raises InvalidBatchOperation: raised if an entry does not name a
+    function of minipam.
+    """
+    results = list()
+    with transaction():
+        for op in ops:
+            try:
+                function = rpc_functions[op["methodName"]]
+                params = op.get("params", list())
+            except (KeyError, TypeError, AttributeError):
+                raise_fault("InvalidBatchOperation")
+            if function is batch:
+                raise_fault("InvalidBatchOperation")
+            results.append(function(*params))
+    return results
+
+# the functions offered over rpc by their name
+rpc_functions = { f.__name__ : f for f in [
+    get_net,
+    get_net_page,
+    add_net,
+    delete_net,
+    claim_net,
+    claim_nets,
+    get_usage,
+    get_net_by_tag,
+    query_nets,
+    get_tag,
+    add_tag,
+    delete_tag,
+    modify_tag,
+    get_tags,
+    lookup_ip,
+    lookup_ips,
+    summarize,
+    free_blocks,
+    diff,
+    import_nets,
+    changes_since,
+    changes_within,
+    compact_changes,
+    get_cache_stats,
+    get_metrics,
+    batch,
+    ]}
+
+def create_xmlrpc_server():
+    """
+    creates the xmlrpc server with all functions registered.
+    """
+    from minipam.xmlrpc_server import MinipamXMLRPCServer, PooledMinipamXMLRPCServer
+    address = (config.xmlrpc_address, config.xmlrpc_port)
+    if config.xmlrpc_workers > 0:
+        server = PooledMinipamXMLRPCServer(address, allow_none=True,
+                workers=config.xmlrpc_workers)
+    else:
+        server = MinipamXMLRPCServer(address, allow_none=True)
     server.register_introspection_functions()
     server.register_multicall_functions()
-    server.register_function(get_net, "get_net")
-    server.register_function(add_net, "add_net")
-    server.register_function(delete_net, "delete_net")
-    server.register_function(claim_net, "claim_net")
-    server.register_function(get_net_by_tag,"get_net_by_tag")
-    server.register_function(get_tag, "get_tag")
-    server.register_function(add_tag, "add_tag")
-    server.register_function(delete_tag, "delete_tag")
-    server.register_function(modify_tag, "modify_tag")
-    server.register_function(get_tags, "get_tags")
+    for name, function in rpc_functions.items():
+        server.register_function(metrics.instrument(name, function), name)
+    return server
+
+def setup_xmlrpc_server():
+    server = create_xmlrpc_server()
 
     try:
-        server.serve_forever()
+        server.serve_forever(poll_interval=config.group_commit or 0.5)
     except KeyboardInterrupt:
         server.shutdown()
         close_database_connection()
@@ -0,0 +1,115 @@
+import re
+
+# The expressions of query_nets, for example
+#
+#     vlan=10 AND site IN (a, b) AND NOT reserved
+#
+# A bare tag name matches all networks which have that tag, name=value and
+# name IN (value, ...) match the networks where the tag has one of the values.
+# They can be combined with AND, OR, NOT and parentheses, NOT binds stronger
+# than AND and AND binds stronger than OR. Values with spaces or special
+# characters can be quoted with " or '.
+#
+# parse() turns an expression into a tree of tuples:
+#     ("has", name)
+#     ("in", name, [values])
+#     ("and", [nodes]), ("or", [nodes]), ("not", node)
+
+_token = re.compile(r"""\s*(?:(?P<symbol>[(),=])|"(?P<dquoted>[^"]*)"|'(?P<squoted>[^']*)'|(?P<word>[^\s(),="']+))""")
+
+_keywords = {"AND", "OR", "NOT", "IN"}
+
+def _tokenize(query):
+    """
+    splits the query into (kind, text) tuples, kind is "symbol", "keyword",
+    or "word". Quoted strings are words, even if they look like keywords.
+    """
+    if not isinstance(query, str):
+        raise ValueError("the query has to be a string, not %s" % type(query).__name__)
+    tokens = list()
+    position = 0
+    query = query.rstrip()
+    while position < len(query):
+        match = _token.match(query, position)
+        if match is None:
+            raise ValueError("unexpected character at %d" % position)
+        position = match.end()
+        if match.group("symbol") is not None:
+            tokens.append(("symbol", match.group("symbol")))
+        elif match.group("word") is not None:
+            word = match.group("word")
+            tokens.append(("keyword", word.upper()) if word.upper() in _keywords else ("word", word))
+        else:
+            tokens.append(("word", match.group("dquoted") if match.group("dquoted") is not None
+                else match.group("squoted")))
+    return tokens
+
+class _Parser:
+    def __init__(self, query):
+        self.tokens = _tokenize(query)
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return (None, None)
+
+    def take(self, kind, text=None):
+        token = self.peek()
+        if token[0] != kind or (text is not None and token[1] != text):
+            raise ValueError("expected %s but got %s" % (text or kind, token[1]))
+        self.position += 1
+        return token[1]
+
+    def expression(self):
+        nodes = [self.conjunction()]
+        while self.peek() == ("keyword", "OR"):
+            self.take("keyword")
+            nodes.append(self.conjunction())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def conjunction(self):
+        nodes = [self.negation()]
+        while self.peek() == ("keyword", "AND"):
+            self.take("keyword")
+            nodes.append(self.negation())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def negation(self):
+        if self.peek() == ("keyword", "NOT"):
+            self.take("keyword")
+            return ("not", self.negation())
+        return self.predicate()
+
+    def predicate(self):
+        if self.peek() == ("symbol", "("):
+            self.take("symbol")
+            node = self.expression()
+            self.take("symbol", ")")
+            return node
+        name = self.take("word")
+        if self.peek() == ("symbol", "="):
+            self.take("symbol")
+            return ("in", name, [self.take("word")])
+        if self.peek() == ("keyword", "IN"):
+            self.take("keyword")
+            self.take("symbol", "(")
+            values = [self.take("word")]
+            while self.peek() == ("symbol", ","):
+                self.take("symbol")
+                values.append(self.take("word"))
+            self.take("symbol", ")")
+            return ("in", name, values)
+        return ("has", name)
+
+def parse(query):
+    """
+    parses a tag query expression.
+    :returns: the tree of the expression
+    :raises ValueError: raised if the query is not a valid expression
+    """
+    parser = _Parser(query)
+    node = parser.expression()
+    if parser.peek()[0] is not None:
+        raise ValueError("unexpected %s" % parser.peek()[1])
+    return node
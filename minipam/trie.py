@@ -0,0 +1,164 @@
+class _Node:
+    """
+    a node of the PrefixTrie. Nodes without a value are only there to
+    branch into two subtrees.
+    """
+    __slots__ = ("address", "prefixlen", "value", "children")
+
+    def __init__(self, address, prefixlen, value=None):
+        self.address = address
+        self.prefixlen = prefixlen
+        self.value = value
+        self.children = [None, None]
+
+class PrefixTrie:
+    """
+    A path compressed binary trie (patricia trie) over the prefixes of one
+    address family. Prefixes are given as integer address and prefix length,
+    every prefix can hold one value.
+    """
+    def __init__(self, max_prefixlen=32):
+        self.max_prefixlen = max_prefixlen
+        self.root = _Node(0, 0)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _bit(self, address, prefixlen):
+        """
+        returns the bit after the first prefixlen bits of the address.
+        """
+        return (address >> (self.max_prefixlen - prefixlen - 1)) & 1
+
+    def _common_prefixlen(self, a, b, limit):
+        """
+        returns the length of the common prefix of the addresses a and b,
+        but at most limit.
+        """
+        diff = (a ^ b) >> (self.max_prefixlen - limit)
+        return limit - diff.bit_length()
+
+    def _contains(self, node, address, prefixlen):
+        """
+        whether the prefix of the node contains address/prefixlen.
+        """
+        return (node.prefixlen <= prefixlen and
+                self._common_prefixlen(node.address, address, node.prefixlen) == node.prefixlen)
+
+    def insert(self, address, prefixlen, value):
+        """
+        stores value for the prefix address/prefixlen, replaces the old value
+        if the prefix is already in the trie.
+        """
+        node = self.root
+        while node.prefixlen != prefixlen:
+            bit = self._bit(address, node.prefixlen)
+            child = node.children[bit]
+            if child is None:
+                node.children[bit] = _Node(address, prefixlen, value)
+                self.size += 1
+                return
+            common = self._common_prefixlen(child.address, address,
+                    min(child.prefixlen, prefixlen))
+            if common == child.prefixlen:
+                node = child
+                continue
+            if common == prefixlen:
+                # the new prefix contains the child
+                new = _Node(address, prefixlen, value)
+                new.children[self._bit(child.address, prefixlen)] = child
+            else:
+                # the new prefix and the child only share a shorter prefix
+                mask = ((1 << common) - 1) << (self.max_prefixlen - common)
+                new = _Node(address & mask, common)
+                new.children[self._bit(child.address, common)] = child
+                new.children[self._bit(address, common)] = _Node(address, prefixlen, value)
+            node.children[bit] = new
+            self.size += 1
+            return
+        if node.value is None:
+            self.size += 1
+        node.value = value
+
+    def get(self, address, prefixlen):
+        """
+        returns the value of the prefix or None if it is not in the trie.
+        """
+        node = self.root
+        while node is not None and node.prefixlen < prefixlen:
+            node = node.children[self._bit(address, node.prefixlen)]
+        if node is None or node.prefixlen != prefixlen or node.address != address:
+            return None
+        return node.value
+
+    def remove(self, address, prefixlen):
+        """
+        removes the prefix from the trie.
+        :returns: the value of the removed prefix or None if it was not in the trie.
+        """
+        path = [self.root]
+        while path[-1].prefixlen < prefixlen:
+            child = path[-1].children[self._bit(address, path[-1].prefixlen)]
+            if child is None:
+                return None
+            path.append(child)
+        node = path[-1]
+        if node.prefixlen != prefixlen or node.address != address or node.value is None:
+            return None
+        value = node.value
+        node.value = None
+        self.size -= 1
+
+        # remove nodes which are no longer needed for branching
+        while len(path) > 1 and path[-1].value is None:
+            node = path.pop()
+            children = [c for c in node.children if c is not None]
+            if len(children) == 2:
+                break
+            parent = path[-1]
+            parent.children[parent.children.index(node)] = children[0] if children else None
+        return value
+
+    def longest_match(self, address, prefixlen=None):
+        """
+        returns the most specific prefix which contains address/prefixlen
+        as (address, prefixlen, value) tuple or None if there is none.
+        """
+        if prefixlen is None:
+            prefixlen = self.max_prefixlen
+        node = self.root
+        match = None
+        while node is not None and self._contains(node, address, prefixlen):
+            if node.value is not None:
+                match = node
+            if node.prefixlen == prefixlen:
+                break
+            node = node.children[self._bit(address, node.prefixlen)]
+        if match is None:
+            return None
+        return (match.address, match.prefixlen, match.value)
+
+    def subtree(self, address, prefixlen):
+        """
+        yields all prefixes within address/prefixlen (including the prefix
+        itself) as (address, prefixlen, value) tuples sorted by address and
+        prefix length.
+        """
+        node = self.root
+        while node is not None and node.prefixlen < prefixlen:
+            if not self._contains(node, address, prefixlen):
+                return
+            node = node.children[self._bit(address, node.prefixlen)]
+        if node is None or self._common_prefixlen(node.address, address, prefixlen) != prefixlen:
+            return
+
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.value is not None:
+                yield (node.address, node.prefixlen, node.value)
+            if node.children[1] is not None:
+                stack.append(node.children[1])
+            if node.children[0] is not None:
+                stack.append(node.children[0])
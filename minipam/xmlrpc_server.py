@@ -0,0 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
+from xmlrpc.server import SimpleXMLRPCServer
+
+from minipam.server import flush_group_commit
+
+# The xmlrpc server classes. They live in their own module so that using
+# minipam.server as a library does not import the xmlrpc and http modules.
+
+class MinipamXMLRPCServer(SimpleXMLRPCServer):
+    # the default of 5 refuses connections as soon as a few clients wait
+    request_queue_size = 128
+
+    def service_actions(self):
+        # commit the writes held back by group commit once their window is over
+        flush_group_commit()
+
+class PooledMinipamXMLRPCServer(MinipamXMLRPCServer):
+    """
+    handles the requests with a fixed pool of worker threads.
+    """
+    def __init__(self, *args, workers, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = ThreadPoolExecutor(workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown()
@@ -2,6 +2,12 @@ from minipam.server import *
 
 if __name__ == "__main__":
     start_database_connection()
+    if config.json_port is not None:
+        from minipam.json_server import start_json_server_thread
+        start_json_server_thread()
+    if config.metrics_port is not None:
+        from minipam.metrics import start_metrics_server_thread
+        start_metrics_server_thread(get_metrics)
     setup_xmlrpc_server()
 
 
@@ -3,6 +3,17 @@
 import unittest
 from test.net_methods import *
 from test.tag_methods import *
+from test.query_plans import *
+from test.trie_index import *
+from test.free_space import *
+from test.transactions import *
+from test.concurrency import *
+from test.json_methods import *
+from test.bulk_methods import *
+from test.cache import *
+from test.metrics import *
+from test.local import *
+from test.changes import *
 
-unittest.main()
-
+if __name__ == "__main__":
+    unittest.main()
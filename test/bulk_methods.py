@@ -0,0 +1,107 @@
+import io
+import unittest
+
+from os import remove
+from xmlrpc.server import Fault
+from minipam import bulk
+from minipam import server
+from minipam.server import *
+
+class TestImportNets(unittest.TestCase):
+    def setUp(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        config.database_file = "test.db"
+        start_database_connection()
+        add_net("10.0.0.0/8")
+
+    def tearDown(self):
+        close_database_connection()
+        remove("test.db")
+
+    def assertConsistent(self):
+        self.assertFalse(server._check_free_blocks(server.db_conn.cursor()))
+
+    def test_import_nets_normal(self):
+        rows = [("10.1.0.0/16", {"name" : "a"}),
+                ("10.1.0.0/24", {}),
+                ("10.1.1.0/24", {"name" : "b", "vlan" : "2"}),
+                ("2001:db8::/32", {"name" : "c"})]
+        result = import_nets(rows)
+        self.assertEqual(result, {"networks" : 4, "tags" : 4})
+        result = get_net("10.0.0.0/8")
+        self.assertEqual(result["children"][0]["cidr"], "10.1.0.0/16")
+        self.assertEqual(len(result["children"][0]["children"]), 2)
+        self.assertEqual(get_tags("10.1.1.0/24"), {"name" : "b", "vlan" : "2"})
+        self.assertEqual(get_tags("2001:db8::/32"), {"name" : "c"})
+        self.assertConsistent()
+
+    def test_import_nets_existing(self):
+        add_net("10.1.0.0/16")
+        add_tag("10.1.0.0/16", "name", "old")
+        result = import_nets([("10.1.0.0/16", {"name" : "new"}), ("10.0.0.0/8", {})])
+        self.assertEqual(result["networks"], 0)
+        self.assertEqual(get_tag("10.1.0.0/16", "name"), "new")
+        self.assertConsistent()
+
+    def test_import_nets_many_tags(self):
+        # more networks than fit into one IN list of a statement
+        rows = [(str(ip_network(((10 << 24) + (i << 8), 24))), {"name" : str(i)})
+                for i in range(2000)]
+        self.assertEqual(import_nets(rows), {"networks" : 2000, "tags" : 2000})
+        self.assertEqual(get_tags("10.7.207.0/24"), {"name" : "1999"})
+        children = get_net("10.0.0.0/8", 1)["children"]
+        self.assertEqual([n["tags"] for n in children], [r[1] for r in rows])
+        flat = get_net("10.0.0.0/8", 1, "flat")
+        self.assertEqual(flat["tags"]["name"], [None] + [str(i) for i in range(2000)])
+        page = query_nets("name", limit=5000)
+        self.assertEqual([n["cidr"] for n in page["nodes"]], [r[0] for r in rows])
+        self.assertConsistent()
+
+    def test_import_nets_batches(self):
+        progress = list()
+        rows = [(str(ip_network(((10 << 24) + (i << 8), 24))), {"name" : str(i)})
+                for i in range(250)]
+        rows.append(("10.0.0.0/9", dict()))
+        import_nets(rows, progress=progress.append, batch_size=100)
+        self.assertEqual(progress, [100, 200, 251])
+        self.assertEqual(len(get_net("10.0.0.0/8", 1)["children"]), 1)
+        self.assertEqual(len(get_net("10.0.0.0/9", 1)["children"]), 250)
+        self.assertEqual(claim_net("10.0.0.0/9", 24)["cidr"], "10.0.250.0/24")
+        self.assertConsistent()
+
+    def test_import_nets_full_rebuild(self):
+        limit = server._import_rebuild_limit
+        server._import_rebuild_limit = 2
+        try:
+            import_nets([("10.%d.0.0/16" % i, dict()) for i in range(5)])
+        finally:
+            server._import_rebuild_limit = limit
+        self.assertConsistent()
+
+    def test_import_nets_invalid(self):
+        with self.assertRaises(Fault) as cm:
+            import_nets([("10.1.0.0/16", dict()), ("10.1.0.1/16", dict())], batch_size=1)
+        self.assertEqual(cm.exception.faultString, "InvalidNetworkDescription")
+        self.assertEqual(get_net("10.0.0.0/8")["children"], list())
+        self.assertConsistent()
+
+    def test_export_import_round_trip(self):
+        claim_nets("10.0.0.0/8", 16, 3, {"name" : "pool"})
+        add_net("2001:db8::/32")
+        add_tag("10.0.0.0/8", "vlan", "1")
+        rows = list(bulk.export_rows())
+        for format in ["csv", "jsonl"]:
+            f = io.StringIO()
+            bulk.write_rows(f, rows, format, bulk.tag_names())
+            f.seek(0)
+            self.assertEqual(list(bulk.read_rows(f, format)), rows)
+
+        close_database_connection()
+        remove("test.db")
+        start_database_connection()
+        import_nets(rows)
+        self.assertEqual(list(bulk.export_rows()), rows)
+        self.assertConsistent()
@@ -0,0 +1,199 @@
+import unittest
+
+from os import remove
+from minipam import server
+from minipam.cache import ResponseCache
+from minipam.server import *
+from test.net_methods import *
+from test.tag_methods import *
+from test.transactions import *
+from test.free_space import *
+from test.bulk_methods import *
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(3)
+
+    def put(self, key, address, prefixlen, version=4):
+        self.cache.put(key, (version, address, prefixlen), key, self.cache.generation)
+
+    def test_lru_eviction(self):
+        self.put("a", 0, 8)
+        self.put("b", 1 << 24, 8)
+        self.put("c", 2 << 24, 8)
+        self.assertEqual(self.cache.get("a"), "a")
+        self.put("d", 3 << 24, 8)
+        self.assertEqual(self.cache.get("b"), None)
+        self.assertEqual(self.cache.get("a"), "a")
+        stats = self.cache.stats()
+        self.assertEqual((stats["entries"], stats["hits"], stats["misses"], stats["evictions"]),
+                (3, 2, 1, 1))
+
+    def test_invalidate_overlapping(self):
+        self.put("parent", 10 << 24, 8)
+        self.put("child", (10 << 24) + (1 << 16), 16)
+        self.put("sibling", (10 << 24) + (2 << 16), 16)
+        self.cache.invalidate(4, (10 << 24) + (1 << 16) + 256, 24)
+        self.assertEqual(self.cache.get("parent"), None)
+        self.assertEqual(self.cache.get("child"), None)
+        self.assertEqual(self.cache.get("sibling"), "sibling")
+        self.assertEqual(self.cache.stats()["invalidations"], 2)
+
+    def test_invalidate_within(self):
+        self.put("a", (10 << 24) + (1 << 16), 16)
+        self.put("b", (10 << 24) + (2 << 16), 24)
+        self.put("c", 11 << 24, 8)
+        self.cache.invalidate(4, 10 << 24, 8)
+        self.assertEqual([self.cache.get(k) for k in "abc"], [None, None, "c"])
+
+    def test_invalidate_other_family(self):
+        self.put("a", 0, 0, version=6)
+        self.cache.invalidate(4, 0, 0)
+        self.assertEqual(self.cache.get("a"), "a")
+
+    def test_outdated_generation(self):
+        generation = self.cache.generation
+        self.cache.invalidate(4, 10 << 24, 8)
+        self.cache.put("a", (4, 0, 0), "a", generation)
+        self.assertEqual(self.cache.get("a"), None)
+
+    def test_clear(self):
+        self.put("a", 0, 8)
+        self.cache.clear()
+        self.assertEqual(self.cache.get("a"), None)
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+class TestResponseCacheMethods(unittest.TestCase):
+    def setUp(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        config.database_file = "test.db"
+        config.response_cache_size = 100
+        start_database_connection()
+        add_net("10.0.0.0/8")
+        add_net("10.1.0.0/16")
+        add_net("10.2.0.0/16")
+
+    def tearDown(self):
+        close_database_connection()
+        config.response_cache_size = 0
+        remove("test.db")
+
+    def test_hits(self):
+        first = get_net("10.0.0.0/8")
+        self.assertIs(get_net("10.0.0.0/8"), first)
+        self.assertIsNot(get_net("10.0.0.0/8", 0), first)
+        self.assertIs(get_net("10.0.0.0/8", depth=-1), first)
+        stats = get_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 2))
+
+    def test_add_net_invalidates_overlapping(self):
+        get_net("10.0.0.0/8")
+        sibling = get_net("10.2.0.0/16")
+        add_net("10.1.1.0/24")
+        self.assertEqual(get_net("10.0.0.0/8")["children"][0]["children"][0]["cidr"],
+                "10.1.1.0/24")
+        self.assertIs(get_net("10.2.0.0/16"), sibling)
+
+    def test_delete_net_invalidates(self):
+        get_net("10.1.0.0/16")
+        delete_net("10.1.0.0/16")
+        self.assertFalse(get_net("10.1.0.0/16")["network_in_database"])
+
+    def test_claim_net_invalidates(self):
+        get_net("10.2.0.0/16")
+        claimed = claim_net("10.2.0.0/16", 24)
+        self.assertEqual(get_net("10.2.0.0/16")["children"][0]["cidr"], claimed["cidr"])
+
+    def test_tags_invalidate(self):
+        self.assertEqual(get_tags("10.1.0.0/16"), {})
+        add_tag("10.1.0.0/16", "vlan", "10")
+        self.assertEqual(get_tags("10.1.0.0/16"), {"vlan" : "10"})
+        self.assertEqual(get_tag("10.1.0.0/16", "vlan"), "10")
+        modify_tag("10.1.0.0/16", "vlan", "20")
+        self.assertEqual(get_tag("10.1.0.0/16", "vlan"), "20")
+        self.assertEqual(get_net("10.0.0.0/8")["children"][0]["tags"], {"vlan" : "20"})
+        delete_tag("10.1.0.0/16", "vlan")
+        self.assertEqual(get_tags("10.1.0.0/16"), {})
+
+    def test_faults_are_not_cached(self):
+        with self.assertRaises(Fault):
+            get_tag("10.1.0.0/16", "vlan")
+        add_tag("10.1.0.0/16", "vlan", "10")
+        self.assertEqual(get_tag("10.1.0.0/16", "vlan"), "10")
+
+    def test_not_cached_in_transactions(self):
+        get_tags("10.1.0.0/16")
+        with transaction():
+            add_tag("10.1.0.0/16", "vlan", "10")
+            self.assertEqual(get_tags("10.1.0.0/16"), {"vlan" : "10"})
+        self.assertEqual(get_tags("10.1.0.0/16"), {"vlan" : "10"})
+
+    def test_rollback_keeps_cache(self):
+        tags = get_tags("10.1.0.0/16")
+        with self.assertRaises(Fault) as cm:
+            batch([{"methodName" : "add_tag", "params" : ["10.1.0.0/16", "vlan", "10"]},
+                {"methodName" : "add_tag", "params" : ["10.1.0.0/16", "vlan", "10"]}])
+        self.assertEqual(cm.exception.faultString, "TagExists")
+        self.assertIs(get_tags("10.1.0.0/16"), tags)
+        self.assertEqual(tags, {})
+
+    def test_import_nets_clears(self):
+        get_net("10.0.0.0/8")
+        import_nets([("10.3.0.0/16", {})])
+        self.assertEqual(len(get_net("10.0.0.0/8")["children"]), 3)
+
+    def test_disabled(self):
+        close_database_connection()
+        config.response_cache_size = 0
+        start_database_connection()
+        self.assertIsNot(get_net("10.0.0.0/8"), get_net("10.0.0.0/8"))
+        self.assertEqual(get_cache_stats()["size"], 0)
+
+class ResponseCacheSetUpMixin:
+    """
+    runs the tests of a test case with the response cache enabled and
+    checks after every test that the cached results are still up to date.
+    """
+    def setUp(self):
+        config.response_cache_size = 1000
+        super().setUp()
+
+    def tearDown(self):
+        for key, (prefix, value) in list(server._cache.entries.items()):
+            function = getattr(server, key[0]).__wrapped__
+            self.assertEqual(function(*key[1:]), value, key)
+        super().tearDown()
+        config.response_cache_size = 0
+
+class TestDeleteNetMethodsCache(ResponseCacheSetUpMixin, TestDeleteNetMethods):
+    pass
+
+class TestClaimNetMethodsCache(ResponseCacheSetUpMixin, TestClaimNetMethods):
+    pass
+
+class TestClaimNetsMethodsCache(ResponseCacheSetUpMixin, TestClaimNetsMethods):
+    pass
+
+class TestAddGetTagMethodsCache(ResponseCacheSetUpMixin, TestAddGetTagMethods):
+    pass
+
+class TestModifyTagsMethodsCache(ResponseCacheSetUpMixin, TestModifyTagsMethods):
+    pass
+
+class TestDeleteTagsMethodsCache(ResponseCacheSetUpMixin, TestDeleteTagsMethods):
+    pass
+
+class TestTransactionsCache(ResponseCacheSetUpMixin, TestTransactions):
+    pass
+
+class TestUsageCache(ResponseCacheSetUpMixin, TestUsage):
+    pass
+
+class TestIPv6MethodsCache(ResponseCacheSetUpMixin, TestIPv6Methods):
+    pass
+
+class TestImportNetsCache(ResponseCacheSetUpMixin, TestImportNets):
+    pass
@@ -0,0 +1,164 @@
+import unittest
+
+from os import remove
+from xmlrpc.server import Fault
+from minipam import server
+from minipam.server import *
+
+class TestChangesSince(unittest.TestCase):
+    def setUp(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        config.database_file = "test.db"
+        start_database_connection()
+        add_net("10.0.0.0/8")
+
+    def tearDown(self):
+        config.change_retention = None
+        config.change_retention_entries = None
+        close_database_connection()
+        remove("test.db")
+
+    def operations(self, changes):
+        return [(c["operation"], c["net"], c["tag_name"], c["tag_value"])
+                for c in changes["changes"]]
+
+    def test_changes_since_normal(self):
+        seq = changes_since(None)["seq"]
+        self.assertEqual(seq, 1)
+        add_tag("10.0.0.0/8", "name", "a")
+        modify_tag("10.0.0.0/8", "name", "b")
+        claim_nets("10.0.0.0/8", 24, 2, {"vlan" : "2"})
+        delete_tag("10.0.0.0/8", "name")
+        delete_tag("10.0.0.0/8", "name")
+        delete_net("10.0.0.0/24")
+        result = changes_since(seq)
+        self.assertEqual(self.operations(result), [
+            ("set_tag", "10.0.0.0/8", "name", "a"),
+            ("set_tag", "10.0.0.0/8", "name", "b"),
+            ("add_net", "10.0.0.0/24", None, None),
+            ("set_tag", "10.0.0.0/24", "vlan", "2"),
+            ("add_net", "10.0.1.0/24", None, None),
+            ("set_tag", "10.0.1.0/24", "vlan", "2"),
+            ("delete_tag", "10.0.0.0/8", "name", None),
+            ("delete_net", "10.0.0.0/24", None, None)])
+        self.assertEqual([c["seq"] for c in result["changes"]], list(range(2, 10)))
+        self.assertEqual(result["seq"], 9)
+        self.assertFalse(result["more"])
+        self.assertEqual(changes_since(9), {"changes" : [], "seq" : 9, "more" : False})
+
+    def test_changes_since_limit(self):
+        for i in range(5):
+            add_net("10.%d.0.0/16" % i)
+        seq = 1
+        seen = list()
+        while True:
+            result = changes_since(seq, 2)
+            seen.extend(c["net"] for c in result["changes"])
+            seq = result["seq"]
+            if not result["more"]:
+                break
+        self.assertEqual(seen, ["10.%d.0.0/16" % i for i in range(5)])
+        self.assertEqual(seq, 6)
+        for function in [changes_since, lambda seq, limit: changes_within("10.0.0.0/8",
+                seq, limit)]:
+            with self.assertRaises(Fault) as cm:
+                function(1, 0)
+            self.assertEqual(cm.exception.faultString, "InvalidLimit")
+
+    def test_changes_since_recursive_delete(self):
+        claim_nets("10.0.0.0/8", 16, 3)
+        add_net("10.0.0.0/24")
+        seq = changes_since(None)["seq"]
+        delete_net("10.0.0.0/15", True)
+        self.assertEqual(self.operations(changes_since(seq)), [
+            ("delete_net", "10.0.0.0/16", None, None),
+            ("delete_net", "10.0.0.0/24", None, None),
+            ("delete_net", "10.1.0.0/16", None, None)])
+
+    def test_changes_since_unchanged(self):
+        seq = changes_since(None)["seq"]
+        add_net("10.0.0.0/8")
+        delete_net("11.0.0.0/8")
+        with self.assertRaises(Fault):
+            modify_tag("10.0.0.0/8", "name", "a")
+        with self.assertRaises(Fault):
+            batch([{"methodName" : "add_net", "params" : ["11.0.0.0/8"]},
+                {"methodName" : "add_net", "params" : ["foo"]}])
+        self.assertEqual(changes_since(seq)["changes"], [])
+
+    def test_changes_since_import(self):
+        seq = changes_since(None)["seq"]
+        import_nets([("10.1.0.0/16", {"name" : "a"}), ("11.0.0.0/8", {})])
+        self.assertEqual(self.operations(changes_since(seq)), [
+            ("add_net", "10.1.0.0/16", None, None),
+            ("add_net", "11.0.0.0/8", None, None),
+            ("set_tag", "10.1.0.0/16", "name", "a")])
+
+    def test_compact_changes_entries(self):
+        for i in range(5):
+            add_net("10.%d.0.0/16" % i)
+        config.change_retention_entries = 2
+        self.assertEqual(compact_changes(), 4)
+        with self.assertRaises(Fault) as cm:
+            changes_since(3)
+        self.assertEqual(cm.exception.faultCode, 1009)
+        self.assertEqual([c["net"] for c in changes_since(4)["changes"]],
+                ["10.3.0.0/16", "10.4.0.0/16"])
+
+        # everything up to the newest entry is gone
+        config.change_retention_entries = 0
+        self.assertEqual(compact_changes(), 2)
+        with self.assertRaises(Fault):
+            changes_since(5)
+        self.assertEqual(changes_since(6)["changes"], [])
+        add_net("11.0.0.0/8")
+        self.assertEqual(changes_since(changes_since(None)["seq"] - 1)["changes"][0]["seq"], 7)
+
+    def test_compact_changes_retention(self):
+        for i in range(3):
+            add_net("10.%d.0.0/16" % i)
+        config.change_retention = 3600
+        self.assertEqual(compact_changes(), 0)
+        config.change_retention = -1
+        self.assertEqual(compact_changes(), 4)
+        with self.assertRaises(Fault):
+            changes_since(0)
+        self.assertEqual(changes_since(4)["changes"], [])
+
+    def test_compact_changes_automatic(self):
+        config.change_retention_entries = 10
+        server._changes_since_compaction = 0
+        for i in range(server._compact_interval):
+            add_net("10.0.%d.%d/32" % divmod(i, 256))
+        # the add_net of setUp is the first entry
+        latest = server._compact_interval + 1
+        self.assertEqual(len(changes_since(latest - 10)["changes"]), 10)
+        with self.assertRaises(Fault):
+            changes_since(latest - 11)
+
+    def test_changes_within(self):
+        seq = changes_since(None)["seq"]
+        add_net("10.1.0.0/16")
+        add_net("11.0.0.0/8")
+        add_tag("10.0.0.0/8", "name", "a")
+        add_net("10.1.2.0/24")
+        add_net("2001:db8::/32")
+        result = changes_within("10.1.0.0/16", seq)
+        self.assertEqual(self.operations(result), [
+            ("add_net", "10.1.0.0/16", None, None),
+            ("set_tag", "10.0.0.0/8", "name", "a"),
+            ("add_net", "10.1.2.0/24", None, None)])
+        self.assertEqual(result["seq"], seq + 5)
+        self.assertFalse(result["more"])
+        result = changes_within("10.1.0.0/16", seq, 2)
+        self.assertEqual(result["seq"], seq + 3)
+        self.assertTrue(result["more"])
+        self.assertEqual([c["net"] for c in changes_within("10.1.0.0/16", seq + 3)["changes"]],
+                ["10.1.2.0/24"])
+        self.assertEqual(changes_within("12.0.0.0/8", seq),
+                {"changes" : [], "seq" : seq + 5, "more" : False})
+        with self.assertRaises(Fault):
+            changes_within("foo", seq)
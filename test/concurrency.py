@@ -0,0 +1,193 @@
+import multiprocessing
+import threading
+import unittest
+
+from os import remove
+from xmlrpc.client import ServerProxy
+from minipam import server
+from minipam.server import *
+
+class TestPooledServer(unittest.TestCase):
+    def setUp(self):
+        for f in ["test.db", "test.db-wal", "test.db-shm"]:
+            try:
+                remove(f)
+            except FileNotFoundError:
+                pass
+        config.database_file = "test.db"
+        config.xmlrpc_workers = 8
+        config.xmlrpc_port = 0
+        start_database_connection()
+        add_net("10.0.0.0/16")
+
+        self.server = create_xmlrpc_server()
+        self.server.logRequests = False
+        self.url = "http://%s:%d/" % self.server.server_address
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        close_database_connection()
+        config.xmlrpc_workers = 0
+        config.xmlrpc_port = 8000
+        remove("test.db")
+
+    def run_clients(self, count, function):
+        results = [None] * count
+        def client(i):
+            with ServerProxy(self.url, allow_none=True) as proxy:
+                results[i] = function(proxy)
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_wal_mode(self):
+        c = server.db_conn.cursor()
+        c.execute("PRAGMA journal_mode")
+        self.assertEqual(c.fetchone()[0], "wal")
+
+    def test_concurrent_claims(self):
+        results = self.run_clients(8,
+                lambda proxy: [proxy.claim_net("10.0.0.0/16", 28)["cidr"] for i in range(25)])
+        claimed = [n for r in results for n in r]
+        self.assertEqual(len(claimed), 200)
+        self.assertEqual(len(set(claimed)), 200)
+        self.assertEqual(len(get_net("10.0.0.0/16")["children"]), 200)
+        self.assertFalse(server._check_free_blocks(server.db_conn.cursor()))
+
+    def test_concurrent_reads_and_writes(self):
+        def client(proxy):
+            nets = list()
+            for i in range(20):
+                nets.append(proxy.claim_net("10.0.0.0/16", 24)["cidr"])
+                proxy.add_tag(nets[-1], "name", nets[-1])
+                # a read sees the committed writes of the same client
+                self.assertEqual(proxy.get_tag(nets[-1], "name"), nets[-1])
+                self.assertEqual(proxy.lookup_ip(nets[-1].split("/")[0])["cidr"], nets[-1])
+            return nets
+        results = self.run_clients(4, client)
+        self.assertEqual(len({n for r in results for n in r}), 80)
+
+def claim_in_other_process(database, net, size):
+    config.database_file = database
+    start_database_connection()
+    claim_net(net, size)
+    close_database_connection()
+
+def claim_with_threads(database, net, threads, count):
+    """
+    claims count /32 networks in each of threads threads of a new process.
+    :returns: the claimed cidrs
+    """
+    config.database_file = database
+    start_database_connection()
+    results = [None] * threads
+    def client(i):
+        results[i] = [claim_net(net, 32)["cidr"] for j in range(count)]
+    workers = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    close_database_connection()
+    return [n for r in results for n in r]
+
+class TestClaimConflicts(unittest.TestCase):
+    def setUp(self):
+        for f in ["test.db", "test.db-wal", "test.db-shm"]:
+            try:
+                remove(f)
+            except FileNotFoundError:
+                pass
+        config.database_file = "test.db"
+        start_database_connection()
+        self.allocate_blocks = server._allocate_blocks
+        self.context = multiprocessing.get_context("spawn")
+
+    def tearDown(self):
+        server._allocate_blocks = self.allocate_blocks
+        close_database_connection()
+        remove("test.db")
+
+    def claim_in_between(self, net, size):
+        """
+        lets another process claim size in net after the next claim picked
+        its network and before it writes.
+        :returns: the allocations of the claims
+        """
+        allocations = list()
+        def allocate_blocks(*args):
+            allocation = self.allocate_blocks(*args)
+            if not allocations:
+                p = self.context.Process(target=claim_in_other_process,
+                        args=("test.db", net, size))
+                p.start()
+                p.join()
+            allocations.append(allocation)
+            return allocation
+        server._allocate_blocks = allocate_blocks
+        return allocations
+
+    def children(self, net):
+        return [n["cidr"] for n in get_net(net)["children"]]
+
+    def test_claim_from_taken_free_block(self):
+        add_net("10.0.0.0/16")
+        allocations = self.claim_in_between("10.0.0.0/16", 24)
+        self.assertEqual(claim_net("10.0.0.0/16", 24)["cidr"], "10.0.1.0/24")
+        self.assertEqual(len(allocations), 2)
+        self.assertEqual(self.children("10.0.0.0/16"), ["10.0.0.0/24", "10.0.1.0/24"])
+        self.assertFalse(server._check_free_blocks(server.db_conn.cursor()))
+
+    def test_claim_nets_from_taken_free_block(self):
+        add_net("10.0.0.0/16")
+        self.claim_in_between("10.0.0.0/16", 24)
+        self.assertEqual(claim_nets("10.0.0.0/16", 24, 2), ["10.0.1.0/24", "10.0.2.0/24"])
+        self.assertEqual(len(self.children("10.0.0.0/16")), 3)
+        self.assertFalse(server._check_free_blocks(server.db_conn.cursor()))
+
+    def test_claim_outside_database_taken(self):
+        add_net("10.0.0.0/8")
+        self.claim_in_between("10.0.0.0/16", 24)
+        self.assertEqual(claim_net("10.0.0.0/16", 24)["cidr"], "10.0.1.0/24")
+        self.assertEqual(self.children("10.0.0.0/16"), ["10.0.0.0/24", "10.0.1.0/24"])
+        self.assertFalse(server._check_free_blocks(server.db_conn.cursor()))
+
+    def test_claim_outside_database_overlapped(self):
+        add_net("10.0.0.0/8")
+        self.claim_in_between("10.0.0.0/16", 25)
+        self.assertEqual(claim_net("10.0.0.0/16", 24)["cidr"], "10.0.1.0/24")
+        self.assertEqual(self.children("10.0.0.0/16"), ["10.0.0.0/25", "10.0.1.0/24"])
+        self.assertEqual(self.children("10.0.0.0/25"), [])
+        self.assertFalse(server._check_free_blocks(server.db_conn.cursor()))
+
+    def test_conflict_in_transaction(self):
+        add_net("10.0.0.0/16")
+        self.claim_in_between("10.0.0.0/16", 24)
+        with transaction():
+            get_net("10.0.0.0/16")
+            self.assertEqual(claim_nets("10.0.0.0/16", 24, 2), ["10.0.1.0/24", "10.0.2.0/24"])
+            add_tag("10.0.1.0/24", "name", "a")
+        self.assertEqual(len(self.children("10.0.0.0/16")), 3)
+        self.assertFalse(server._check_free_blocks(server.db_conn.cursor()))
+
+    def test_stress_parallel_claims(self):
+        # 32 clients in 4 processes draw 10000 /32 networks from one /16
+        add_net("10.0.0.0/16")
+        close_database_connection()
+        with self.context.Pool(4) as pool:
+            results = pool.starmap(claim_with_threads,
+                    [("test.db", "10.0.0.0/16", 8, 313)] * 3 + [("test.db", "10.0.0.0/16", 8, 311)])
+        start_database_connection()
+        claimed = [n for r in results for n in r]
+        self.assertEqual(len(claimed), 10000)
+        self.assertEqual(len(set(claimed)), 10000)
+        self.assertEqual(sorted(self.children("10.0.0.0/16"), key=lambda n: ip_network(n)),
+                sorted(claimed, key=lambda n: ip_network(n)))
+        self.assertFalse(server._check_free_blocks(server.db_conn.cursor()))
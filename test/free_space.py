@@ -0,0 +1,226 @@
+import random
+import unittest
+
+from os import remove
+from xmlrpc.server import Fault
+from minipam import server
+from minipam.server import *
+
+class TestFreeBlocks(unittest.TestCase):
+    def setUp(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        config.database_file = "test.db"
+        start_database_connection()
+        add_net("10.0.0.0/8")
+
+    def tearDown(self):
+        close_database_connection()
+        remove("test.db")
+
+    def free_blocks(self, net):
+        c = server.db_conn.cursor()
+        c.execute("SELECT free_blocks.address, free_blocks.netmask FROM free_blocks "
+                "JOIN networks ON parent_id = id WHERE net = ? ORDER BY free_blocks.address",
+                (net,))
+        return [str(ip_network((r[0], r[1]))) for r in c.fetchall()]
+
+    def assertConsistent(self):
+        self.assertFalse(server._check_free_blocks(server.db_conn.cursor()))
+
+    def test_free_blocks_split_and_merge(self):
+        add_net("10.0.0.0/10")
+        self.assertEqual(self.free_blocks("10.0.0.0/8"), ["10.64.0.0/10", "10.128.0.0/9"])
+        self.assertEqual(self.free_blocks("10.0.0.0/10"), ["10.0.0.0/10"])
+        add_net("10.1.0.0/16")
+        self.assertEqual(self.free_blocks("10.0.0.0/10")[:2], ["10.0.0.0/16", "10.2.0.0/15"])
+        delete_net("10.0.0.0/10")
+        self.assertEqual(self.free_blocks("10.0.0.0/8")[:2], ["10.0.0.0/16", "10.2.0.0/15"])
+        delete_net("10.1.0.0/16")
+        self.assertEqual(self.free_blocks("10.0.0.0/8"), ["10.0.0.0/8"])
+        self.assertConsistent()
+
+    def test_free_blocks_adopt_children(self):
+        add_net("10.1.0.0/16")
+        add_net("10.3.0.0/16")
+        add_net("10.0.0.0/14")
+        self.assertEqual(self.free_blocks("10.0.0.0/14"), ["10.0.0.0/16", "10.2.0.0/16"])
+        self.assertEqual(self.free_blocks("10.0.0.0/8")[0], "10.4.0.0/14")
+        delete_net("10.0.0.0/14", recursive=True)
+        self.assertEqual(self.free_blocks("10.0.0.0/8"), ["10.0.0.0/8"])
+        self.assertConsistent()
+
+    def test_claim_best_fit(self):
+        add_net("10.0.0.0/24")
+        add_net("10.0.1.128/25")
+        add_net("10.0.2.0/23")
+        # the free /25 10.0.1.0 is the smallest block for a /26
+        self.assertEqual(claim_net("10.0.0.0/8", 26)["cidr"], "10.0.1.0/26")
+        self.assertEqual(claim_net("10.0.0.0/8", 26)["cidr"], "10.0.1.64/26")
+        self.assertEqual(claim_net("10.0.0.0/8", 26)["cidr"], "10.0.4.0/26")
+        self.assertConsistent()
+
+    def test_claim_nets(self):
+        add_net("10.0.0.0/24")
+        add_net("10.0.1.128/25")
+        claim_nets("10.0.0.0/8", 27, 20)
+        claim_nets("10.0.0.0/16", 30, 5)
+        self.assertConsistent()
+
+    def test_claim_not_in_database(self):
+        add_net("11.0.0.0/16")
+        self.assertEqual(claim_net("11.0.0.0/15", 16)["cidr"], "11.1.0.0/16")
+        with self.assertRaises(Fault) as cm:
+            claim_net("11.0.0.0/15", 16)
+        self.assertEqual(cm.exception.faultString, "NoMatchingGapAvailable")
+
+    def test_random_operations(self):
+        random.seed(4)
+        for i in range(300):
+            prefixlen = random.randint(9, 20)
+            address = (10 << 24) + (random.getrandbits(32 - 8) >> (32 - prefixlen) << (32 - prefixlen))
+            net = str(ip_network((address, prefixlen)))
+            operation = random.random()
+            if operation < 0.4:
+                add_net(net)
+            elif operation < 0.6:
+                delete_net(net, recursive=random.random() < 0.3)
+            else:
+                try:
+                    claim_net(net, prefixlen + random.randint(0, 4))
+                except Fault:
+                    pass
+        self.assertConsistent()
+
+    def test_delete_net_counts(self):
+        claim_nets("10.0.0.0/8", 16, 4, {"name" : "a", "vlan" : "1"})
+        add_net("10.0.0.0/24")
+        add_tag("10.0.0.0/8", "name", "top")
+        self.assertEqual(delete_net("10.0.0.0/8", True, True), {"networks" : 6, "tags" : 9})
+        self.assertEqual(delete_net("10.0.0.0/16", False, True), {"networks" : 1, "tags" : 2})
+        self.assertEqual(delete_net("10.0.0.0/15", True, True), {"networks" : 3, "tags" : 4})
+        self.assertEqual(len(get_net("10.0.0.0/8")["children"]), 4)
+        self.assertEqual(delete_net("10.0.0.0/16"), {"networks" : 1, "tags" : 2})
+        self.assertEqual(delete_net("10.0.0.0/16"), {"networks" : 0, "tags" : 0})
+        self.assertEqual(delete_net("10.0.0.0/8", True), {"networks" : 5, "tags" : 7})
+        self.assertConsistent()
+
+    def test_delete_net_chunked(self):
+        random.seed(7)
+        add_net("10.0.0.0/9")
+        add_net("10.128.0.0/9")
+        for i in range(400):
+            prefixlen = random.randint(10, 24)
+            address = (10 << 24) + (random.getrandbits(24) >> (32 - prefixlen) << (32 - prefixlen))
+            add_net(str(ip_network((address, prefixlen))))
+            if random.random() < 0.3:
+                add_tag(str(ip_network((address, prefixlen))), "tag%d" % i, "a")
+        add_net("11.0.0.0/8")
+        expected = delete_net("10.0.0.0/8", True, True)
+        seq = changes_since(None)["seq"]
+        # the callback can not be passed by position, e.g. over xmlrpc
+        with self.assertRaises(TypeError):
+            delete_net("10.0.0.0/8", True, False, 10, 5)
+        self.assertEqual(delete_net("10.0.0.0/8", True, True), expected)
+        progress = list()
+        result = delete_net("10.0.0.0/8", True, False, 10, progress=progress.append)
+        self.assertEqual(result, expected)
+        self.assertEqual(progress[-1], expected)
+        self.assertGreater(len(progress), expected["networks"] // 10)
+        self.assertEqual([n["cidr"] for n in get_net("0.0.0.0/0", 1)["children"]], ["11.0.0.0/8"])
+        self.assertEqual(changes_since(None)["seq"] - seq, expected["networks"])
+        self.assertConsistent()
+
+    def test_delete_net_chunked_resume(self):
+        for i in range(4):
+            add_net("10.%d.0.0/16" % i)
+            claim_nets("10.%d.0.0/16" % i, 24, 5)
+        def interrupt(counts):
+            if counts["networks"] >= 6:
+                raise KeyboardInterrupt()
+        with self.assertRaises(KeyboardInterrupt):
+            delete_net("10.0.0.0/14", True, False, 3, progress=interrupt)
+        self.assertConsistent()
+        remaining = delete_net("10.0.0.0/14", True, True)["networks"]
+        self.assertLess(remaining, 24)
+        self.assertEqual(delete_net("10.0.0.0/14", True, False, 3)["networks"], remaining)
+        self.assertEqual(get_net("10.0.0.0/8")["children"], [])
+        self.assertConsistent()
+
+    def test_repair_on_startup(self):
+        add_net("10.0.0.0/16")
+        server.db_conn.execute("DELETE FROM free_blocks")
+        server.db_conn.commit()
+        close_database_connection()
+        start_database_connection()
+        self.assertEqual(self.free_blocks("10.0.0.0/8")[0], "10.1.0.0/16")
+        self.assertConsistent()
+
+class TestUsage(unittest.TestCase):
+    def setUp(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        config.database_file = "test.db"
+        start_database_connection()
+        add_net("10.0.0.0/16")
+
+    def tearDown(self):
+        close_database_connection()
+        remove("test.db")
+
+    def assertUsage(self, net, used, children, largest_free):
+        usage = get_usage(net)
+        self.assertEqual(usage["used"], str(used))
+        self.assertEqual(usage["free"], str(int(usage["addresses"]) - used))
+        self.assertEqual(usage["children"], children)
+        self.assertEqual(usage["largest_free"], largest_free)
+
+    def test_usage_empty(self):
+        self.assertEqual(get_usage("10.0.0.0/16"), {"cidr" : "10.0.0.0/16",
+            "network_in_database" : True, "addresses" : "65536", "used" : "0",
+            "free" : "65536", "children" : 0, "largest_free" : "10.0.0.0/16"})
+
+    def test_usage_add_and_delete(self):
+        add_net("10.0.1.0/24")
+        add_net("10.0.1.0/28")
+        self.assertUsage("10.0.0.0/16", 256, 1, "10.0.128.0/17")
+        self.assertUsage("10.0.1.0/24", 16, 1, "10.0.1.128/25")
+        add_net("10.0.0.0/22")
+        self.assertUsage("10.0.0.0/16", 1024, 1, "10.0.128.0/17")
+        self.assertUsage("10.0.0.0/22", 256, 1, "10.0.2.0/23")
+        delete_net("10.0.0.0/22")
+        self.assertUsage("10.0.0.0/16", 256, 1, "10.0.128.0/17")
+        delete_net("10.0.1.0/24")
+        self.assertUsage("10.0.0.0/16", 16, 1, "10.0.128.0/17")
+        delete_net("10.0.0.0/16", recursive=True)
+        self.assertEqual(get_usage("10.0.0.0/16")["network_in_database"], False)
+        self.assertUsage("10.0.0.0/16", 0, 0, "10.0.0.0/16")
+
+    def test_usage_claim(self):
+        claim_net("10.0.0.0/16", 17)
+        claim_nets("10.0.0.0/16", 18, 2)
+        self.assertUsage("10.0.0.0/16", 65536, 3, None)
+        delete_net("10.0.128.0/18", recursive=True)
+        self.assertUsage("10.0.0.0/16", 65536 - 16384, 2, "10.0.128.0/18")
+        self.assertFalse(server._check_free_blocks(server.db_conn.cursor()))
+
+    def test_usage_not_in_database(self):
+        add_net("10.0.1.0/24")
+        add_net("10.0.4.0/24")
+        self.assertUsage("10.0.0.0/21", 512, 2, "10.0.2.0/23")
+
+    def test_usage_ipv6(self):
+        add_net("::/0")
+        claim_nets("::/0", 64, 3)
+        self.assertUsage("::/0", 3 << 64, 3, "8000::/1")
+        self.assertEqual(get_usage("::/0")["addresses"], str(1 << 128))
+
+    def test_usage_import(self):
+        import_nets([("10.0.1.0/24", dict()), ("10.0.1.0/28", dict()), ("10.0.2.0/24", dict())])
+        self.assertUsage("10.0.0.0/16", 512, 2, "10.0.128.0/17")
+        self.assertUsage("10.0.1.0/24", 16, 1, "10.0.1.128/25")
+        self.assertFalse(server._check_free_blocks(server.db_conn.cursor()))
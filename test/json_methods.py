@@ -0,0 +1,188 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import unittest
+
+from os import remove
+from unittest import mock
+from xmlrpc.server import Fault
+from minipam.client import JSONClient
+from minipam import json_server
+from minipam.ip_utils import Prefix
+from minipam.json_server import start_json_server
+from minipam import server
+from minipam.server import *
+
+class TestJSONServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        config.database_file = "test.db"
+        start_database_connection()
+        add_net("10.0.0.0/8")
+        add_net("10.0.0.0/16")
+        add_tag("10.0.0.0/16", "name", "lan")
+
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(start_json_server("localhost", 0))
+        self.url = "http://localhost:%d/" % self.server.sockets[0].getsockname()[1]
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+
+    @classmethod
+    def tearDownClass(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+        close_database_connection()
+        remove("test.db")
+
+    def setUp(self):
+        self.client = JSONClient(self.url)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_get_net(self):
+        self.assertEqual(self.client.get_net("10.0.0.0/8"), get_net("10.0.0.0/8"))
+
+    def test_keep_alive(self):
+        self.client.get_tags("10.0.0.0/16")
+        sock = self.client.sock
+        self.assertEqual(self.client.get_tags("10.0.0.0/16"), {"name" : "lan"})
+        self.assertIs(self.client.sock, sock)
+
+    def test_fault(self):
+        with self.assertRaises(Fault) as cm:
+            self.client.get_net("10.0.0.1/8")
+        self.assertEqual(cm.exception.faultString, "InvalidNetworkDescription")
+        # the connection is still usable after a fault
+        self.assertEqual(self.client.get_tag("10.0.0.0/16", "name"), "lan")
+
+    def test_internal_error(self):
+        def fail(net):
+            raise sqlite3.OperationalError("database is locked")
+        with mock.patch.dict(server.rpc_functions, {"get_tags" : fail}), \
+                mock.patch("traceback.print_exc") as print_exc:
+            with self.assertRaises(Fault) as cm:
+                self.client.get_tags("10.0.0.0/16")
+        self.assertEqual(cm.exception.faultString, "OperationalError:database is locked")
+        print_exc.assert_called_once()
+        # the connection is answered and kept open
+        sock = self.client.sock
+        self.assertEqual(self.client.get_tags("10.0.0.0/16"), {"name" : "lan"})
+        self.assertIs(self.client.sock, sock)
+
+    def test_pipeline(self):
+        results = self.client.pipeline([
+            ("claim_net", ["10.0.0.0/8", 24]),
+            ("get_tags", ["10.0.0.0/16"]),
+            ("lookup_ip", ["10.0.0.1"])])
+        self.assertEqual(results[0]["cidr"], "10.1.0.0/24")
+        self.assertEqual(results[1], {"name" : "lan"})
+        self.assertEqual(results[2]["cidr"], "10.0.0.0/16")
+        delete_net("10.1.0.0/24")
+
+    def test_unknown_method(self):
+        with self.assertRaises(Fault):
+            self.client.remove_everything()
+        with self.assertRaises(Fault):
+            self.client.get_net("10.0.0.0/8", 1, 2, 3)
+
+    def test_params_not_a_list(self):
+        def call(method, params):
+            status, body = asyncio.run_coroutine_threadsafe(json_server.call(method, params),
+                    self.loop).result()
+            return status, json.loads(body)["error"]["faultString"]
+        self.assertEqual(call("get_net", {"net" : "10.0.0.0/8"}), (400, "params must be a list"))
+        self.assertEqual(call("get_nets", ["10.0.0.0/8"]), (404, "unknown method get_nets"))
+        self.assertEqual(call("get_nets", {}), (404, "unknown method get_nets"))
+
+    def test_watch(self):
+        seq = changes_since(None)["seq"]
+        results = list()
+        def watch():
+            with JSONClient(self.url) as client:
+                results.append(client.watch("10.0.0.0/16", seq, 10))
+        thread = threading.Thread(target=watch)
+        start = time.monotonic()
+        thread.start()
+        time.sleep(0.2)
+        add_net("10.2.0.0/16")
+        add_net("10.0.5.0/24")
+        thread.join()
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual([c["net"] for c in results[0]["changes"]], ["10.0.5.0/24"])
+        self.assertEqual(results[0]["seq"], seq + 2)
+
+        # changes which are already there are returned at once
+        result = self.client.watch("10.0.0.0/8", seq, 10)
+        self.assertEqual([c["net"] for c in result["changes"]], ["10.2.0.0/16", "10.0.5.0/24"])
+        delete_net("10.2.0.0/16")
+        delete_net("10.0.5.0/24")
+
+    def test_watch_timeout(self):
+        seq = changes_since(None)["seq"]
+        start = time.monotonic()
+        add_net("11.0.0.0/8")
+        result = self.client.watch("10.0.0.0/16", seq, 0.5)
+        self.assertGreaterEqual(time.monotonic() - start, 0.5)
+        self.assertEqual(result, {"changes" : [], "seq" : seq + 1, "more" : False})
+        # the call which timed out does not wait any more
+        self.assertEqual(json_server._watchers[self.loop].waiting, [])
+        delete_net("11.0.0.0/8")
+        with self.assertRaises(Fault) as cm:
+            self.client.watch("10.0.0.1/16")
+        self.assertEqual(cm.exception.faultString, "InvalidNetworkDescription")
+
+class TestWatchersWithWorkers(unittest.TestCase):
+    def setUp(self):
+        for f in ["test.db", "test.db-wal", "test.db-shm"]:
+            try:
+                remove(f)
+            except FileNotFoundError:
+                pass
+        config.database_file = "test.db"
+        config.xmlrpc_workers = 2
+        start_database_connection()
+        add_net("10.0.0.0/8")
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        close_database_connection()
+        config.xmlrpc_workers = 0
+        remove("test.db")
+
+    def test_commit_during_wake(self):
+        # a wake finds no waiting call and reads in a worker, in between a
+        # call starts waiting and a change is committed. The wake of that
+        # commit runs after the first one is done and has to deliver it.
+        reading = threading.Event()
+        changes_since = server.changes_since
+        def blocking(*args):
+            reading.wait(5)
+            return changes_since(*args)
+
+        async def run():
+            watchers = json_server._Watchers(self.loop)
+            # the wakes of the commits are started here
+            server.remove_change_listener(watchers.committed)
+            with mock.patch.object(server, "changes_since", blocking):
+                first = asyncio.ensure_future(watchers.wake())
+                await asyncio.sleep(0.1)
+                woken = watchers.wait(Prefix.parse("10.0.0.0/16"))
+                add_net("10.0.6.0/24")
+                reading.set()
+                await first
+                await watchers.wake()
+            self.assertTrue(woken.done())
+
+        self.loop.run_until_complete(run())
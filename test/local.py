@@ -0,0 +1,109 @@
+import sqlite3
+import subprocess
+import sys
+import unittest
+
+from os import remove
+from unittest import mock
+from xmlrpc.server import Fault
+from minipam import config
+from minipam import server
+from minipam.local import LocalClient
+
+class TestLocalClient(unittest.TestCase):
+    def setUp(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        with LocalClient("test.db") as pam:
+            pam.add_net("10.0.0.0/8")
+            pam.add_tag("10.0.0.0/8", "name", "a")
+
+    def tearDown(self):
+        if server.db_conn is not None:
+            server.close_database_connection()
+        remove("test.db")
+
+    def test_local_client_read_write(self):
+        with LocalClient("test.db") as pam:
+            result = pam.claim_net("10.0.0.0/8", 24)
+            self.assertEqual(result["cidr"], "10.0.0.0/24")
+        self.assertIsNone(server.db_conn)
+        with LocalClient("test.db", read_only=True) as pam:
+            result = pam.get_net("10.0.0.0/8", 1)
+            self.assertEqual([c["cidr"] for c in result["children"]], ["10.0.0.0/24"])
+            self.assertEqual(pam.get_tag("10.0.0.0/8", "name"), "a")
+            self.assertEqual(pam.call("lookup_ip", "10.0.0.1")["cidr"], "10.0.0.0/24")
+
+    def test_local_client_faults(self):
+        with LocalClient("test.db") as pam:
+            with self.assertRaises(Fault) as cm:
+                pam.get_net("foo")
+            self.assertEqual(cm.exception.faultCode, 1001)
+            with self.assertRaises(Fault) as cm:
+                pam.no_such_method()
+            self.assertEqual(cm.exception.faultCode, 0)
+
+    def test_local_client_read_only_writes(self):
+        with LocalClient("test.db", read_only=True) as pam:
+            with self.assertRaises(sqlite3.OperationalError):
+                pam.add_net("11.0.0.0/8")
+        with LocalClient("test.db", read_only=True) as pam:
+            self.assertIsNone(pam.get_net("11.0.0.0/8", 0)["tags"].get("name"))
+            self.assertFalse(pam.get_net("11.0.0.0/8", 0)["network_in_database"])
+
+    def test_local_client_outdated_schema(self):
+        conn = sqlite3.connect("test.db")
+        conn.execute("PRAGMA user_version = 1")
+        conn.commit()
+        conn.close()
+        with self.assertRaises(sqlite3.OperationalError):
+            with LocalClient("test.db", read_only=True) as pam:
+                pam.get_net("10.0.0.0/8")
+        self.assertIsNone(server.db_conn)
+        # a writable connection migrates the database again
+        with LocalClient("test.db") as pam:
+            self.assertEqual(pam.get_tag("10.0.0.0/8", "name"), "a")
+        with LocalClient("test.db", read_only=True) as pam:
+            self.assertEqual(pam.get_tag("10.0.0.0/8", "name"), "a")
+
+    def test_local_client_skips_migrations(self):
+        def fail(c):
+            self.fail("migration was run again")
+        migrations = [fail] * len(server.schema_migrations)
+        with mock.patch.object(server, "schema_migrations", migrations):
+            with LocalClient("test.db") as pam:
+                self.assertEqual(pam.get_tag("10.0.0.0/8", "name"), "a")
+
+    def test_server_import_is_light(self):
+        code = ("import sys, minipam.server; print(sorted(m for m in ['xmlrpc.server', "
+                "'xmlrpc.client', 'http.server', 'inspect', 'concurrent.futures'] "
+                "if m in sys.modules))")
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True,
+                text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+    def test_server_sees_other_writers(self):
+        config.trie_index = True
+        config.response_cache_size = 100
+        try:
+            with LocalClient("test.db") as pam:
+                self.assertEqual(pam.get_tags("10.0.0.0/8"), {"name" : "a"})
+                self.assertEqual(pam.get_net("10.0.0.0/8", 1)["children"], [])
+                with self.assertRaises(Fault):
+                    pam.lookup_ip("11.0.0.1")
+                # a second process writes the same file
+                code = ("from minipam.local import LocalClient\n"
+                        "with LocalClient('test.db') as pam:\n"
+                        "    pam.modify_tag('10.0.0.0/8', 'name', 'b')\n"
+                        "    pam.add_net('10.1.0.0/16')\n"
+                        "    pam.add_net('11.0.0.0/8')\n")
+                subprocess.run([sys.executable, "-c", code], check=True)
+                self.assertEqual(pam.get_tags("10.0.0.0/8"), {"name" : "b"})
+                self.assertEqual([c["cidr"] for c in pam.get_net("10.0.0.0/8", 1)["children"]],
+                        ["10.1.0.0/16"])
+                self.assertEqual(pam.lookup_ip("11.0.0.1")["cidr"], "11.0.0.0/8")
+        finally:
+            config.trie_index = False
+            config.response_cache_size = 0
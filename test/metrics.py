@@ -0,0 +1,105 @@
+import unittest
+import urllib.error
+import urllib.request
+
+from os import remove
+from xmlrpc.server import Fault
+from minipam import metrics
+from minipam.server import *
+from test.net_methods import *
+from test.tag_methods import *
+from test.transactions import *
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        config.database_file = "test.db"
+        config.metrics = True
+        metrics.reset()
+        start_database_connection()
+        add_net("10.0.0.0/8")
+        add_net("10.1.0.0/16")
+        self.get_net = metrics.instrument("get_net", get_net)
+        self.get_tag = metrics.instrument("get_tag", get_tag)
+
+    def tearDown(self):
+        close_database_connection()
+        config.metrics = False
+        metrics.reset()
+        remove("test.db")
+
+    def test_disabled(self):
+        config.metrics = False
+        self.assertIs(metrics.instrument("get_net", get_net), get_net)
+        self.assertIs(metrics.connection_factory(), sqlite3.Connection)
+
+    def test_calls_and_queries(self):
+        self.get_net("10.0.0.0/8")
+        self.get_net("10.0.0.0/8", 0)
+        m = get_metrics()["methods"]["get_net"]
+        self.assertEqual(m["calls"], 2)
+        self.assertEqual(m["buckets"]["+Inf"], 2)
+        self.assertGreater(m["queries"], 0)
+        self.assertGreater(m["rows"], 0)
+        self.assertGreater(m["seconds"], 0)
+        self.assertEqual(m["faults"], {})
+
+    def test_faults(self):
+        for i in range(2):
+            with self.assertRaises(Fault):
+                self.get_tag("10.1.0.0/16", "vlan")
+        with self.assertRaises(Fault):
+            self.get_net("10.1.0.0/33")
+        methods = get_metrics()["methods"]
+        self.assertEqual(methods["get_tag"]["faults"], {"1005" : 2})
+        self.assertEqual(methods["get_net"]["faults"], {"1001" : 1})
+        self.assertEqual(methods["get_net"]["errors"], 0)
+
+    def test_queries_outside_calls_are_not_counted(self):
+        get_net("10.0.0.0/8")
+        self.assertEqual(get_metrics()["methods"], {})
+
+    def test_render(self):
+        self.get_net("10.0.0.0/8")
+        text = metrics.render(get_metrics())
+        self.assertIn('minipam_rpc_calls_total{method="get_net"} 1\n', text)
+        self.assertIn('minipam_rpc_duration_seconds_bucket{method="get_net",le="+Inf"} 1\n', text)
+        self.assertIn("minipam_response_cache_hits_total 0\n", text)
+
+    def test_metrics_server(self):
+        self.get_net("10.0.0.0/8")
+        httpd = metrics.start_metrics_server_thread(get_metrics, "localhost", 0)
+        try:
+            url = "http://localhost:%d" % httpd.server_address[1]
+            with urllib.request.urlopen(url + "/metrics") as response:
+                self.assertIn(b'minipam_rpc_calls_total{method="get_net"} 1',
+                        response.read())
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(url + "/other")
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+
+class MetricsSetUpMixin:
+    """
+    runs the tests of a test case on instrumented connections.
+    """
+    def setUp(self):
+        config.metrics = True
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        config.metrics = False
+
+class TestClaimNetMethodsMetrics(MetricsSetUpMixin, TestClaimNetMethods):
+    pass
+
+class TestModifyTagsMethodsMetrics(MetricsSetUpMixin, TestModifyTagsMethods):
+    pass
+
+class TestTransactionsMetrics(MetricsSetUpMixin, TestTransactions):
+    pass
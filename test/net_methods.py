@@ -1,7 +1,12 @@
+import random
 import unittest
 
+from ipaddress import collapse_addresses
 from os import remove
 from xmlrpc.server import Fault
+from xmlrpc.client import dumps
+from minipam import server
+from minipam.client import flat_tree
 from minipam.server import *
 
 class TestAddNetMethods(unittest.TestCase):
@@ -92,6 +97,81 @@ class TestGetNetMethods(unittest.TestCase):
 
 
 
+class TestGetNetTreeMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        config.database_file = "test.db"
+        start_database_connection()
+
+        add_net("10.0.0.0/8")
+        add_net("10.0.0.0/16")
+        add_net("10.0.0.0/24")
+        add_net("10.0.1.0/24")
+        add_net("10.1.0.0/16")
+        add_net("10.1.0.0/24")
+        add_tag("10.0.1.0/24", "name", "servers")
+        add_tag("10.1.0.0/16", "vlan", "20")
+
+    @classmethod
+    def tearDownClass(self):
+        close_database_connection()
+        remove("test.db")
+
+    def test_get_net_siblings(self):
+        result = get_net("10.0.0.0/8")
+        self.assertEqual([n["cidr"] for n in result["children"]],
+                ["10.0.0.0/16", "10.1.0.0/16"])
+        self.assertEqual([n["cidr"] for n in result["children"][0]["children"]],
+                ["10.0.0.0/24", "10.0.1.0/24"])
+        self.assertEqual([n["cidr"] for n in result["children"][1]["children"]],
+                ["10.1.0.0/24"])
+
+    def test_get_net_tags_of_children(self):
+        result = get_net("10.0.0.0/8")
+        self.assertEqual(result["tags"], {})
+        self.assertEqual(result["children"][0]["children"][1]["tags"], {"name" : "servers"})
+        self.assertEqual(result["children"][1]["tags"], {"vlan" : "20"})
+
+    def test_get_net_not_in_db_tags(self):
+        result = get_net("10.0.0.0/7")
+        self.assertEqual(result["tags"], {})
+        self.assertEqual(len(result["children"]), 1)
+        self.assertEqual(len(result["children"][0]["children"]), 2)
+
+    def test_get_net_flat(self):
+        flat = get_net("10.0.0.0/8", format="flat")
+        self.assertEqual(flat["cidr"], ["10.0.0.0/8", "10.0.0.0/16", "10.0.0.0/24",
+            "10.0.1.0/24", "10.1.0.0/16", "10.1.0.0/24"])
+        self.assertEqual(flat["parent"], [-1, 0, 1, 1, 0, 4])
+        self.assertEqual(flat["tags"], {"name" : [None, None, None, "servers", None, None],
+            "vlan" : [None, None, None, None, "20", None]})
+        self.assertTrue(flat["network_in_database"])
+
+    def test_get_net_flat_not_in_db(self):
+        flat = get_net("10.0.0.0/7", 1, "flat")
+        self.assertEqual(flat["cidr"], ["10.0.0.0/7", "10.0.0.0/8"])
+        self.assertEqual(flat["parent"], [-1, 0])
+        self.assertFalse(flat["network_in_database"])
+
+    def test_flat_tree_matches_tree(self):
+        for net, depth in [("10.0.0.0/8", -1), ("10.0.0.0/8", 1), ("10.0.0.0/7", -1),
+                ("10.0.0.0/16", 0), ("192.168.0.0/16", -1)]:
+            self.assertEqual(flat_tree(get_net(net, depth, "flat")), get_net(net, depth))
+
+    def test_get_net_flat_payload(self):
+        tree = dumps((get_net("10.0.0.0/8"),), methodresponse=True, allow_none=True)
+        flat = dumps((get_net("10.0.0.0/8", -1, "flat"),), methodresponse=True, allow_none=True)
+        self.assertLess(len(flat) * 2, len(tree))
+
+    def test_get_net_invalid_format(self):
+        with self.assertRaises(Fault):
+            get_net("10.0.0.0/8", format="nested")
+
+
 class TestDeleteNetMethods(unittest.TestCase):
     def setUp(self):
         try:
@@ -167,6 +247,13 @@ class TestClaimNetMethods(unittest.TestCase):
         self.assertEqual(len(result["children"]), 1)
         self.assertEqual(result["children"][0]["cidr"], "127.0.0.0/16")
 
+    def test_claim_own_size(self):
+        with self.assertRaises(Fault) as cm:
+            claim_net("127.0.0.0/8", 8)
+        self.assertEqual(cm.exception.faultString, "NoMatchingGapAvailable")
+        self.assertEqual(get_net("127.0.0.0/8")["children"], [])
+        self.assertEqual(claim_net("127.0.0.0/8", 9)["cidr"], "127.0.0.0/9")
+
     #@unittest.skip("")
     def test_claim_normal(self):
         add_net("127.0.0.0/16")
@@ -239,3 +326,499 @@ class TestClaimNetMethods(unittest.TestCase):
         with self.assertRaises(Fault) as cm:
             claim_net("1.0.0.0/8", 9)
         self.assertEqual(cm.exception.faultString, "NoMatchingGapAvailable")
+
+class TestLookupIpMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        config.database_file = "test.db"
+        start_database_connection()
+
+        add_net("10.0.0.0/8")
+        add_net("10.0.0.0/16")
+        add_net("10.0.0.0/24")
+        add_net("10.0.0.128/25")
+        add_tag("10.0.0.0/16", "name", "lan")
+
+    @classmethod
+    def tearDownClass(self):
+        close_database_connection()
+        remove("test.db")
+
+    def test_lookup_ip_most_specific(self):
+        self.assertEqual(lookup_ip("10.0.0.200")["cidr"], "10.0.0.128/25")
+        self.assertEqual(lookup_ip("10.0.0.1")["cidr"], "10.0.0.0/24")
+        self.assertEqual(lookup_ip("10.0.1.1")["cidr"], "10.0.0.0/16")
+        self.assertEqual(lookup_ip("10.200.1.1")["cidr"], "10.0.0.0/8")
+
+    def test_lookup_ip_tags(self):
+        result = lookup_ip("10.0.1.1")
+        self.assertEqual(result["tags"], {"name" : "lan"})
+        self.assertEqual(result["children"], [])
+
+    def test_lookup_ip_not_in_db(self):
+        with self.assertRaises(Fault) as cm:
+            lookup_ip("11.0.0.1")
+        self.assertEqual(cm.exception.faultString, "NetworkNotInDatabase")
+
+    def test_lookup_ip_invalid(self):
+        with self.assertRaises(Fault) as cm:
+            lookup_ip("10.0.0.0/8")
+        self.assertEqual(cm.exception.faultString, "InvalidNetworkDescription")
+
+class TestPrefixSetMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        config.database_file = "test.db"
+        start_database_connection()
+
+        add_net("10.0.0.0/16")
+        add_net("10.0.0.0/24")
+        add_net("10.0.1.0/24")
+        add_net("10.0.3.0/25")
+        add_net("10.0.5.0/24")
+        add_net("2001:db8::/48")
+        add_net("2001:db8:1::/48")
+        for net in ["10.0.0.0/24", "10.0.1.0/24", "10.0.3.0/25", "2001:db8::/48",
+                "2001:db8:1::/48"]:
+            add_tag(net, "site", "x")
+        add_tag("10.0.5.0/24", "site", "y")
+
+    @classmethod
+    def tearDownClass(self):
+        close_database_connection()
+        remove("test.db")
+
+    def test_summarize(self):
+        nets = ["10.0.1.0/24", "10.0.0.0/24", "10.0.0.128/25", "10.0.2.0/23", "::/1",
+                "8000::/1", "192.168.0.1/32"]
+        self.assertEqual(summarize(nets), [str(n) for n in
+            collapse_addresses(ip_network(n) for n in nets if ":" not in n)] + ["::/0"])
+        self.assertEqual(summarize([]), [])
+        self.assertEqual(summarize(["10.0.0.0/24", "10.0.0.0/24"]), ["10.0.0.0/24"])
+        self.assertEqual(summarize("10.0.0.0/8"), ["10.0.0.0/8"])
+        self.assertEqual(summarize(["10.0.0.0/255.255.255.0", "10.0.1.0/24"]), ["10.0.0.0/23"])
+        with self.assertRaises(Fault) as cm:
+            summarize(["10.0.0.1/24"])
+        self.assertEqual(cm.exception.faultString, "InvalidNetworkDescription")
+
+    def test_summarize_random(self):
+        random.seed(3)
+        for i in range(20):
+            nets = {ip_network((random.getrandbits(12) << 20, random.randint(12, 14)), False)
+                    for j in range(50)}
+            self.assertEqual(summarize([str(n) for n in nets]),
+                    [str(n) for n in collapse_addresses(nets)])
+
+    def test_summarize_query(self):
+        self.assertEqual(summarize(query="site=x"), ["10.0.0.0/23", "10.0.3.0/25",
+            "2001:db8::/47"])
+        self.assertEqual(summarize(None, "site=x OR site=y AND NOT site=x"), ["10.0.0.0/23",
+            "10.0.3.0/25", "10.0.5.0/24", "2001:db8::/47"])
+        self.assertEqual(summarize(["10.0.2.0/24", "10.0.3.128/25"], "site=x"),
+            ["10.0.0.0/22", "2001:db8::/47"])
+        with self.assertRaises(Fault) as cm:
+            summarize(query="site=")
+        self.assertEqual(cm.exception.faultString, "InvalidTagQuery")
+
+    def test_free_blocks(self):
+        self.assertEqual(free_blocks("10.0.0.0/16"), ["10.0.2.0/24", "10.0.3.128/25",
+            "10.0.4.0/24", "10.0.6.0/23", "10.0.8.0/21", "10.0.16.0/20", "10.0.32.0/19",
+            "10.0.64.0/18", "10.0.128.0/17"])
+        self.assertEqual(free_blocks("10.0.0.0/16", 20), ["10.0.16.0/20", "10.0.32.0/19",
+            "10.0.64.0/18", "10.0.128.0/17"])
+        # networks which are not in the database
+        self.assertEqual(free_blocks("10.0.0.0/21", 24), ["10.0.2.0/24", "10.0.4.0/24",
+            "10.0.6.0/23"])
+        self.assertEqual(free_blocks("10.0.0.0/24"), ["10.0.0.0/24"])
+        self.assertEqual(free_blocks("2001:db8::/46"), ["2001:db8:2::/47"])
+        with self.assertRaises(Fault) as cm:
+            free_blocks("10.0.0.1/16")
+        self.assertEqual(cm.exception.faultString, "InvalidNetworkDescription")
+
+    def test_diff(self):
+        self.assertEqual(diff("10.0.0.0/22", "10.0.1.0/24"), ["10.0.0.0/24", "10.0.2.0/23"])
+        self.assertEqual(diff("10.0.0.0/24", "10.0.0.0/16"), [])
+        self.assertEqual(diff(["10.0.0.0/24", "10.0.2.0/24", "2001:db8::/32"],
+            ["10.0.0.128/25", "10.0.1.0/24", "2001:db8::/33"]),
+            ["10.0.0.0/25", "10.0.2.0/24", "2001:db8:8000::/33"])
+        self.assertEqual(diff([], "10.0.0.0/8"), [])
+        with self.assertRaises(Fault):
+            diff("10.0.0.0/8", ["foo"])
+
+    def test_diff_random(self):
+        random.seed(5)
+        for i in range(20):
+            a = [ip_network((random.getrandbits(12) << 20, random.randint(12, 16)), False)
+                    for j in range(20)]
+            b = [ip_network((random.getrandbits(12) << 20, random.randint(12, 16)), False)
+                    for j in range(20)]
+            expected = set()
+            for n in collapse_addresses(a):
+                for s in n.subnets(new_prefix=16):
+                    if not any(s.subnet_of(r) for r in b):
+                        expected.add(s)
+            self.assertEqual(diff([str(n) for n in a], [str(n) for n in b]),
+                    [str(n) for n in collapse_addresses(expected)])
+
+class TestPrefix(unittest.TestCase):
+    def random_networks(self, count):
+        nets = list()
+        for i in range(count):
+            max_prefixlen = random.choice([32, 128])
+            prefixlen = random.randint(max_prefixlen - 12, max_prefixlen)
+            address = random.getrandbits(12) << (max_prefixlen - 12)
+            nets.append(ip_network((address, prefixlen), False))
+        return nets
+
+    def test_prefix_like_ip_network(self):
+        random.seed(7)
+        nets = self.random_networks(200)
+        for n in nets:
+            prefix = Prefix.parse(str(n))
+            self.assertEqual(str(prefix), str(n))
+            self.assertEqual((prefix.version, prefix.address, prefix.prefixlen),
+                    (n.version, int(n.network_address), n.prefixlen))
+            self.assertEqual(prefix.broadcast, int(n.broadcast_address))
+            self.assertEqual(prefix.num_addresses, n.num_addresses)
+            self.assertEqual(prefix.address_bytes(), n.network_address.packed)
+            self.assertEqual(prefix.broadcast_bytes(), n.broadcast_address.packed)
+            if n.prefixlen:
+                self.assertEqual(str(prefix.supernet()), str(n.supernet()))
+            self.assertEqual(str(prefix.supernet(0)), str(n.supernet(new_prefix=0)))
+        for a, b in zip(nets, nets[1:]):
+            same = a.version == b.version
+            self.assertEqual(Prefix.parse(str(a)).contains(Prefix.parse(str(b))),
+                    same and b.subnet_of(a))
+            self.assertEqual(Prefix.parse(str(a)).overlaps(Prefix.parse(str(b))),
+                    same and a.overlaps(b))
+        self.assertEqual([str(p) for p in sorted(Prefix.parse(str(n)) for n in nets)],
+                [str(n) for n in sorted(nets, key=lambda n: (n.version, n))])
+
+    def test_prefix_parse(self):
+        self.assertEqual(Prefix.parse("10.0.0.0/255.0.0.0"), Prefix(10 << 24, 8))
+        self.assertEqual(Prefix.parse("10.0.0.1"), Prefix((10 << 24) + 1, 32))
+        self.assertEqual(Prefix.parse(ip_network("2001:db8::/32")),
+                Prefix.parse("2001:db8::/32"))
+        self.assertEqual(len({Prefix.parse("10.0.0.0/8"), Prefix(10 << 24, 8)}), 1)
+        self.assertNotEqual(Prefix(0, 0, 4), Prefix(0, 0, 6))
+        for net in ["foo", "10.0.0.1/8", "10.0.0.0/33", "2001:db8::/129", None]:
+            with self.assertRaises(ValueError):
+                Prefix.parse(net)
+
+    def test_next_aligned(self):
+        self.assertEqual(next_aligned(10 << 24, 24), 10 << 24)
+        self.assertEqual(next_aligned((10 << 24) + 1, 24), (10 << 24) + 256)
+        self.assertEqual(next_aligned((10 << 24) + 255, 30), (10 << 24) + 256)
+        self.assertEqual(next_aligned(1, 64, 128), 1 << 64)
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address("10.0.0.1"), (4, (10 << 24) + 1))
+        self.assertEqual(parse_address("2001:db8::1"), (6, (0x20010db8 << 96) + 1))
+        self.assertEqual(parse_address(1), (4, 1))
+        for ip in ["10.0.0.0/8", "foo", "10.0.0.256"]:
+            with self.assertRaises(ValueError):
+                parse_address(ip)
+
+class TestLookupIpsMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        config.database_file = "test.db"
+        start_database_connection()
+
+        add_net("10.0.0.0/8")
+        add_net("10.0.0.0/16")
+        add_net("10.0.0.0/24")
+        add_net("10.0.0.128/25")
+        add_net("10.2.0.0/16")
+        add_net("2001:db8::/32")
+        add_tag("10.0.0.0/16", "name", "lan")
+        add_tag("2001:db8::/32", "name", "v6")
+
+    @classmethod
+    def tearDownClass(self):
+        close_database_connection()
+        remove("test.db")
+
+    def check_lookup_ips(self):
+        ips = ["10.0.1.1", "10.0.0.200", "11.0.0.1", "10.0.0.1", "10.200.1.1",
+                "2001:db8::1", "10.0.0.200", "9.255.255.255", "10.2.0.1", "::1"]
+        result = lookup_ips(ips)
+        self.assertEqual([r["cidr"] if r is not None else None for r in result],
+                ["10.0.0.0/16", "10.0.0.128/25", None, "10.0.0.0/24", "10.0.0.0/8",
+                    "2001:db8::/32", "10.0.0.128/25", None, "10.2.0.0/16", None])
+        self.assertEqual(result[0]["tags"], {"name" : "lan"})
+        self.assertEqual(result[5]["tags"], {"name" : "v6"})
+        self.assertEqual(result[1]["children"], [])
+        for ip, r in zip(ips, result):
+            if r is not None:
+                self.assertEqual(r, lookup_ip(ip))
+
+    def test_lookup_ips_merge_join(self):
+        self.check_lookup_ips()
+
+    def test_lookup_ips_dense(self):
+        factor = server._merge_join_factor
+        server._merge_join_factor = 0
+        try:
+            self.check_lookup_ips()
+        finally:
+            server._merge_join_factor = factor
+
+    def test_lookup_ips_empty(self):
+        self.assertEqual(lookup_ips([]), [])
+
+    def test_lookup_ips_invalid(self):
+        with self.assertRaises(Fault) as cm:
+            lookup_ips(["10.0.0.1", "10.0.0.0/8"])
+        self.assertEqual(cm.exception.faultString, "InvalidNetworkDescription")
+
+class TestClaimNetsMethods(unittest.TestCase):
+    def setUp(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        config.database_file = "test.db"
+        start_database_connection()
+
+        add_net("127.0.0.0/8")
+
+    def tearDown(self):
+        close_database_connection()
+        remove("test.db")
+
+    def test_claim_nets_normal(self):
+        add_net("127.1.0.0/16")
+        result = claim_nets("127.0.0.0/8", 16, 3)
+        self.assertEqual(result, ["127.0.0.0/16", "127.2.0.0/16", "127.3.0.0/16"])
+        result = get_net("127.0.0.0/8")
+        self.assertEqual(len(result["children"]), 4)
+
+    def test_claim_nets_same_as_claim_net(self):
+        add_net("127.0.0.0/24")
+        add_net("127.0.1.128/25")
+        add_net("127.0.2.0/23")
+        result = claim_nets("127.0.0.0/8", 26, 5)
+        close_database_connection()
+        remove("test.db")
+        start_database_connection()
+        for n in ["127.0.0.0/8", "127.0.0.0/24", "127.0.1.128/25", "127.0.2.0/23"]:
+            add_net(n)
+        self.assertEqual(result, [claim_net("127.0.0.0/8", 26)["cidr"] for i in range(5)])
+
+    def test_claim_nets_tags(self):
+        result = claim_nets("127.0.0.0/8", 24, 2, {"name" : "rack", "vlan" : "10"})
+        for n in result:
+            self.assertEqual(get_tags(n), {"name" : "rack", "vlan" : "10"})
+
+    def test_claim_nets_not_in_db(self):
+        add_net("10.0.0.0/8")
+        add_net("10.0.0.0/24")
+        result = claim_nets("10.0.0.0/16", 24, 2)
+        self.assertEqual(result, ["10.0.1.0/24", "10.0.2.0/24"])
+        result = get_net("10.0.0.0/8")
+        self.assertEqual(len(result["children"]), 3)
+
+    def test_claim_nets_no_matching_gap(self):
+        add_net("127.0.0.0/9")
+        with self.assertRaises(Fault) as cm:
+            claim_nets("127.0.0.0/8", 10, 3)
+        self.assertEqual(cm.exception.faultString, "NoMatchingGapAvailable")
+        result = get_net("127.0.0.0/8")
+        self.assertEqual(len(result["children"]), 1)
+
+    def test_claim_nets_host_bits_set(self):
+        with self.assertRaises(Fault) as cm:
+            claim_nets("127.0.0.1/8", 16, 2)
+        self.assertEqual(cm.exception.faultString, "InvalidNetworkDescription")
+
+    def test_claim_nets_own_size(self):
+        with self.assertRaises(Fault) as cm:
+            claim_nets("127.0.0.0/8", 8, 1)
+        self.assertEqual(cm.exception.faultString, "NoMatchingGapAvailable")
+        self.assertEqual(get_net("127.0.0.0/8")["children"], [])
+        # a network which is not in the database can be claimed in itself
+        self.assertEqual(claim_nets("10.0.0.0/8", 8, 1), ["10.0.0.0/8"])
+
+    def test_claim_nets_invalid_size(self):
+        for claim in [lambda: claim_net("127.0.0.0/8", 33),
+                lambda: claim_nets("127.0.0.0/8", 33, 2)]:
+            with self.assertRaises(Fault) as cm:
+                claim()
+            self.assertEqual(cm.exception.faultString, "InvalidNetworkDescription")
+
+class TestIterNetMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        config.database_file = "test.db"
+        start_database_connection()
+
+        add_net("10.0.0.0/8")
+        for i in range(4):
+            add_net("10.%d.0.0/16" % i)
+            for j in range(5):
+                add_net("10.%d.%d.0/24" % (i, j))
+                add_net("10.%d.%d.0/28" % (i, j))
+        add_tag("10.1.2.0/24", "name", "a")
+
+    @classmethod
+    def tearDownClass(self):
+        close_database_connection()
+        remove("test.db")
+
+    def flatten(self, net, parent=None, depth=0):
+        node = {k : v for k, v in net.items() if k != "children"}
+        node["parent"] = parent
+        node["depth"] = depth
+        nodes = [node]
+        for child in net["children"]:
+            nodes.extend(self.flatten(child, net["cidr"], depth + 1))
+        return nodes
+
+    def test_iter_net_normal(self):
+        self.assertEqual(list(iter_net("10.0.0.0/8")), self.flatten(get_net("10.0.0.0/8")))
+        self.assertEqual(list(iter_net("10.0.0.0/7", chunk_size=3)),
+                self.flatten(get_net("10.0.0.0/7")))
+
+    def test_iter_net_depth(self):
+        for depth in range(4):
+            self.assertEqual(list(iter_net("10.0.0.0/8", depth, chunk_size=7)),
+                    self.flatten(get_net("10.0.0.0/8", depth)))
+
+    def test_get_net_page(self):
+        for depth in [-1, 2]:
+            nodes = list()
+            cursor = None
+            while True:
+                page = get_net_page("10.0.0.0/8", depth, cursor, 4)
+                self.assertLessEqual(len(page["nodes"]), 4)
+                nodes.extend(page["nodes"])
+                cursor = page["cursor"]
+                if cursor is None:
+                    break
+            self.assertEqual(nodes, self.flatten(get_net("10.0.0.0/8", depth)))
+
+    def test_get_net_page_invalid_limit(self):
+        for limit in [0, -1, "4"]:
+            with self.assertRaises(Fault) as cm:
+                get_net_page("10.0.0.0/8", -1, None, limit)
+            self.assertEqual(cm.exception.faultString, "InvalidLimit")
+
+    def test_iter_net_host_bits_set(self):
+        with self.assertRaises(Fault) as cm:
+            list(iter_net("10.0.0.1/8"))
+        self.assertEqual(cm.exception.faultString, "InvalidNetworkDescription")
+
+class TestIPv6Methods(unittest.TestCase):
+    def setUp(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        config.database_file = "test.db"
+        start_database_connection()
+
+        add_net("2001:db8::/32")
+
+    def tearDown(self):
+        close_database_connection()
+        remove("test.db")
+
+    def test_get_net_ipv6(self):
+        add_net("2001:db8:1::/48")
+        add_net("2001:db8:1:2::/64")
+        result = get_net("2001:db8::/32")
+        self.assertEqual(result["address"], "2001:db8::")
+        self.assertEqual(result["children"][0]["cidr"], "2001:db8:1::/48")
+        self.assertEqual(result["children"][0]["children"][0]["cidr"], "2001:db8:1:2::/64")
+
+    def test_families_do_not_mix(self):
+        add_net("0.0.0.0/0")
+        add_net("32.1.13.0/24")
+        add_net("::/0")
+        self.assertEqual([n["cidr"] for n in get_net("::/0")["children"]], ["2001:db8::/32"])
+        self.assertEqual([n["cidr"] for n in get_net("0.0.0.0/0")["children"]], ["32.1.13.0/24"])
+        self.assertEqual(lookup_ip("32.1.13.184")["cidr"], "32.1.13.0/24")
+        self.assertEqual(lookup_ip("2001:db8::1")["cidr"], "2001:db8::/32")
+        self.assertEqual(lookup_ip("2002::1")["cidr"], "::/0")
+
+    def test_claim_64s_from_48(self):
+        add_net("2001:db8:1::/48")
+        result = claim_nets("2001:db8:1::/48", 64, 1000)
+        self.assertEqual(result[:2], ["2001:db8:1::/64", "2001:db8:1:1::/64"])
+        self.assertEqual(result[-1], "2001:db8:1:3e7::/64")
+        self.assertEqual(claim_net("2001:db8:1::/48", 64)["cidr"], "2001:db8:1:3e8::/64")
+        self.assertFalse(server._check_free_blocks(server.db_conn.cursor()))
+
+    def test_high_addresses(self):
+        # these do not fit into a signed 64 bit integer
+        add_net("ffff::/16")
+        self.assertEqual(claim_net("ffff::/16", 17)["cidr"], "ffff::/17")
+        self.assertEqual(claim_net("ffff::/16", 128)["cidr"], "ffff:8000::/128")
+        self.assertEqual(lookup_ip("ffff:8000::")["cidr"], "ffff:8000::/128")
+
+    def test_delete_net_ipv6(self):
+        claim_nets("2001:db8::/32", 48, 3)
+        delete_net("2001:db8:1::/48")
+        self.assertEqual(claim_net("2001:db8::/32", 48)["cidr"], "2001:db8:1::/48")
+        delete_net("2001:db8::/32", recursive=True)
+        self.assertEqual(get_net("2001:db8::/32")["network_in_database"], False)
+        self.assertEqual(get_net("2001:db8::/32")["children"], list())
+        self.assertFalse(server._check_free_blocks(server.db_conn.cursor()))
+
+    def test_tags_ipv6(self):
+        add_tag("2001:0db8::/32", "name", "documentation")
+        self.assertEqual(get_tag("2001:db8::/32", "name"), "documentation")
+        modify_tag("2001:db8::/32", "name", "example")
+        self.assertEqual(get_tags("2001:db8::/32"), {"name" : "example"})
+        delete_tag("2001:db8::/32", "name")
+        self.assertEqual(get_tags("2001:db8::/32"), dict())
+
+class TestAddressMigration(unittest.TestCase):
+    def setUp(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        config.database_file = "test.db"
+
+    def tearDown(self):
+        close_database_connection()
+        remove("test.db")
+
+    def test_migrate_integer_addresses(self):
+        # a database with the schema before the addresses were stored as bytes
+        conn = sqlite3.connect("test.db")
+        for migration in schema_migrations[:3]:
+            migration(conn.cursor())
+        conn.executemany("INSERT INTO networks (net, address, netmask) VALUES (?,?,?)",
+                [("10.0.0.0/8", 10 << 24, 8), ("10.1.0.0/16", (10 << 24) + (1 << 16), 16)])
+        conn.execute("INSERT INTO tags (network_id, tag_name, tag_value) VALUES (2, 'name', 'a')")
+        conn.execute("PRAGMA user_version = 3")
+        conn.commit()
+        conn.close()
+
+        config.check_free_blocks = False
+        try:
+            start_database_connection()
+        finally:
+            config.check_free_blocks = True
+        self.assertEqual(get_net("10.0.0.0/8")["children"][0]["tags"], {"name" : "a"})
+        self.assertFalse(server._check_free_blocks(server.db_conn.cursor()))
+        self.assertEqual(claim_net("10.0.0.0/8", 16)["cidr"], "10.0.0.0/16")
@@ -0,0 +1,109 @@
+import unittest
+
+from os import remove
+from minipam import server
+from minipam.server import *
+
+def run_all_statements():
+    """
+    calls every function of the server once so that every statement in
+    server.py is executed at least once.
+    """
+    add_net("10.0.0.0/8")
+    add_net("10.0.0.0/16")
+    add_net("10.1.0.0/16")
+    add_net("10.1.0.0/24")
+    claim_net("10.0.0.0/8", 16)
+    claim_net("10.2.0.0/15", 24)
+    claim_nets("10.0.0.0/8", 24, 3, {"name" : "x"})
+    claim_nets("10.2.0.0/15", 24, 2)
+    get_net("10.0.0.0/8")
+    get_net("10.0.0.0/7", depth=1)
+    get_net_page("10.0.0.0/8", -1, None, 2)
+    get_net_page("10.0.0.0/8", -1, "10.1.0.0/16", 2)
+    get_usage("10.0.0.0/8")
+    get_usage("10.0.0.0/7")
+    add_tag("10.0.0.0/16", "name", "a")
+    add_tag("10.1.0.0/16", "name", "b")
+    modify_tag("10.1.0.0/16", "name", "c")
+    get_tag("10.1.0.0/16", "name")
+    get_tags("10.1.0.0/16")
+    get_net_by_tag("name")
+    query_nets("name=a OR name IN (b, c) AND NOT vlan")
+    query_nets("NOT name AND NOT vlan", "10.0.0.0/8", "10.0.0.0/16", 1)
+    lookup_ip("10.1.0.1")
+    lookup_ips(["10.1.0.1", "10.3.0.1", "2001:db8::1"])
+    delete_tag("10.1.0.0/16", "name")
+    delete_net("10.0.0.0/16")
+    delete_net("10.1.0.0/16", recursive=True)
+    batch([{"methodName" : "add_net", "params" : ["10.3.0.0/16"]},
+        {"methodName" : "add_tag", "params" : ["10.3.0.0/16", "name", "d"]}])
+    add_net("2001:db8::/32")
+    claim_nets("2001:db8::/32", 48, 2)
+    claim_net("2001:db8::/48", 64)
+    get_net("2001:db8::/32")
+    get_net_page("2001:db8::/32", -1, "2001:db8::/48", 2)
+    lookup_ip("2001:db8::1")
+    delete_net("2001:db8::/48", recursive=True)
+    import_nets([("10.4.0.0/16", {"name" : "e"}), ("10.4.1.0/24", dict())])
+    add_net("10.5.0.0/16")
+    claim_nets("10.5.0.0/16", 24, 4, {"name" : "f"})
+    delete_net("10.5.0.0/16", True, True)
+    delete_net("10.5.0.0/17", False, True)
+    delete_net("10.5.0.0/16", True, False, 2)
+    free_blocks("10.4.0.0/16", 24)
+    free_blocks("10.4.0.0/15")
+    summarize(["10.4.0.0/16", "10.5.0.0/16"], "name=e OR name AND NOT vlan")
+    diff("10.4.0.0/15", ["10.4.1.0/24"])
+    changes_since(None)
+    changes_since(1, 2)
+    changes_within("10.4.0.0/16", 1)
+    config.change_retention = 3600
+    config.change_retention_entries = 1000
+    try:
+        compact_changes()
+    finally:
+        config.change_retention = None
+        config.change_retention_entries = None
+
+class TestQueryPlans(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        config.database_file = "test.db"
+        start_database_connection()
+
+        self.statements = list()
+        server.db_conn.set_trace_callback(self.statements.append)
+        run_all_statements()
+        server.db_conn.set_trace_callback(None)
+
+    @classmethod
+    def tearDownClass(self):
+        close_database_connection()
+        remove("test.db")
+
+    def test_schema_version(self):
+        c = server.db_conn.cursor()
+        c.execute("PRAGMA user_version")
+        self.assertEqual(c.fetchone()[0], len(schema_migrations))
+
+    def test_no_full_scans(self):
+        c = server.db_conn.cursor()
+        queries = {s for s in self.statements
+                if s.split()[0].upper() in ("SELECT", "INSERT", "UPDATE", "DELETE")}
+        self.assertTrue(queries)
+        for query in queries:
+            with self.subTest(query=query):
+                c.execute("EXPLAIN QUERY PLAN " + query)
+                for step in c.fetchall():
+                    # sqlite_sequence has one row per AUTOINCREMENT table and no
+                    # index, the rows of subqueries are checked by their own steps
+                    if step["detail"] == "SCAN sqlite_sequence" or \
+                            step["detail"].startswith("SCAN (subquery"):
+                        continue
+                    self.assertFalse(step["detail"].startswith("SCAN"),
+                            "%s: %s" % (query, step["detail"]))
@@ -3,6 +3,7 @@ import unittest
 from os import remove
 from xmlrpc.server import Fault
 from minipam.server import *
+from minipam import tag_query
 
 class TestAddGetTagMethods(unittest.TestCase):
     def setUp(self):
@@ -143,3 +144,103 @@ class TestModifyTagsMethods(unittest.TestCase):
         with self.assertRaises(Fault) as cm:
             modify_tag("127.0.0.1/8","name", "localhost2")
         self.assertEqual(cm.exception.faultString, "InvalidNetworkDescription")
+
+class TestTagQueryParser(unittest.TestCase):
+    def test_parse_precedence(self):
+        self.assertEqual(tag_query.parse("a OR b AND NOT c"),
+                ("or", [("has", "a"), ("and", [("has", "b"), ("not", ("has", "c"))])]))
+        self.assertEqual(tag_query.parse("(a or b) and c"),
+                ("and", [("or", [("has", "a"), ("has", "b")]), ("has", "c")]))
+
+    def test_parse_values(self):
+        self.assertEqual(tag_query.parse("vlan=10 AND site IN (a, 'b c')"),
+                ("and", [("in", "vlan", ["10"]), ("in", "site", ["a", "b c"])]))
+        self.assertEqual(tag_query.parse('"and"="or"'), ("in", "and", ["or"]))
+
+    def test_parse_invalid(self):
+        for query in ["", "a AND", "a=", "(a", "a IN ()", "a b", "a = \"b"]:
+            with self.subTest(query=query):
+                with self.assertRaises(ValueError):
+                    tag_query.parse(query)
+
+class TestQueryNetsMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        config.database_file = "test.db"
+        start_database_connection()
+
+        add_net("10.0.0.0/8")
+        for i, (vlan, site) in enumerate([("10", "a"), ("10", "b"), ("20", "a"), ("10", "c")]):
+            net = "10.%d.0.0/16" % i
+            add_net(net)
+            add_tag(net, "vlan", vlan)
+            add_tag(net, "site", site)
+        add_tag("10.1.0.0/16", "reserved", "")
+        add_net("10.1.1.0/24")
+        add_tag("10.1.1.0/24", "vlan", "10")
+        add_net("2001:db8::/32")
+        add_tag("2001:db8::/32", "vlan", "10")
+
+    @classmethod
+    def tearDownClass(self):
+        close_database_connection()
+        remove("test.db")
+
+    def query(self, *args):
+        return [n["cidr"] for n in query_nets(*args)["nodes"]]
+
+    def test_query_nets_normal(self):
+        self.assertEqual(self.query("vlan=10 AND site IN (a,b) AND NOT reserved"),
+                ["10.0.0.0/16"])
+        self.assertEqual(self.query("vlan=10"),
+                ["10.0.0.0/16", "10.1.0.0/16", "10.1.1.0/24", "10.3.0.0/16", "2001:db8::/32"])
+        self.assertEqual(self.query("site=a OR reserved"),
+                ["10.0.0.0/16", "10.1.0.0/16", "10.2.0.0/16"])
+        self.assertEqual(self.query("vlan AND NOT vlan=10"), ["10.2.0.0/16"])
+        self.assertEqual(self.query("nothing"), [])
+
+    def test_query_nets_not(self):
+        self.assertEqual(self.query("NOT vlan"), ["10.0.0.0/8"])
+        self.assertEqual(self.query("NOT vlan", "10.0.0.0/8"), ["10.0.0.0/8"])
+        self.assertEqual(self.query("NOT site", "10.1.0.0/16"), ["10.1.1.0/24"])
+
+    def test_query_nets_scope(self):
+        self.assertEqual(self.query("vlan=10", "10.1.0.0/16"), ["10.1.0.0/16", "10.1.1.0/24"])
+        self.assertEqual(self.query("vlan=10", "::/0"), ["2001:db8::/32"])
+
+    def test_query_nets_tags(self):
+        node = query_nets("reserved")["nodes"][0]
+        self.assertEqual(node["tags"], {"vlan" : "10", "site" : "b", "reserved" : ""})
+        self.assertNotIn("children", node)
+
+    def test_query_nets_pages(self):
+        nodes = list()
+        cursor = None
+        while True:
+            page = query_nets("vlan", None, cursor, 2)
+            self.assertLessEqual(len(page["nodes"]), 2)
+            nodes.extend(n["cidr"] for n in page["nodes"])
+            cursor = page["cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(nodes, self.query("vlan"))
+
+    def test_query_nets_invalid(self):
+        with self.assertRaises(Fault) as cm:
+            query_nets("vlan=")
+        self.assertEqual(cm.exception.faultString, "InvalidTagQuery")
+        for query in [5, None]:
+            with self.assertRaises(Fault) as cm:
+                query_nets(query)
+            self.assertEqual(cm.exception.faultString, "InvalidTagQuery")
+        for limit in [0, -1]:
+            with self.assertRaises(Fault) as cm:
+                query_nets("NOT vlan", "10.0.0.0/8", None, limit)
+            self.assertEqual(cm.exception.faultString, "InvalidLimit")
+        with self.assertRaises(Fault) as cm:
+            query_nets("vlan", "10.0.0.1/8")
+        self.assertEqual(cm.exception.faultString, "InvalidNetworkDescription")
@@ -0,0 +1,108 @@
+import sqlite3
+import unittest
+
+from os import remove
+from xmlrpc.server import Fault
+from minipam.server import *
+
+class TestTransactions(unittest.TestCase):
+    def setUp(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        config.database_file = "test.db"
+        start_database_connection()
+        add_net("10.0.0.0/8")
+
+    def tearDown(self):
+        close_database_connection()
+        remove("test.db")
+
+    def committed_nets(self):
+        """
+        returns the networks another connection sees.
+        """
+        conn = sqlite3.connect("test.db")
+        nets = [r[0] for r in conn.execute("SELECT net FROM networks ORDER BY address, netmask")]
+        conn.close()
+        return nets
+
+    def test_transaction_commit(self):
+        with transaction():
+            add_net("10.0.0.0/16")
+            add_net("10.1.0.0/16")
+            self.assertEqual(self.committed_nets(), ["10.0.0.0/8"])
+        self.assertEqual(self.committed_nets(), ["10.0.0.0/8", "10.0.0.0/16", "10.1.0.0/16"])
+
+    def test_transaction_rollback(self):
+        with self.assertRaises(Fault):
+            with transaction():
+                add_net("10.0.0.0/16")
+                add_tag("10.0.0.0/16", "name", "a")
+                add_tag("10.0.0.0/16", "name", "b")
+        self.assertEqual(self.committed_nets(), ["10.0.0.0/8"])
+        self.assertEqual(len(get_net("10.0.0.0/8")["children"]), 0)
+
+    def test_batch(self):
+        result = batch([
+            {"methodName" : "add_net", "params" : ["10.0.0.0/16"]},
+            {"methodName" : "add_tag", "params" : ["10.0.0.0/16", "name", "a"]},
+            {"methodName" : "claim_net", "params" : ["10.0.0.0/8", 16]},
+            {"methodName" : "get_tags", "params" : ["10.0.0.0/16"]}])
+        self.assertEqual(result[0], None)
+        self.assertEqual(result[2]["cidr"], "10.1.0.0/16")
+        self.assertEqual(result[3], {"name" : "a"})
+        self.assertEqual(self.committed_nets(), ["10.0.0.0/8", "10.0.0.0/16", "10.1.0.0/16"])
+
+    def test_batch_atomic(self):
+        with self.assertRaises(Fault) as cm:
+            batch([
+                {"methodName" : "add_net", "params" : ["10.0.0.0/16"]},
+                {"methodName" : "modify_tag", "params" : ["10.0.0.0/16", "name", "a"]}])
+        self.assertEqual(cm.exception.faultString, "TagDoesNotExist")
+        self.assertEqual(self.committed_nets(), ["10.0.0.0/8"])
+
+    def test_batch_invalid_operation(self):
+        for op in [{"methodName" : "remove"}, {"params" : []}, "add_net",
+                {"methodName" : "batch", "params" : [[]]}]:
+            with self.assertRaises(Fault) as cm:
+                batch([{"methodName" : "add_net", "params" : ["10.0.0.0/16"]}, op])
+            self.assertEqual(cm.exception.faultString, "InvalidBatchOperation")
+        self.assertEqual(self.committed_nets(), ["10.0.0.0/8"])
+
+class TestGroupCommit(unittest.TestCase):
+    def setUp(self):
+        try:
+            remove("test.db")
+        except FileNotFoundError:
+            pass
+        config.database_file = "test.db"
+        config.group_commit = 60
+        start_database_connection()
+
+    def tearDown(self):
+        close_database_connection()
+        config.group_commit = 0
+        remove("test.db")
+
+    committed_nets = TestTransactions.committed_nets
+
+    def test_group_commit(self):
+        add_net("10.0.0.0/8")
+        add_net("10.0.0.0/16")
+        self.assertEqual(self.committed_nets(), [])
+        self.assertEqual(len(get_net("10.0.0.0/8")["children"]), 1)
+        flush_group_commit()
+        self.assertEqual(self.committed_nets(), [])
+        flush_group_commit(force=True)
+        self.assertEqual(self.committed_nets(), ["10.0.0.0/8", "10.0.0.0/16"])
+
+    def test_group_commit_rollback(self):
+        add_net("10.0.0.0/8")
+        with self.assertRaises(Fault):
+            batch([{"methodName" : "add_net", "params" : ["10.0.0.0/16"]},
+                {"methodName" : "get_tag", "params" : ["10.0.0.0/16", "name"]}])
+        add_net("10.1.0.0/16")
+        flush_group_commit(force=True)
+        self.assertEqual(self.committed_nets(), ["10.0.0.0/8", "10.1.0.0/16"])
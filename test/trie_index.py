@@ -0,0 +1,121 @@
+import unittest
+
+from minipam import server
+from minipam.server import *
+from minipam.trie import PrefixTrie
+from test.net_methods import *
+from test.tag_methods import *
+from test.transactions import *
+from test.bulk_methods import *
+
+class TestPrefixTrie(unittest.TestCase):
+    def setUp(self):
+        self.trie = PrefixTrie(max_prefixlen=8)
+        for address, prefixlen in [(0, 1), (0, 4), (16, 4), (128, 2), (160, 3), (168, 5)]:
+            self.trie.insert(address, prefixlen, (address, prefixlen))
+
+    def test_get(self):
+        self.assertEqual(self.trie.get(16, 4), (16, 4))
+        self.assertEqual(self.trie.get(0, 2), None)
+        self.assertEqual(self.trie.get(32, 4), None)
+        self.assertEqual(len(self.trie), 6)
+
+    def test_subtree(self):
+        self.assertEqual([v for a, p, v in self.trie.subtree(0, 0)],
+                [(0, 1), (0, 4), (16, 4), (128, 2), (160, 3), (168, 5)])
+        self.assertEqual([v for a, p, v in self.trie.subtree(128, 1)],
+                [(128, 2), (160, 3), (168, 5)])
+        self.assertEqual([v for a, p, v in self.trie.subtree(64, 2)], [])
+
+    def test_longest_match(self):
+        self.assertEqual(self.trie.longest_match(170)[2], (168, 5))
+        self.assertEqual(self.trie.longest_match(161)[2], (160, 3))
+        self.assertEqual(self.trie.longest_match(20)[2], (16, 4))
+        self.assertEqual(self.trie.longest_match(64)[2], (0, 1))
+        self.assertEqual(self.trie.longest_match(192), None)
+
+    def test_remove(self):
+        self.assertEqual(self.trie.remove(160, 3), (160, 3))
+        self.assertEqual(self.trie.remove(160, 3), None)
+        self.assertEqual(self.trie.longest_match(170)[2], (168, 5))
+        self.assertEqual(self.trie.longest_match(161)[2], (128, 2))
+        self.assertEqual(len(self.trie), 5)
+
+class TrieIndexMixin:
+    """
+    runs the tests of a test case with the prefix trie enabled.
+    """
+    @classmethod
+    def setUpClass(self):
+        config.trie_index = True
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(self):
+        super().tearDownClass()
+        config.trie_index = False
+
+    def test_trie_matches_database(self):
+        c = server.db_conn.cursor()
+        c.execute("SELECT net FROM networks ORDER BY family, address, netmask")
+        records = [r for v in (4, 6) for a, p, r in server._tries[v].subtree(0, 0)]
+        self.assertEqual([r["net"] for r in records], [r["net"] for r in c.fetchall()])
+        for r in records:
+            c.execute("SELECT tag_name, tag_value FROM tags JOIN networks ON id = network_id "
+                    "WHERE net = ?", (r["net"],))
+            self.assertEqual(r["tags"], {t["tag_name"] : t["tag_value"] for t in c.fetchall()})
+
+class TestGetNetMethodsTrie(TrieIndexMixin, TestGetNetMethods):
+    pass
+
+class TestGetNetTreeMethodsTrie(TrieIndexMixin, TestGetNetTreeMethods):
+    pass
+
+class TestLookupIpMethodsTrie(TrieIndexMixin, TestLookupIpMethods):
+    pass
+
+class TestLookupIpsMethodsTrie(TrieIndexMixin, TestLookupIpsMethods):
+    pass
+
+class TrieIndexSetUpMixin(TrieIndexMixin):
+    """
+    like TrieIndexMixin for test cases which set up the database for every test.
+    """
+    def setUp(self):
+        config.trie_index = True
+        super().setUp()
+
+    def tearDown(self):
+        self.test_trie_matches_database()
+        super().tearDown()
+        config.trie_index = False
+
+class TestDeleteNetMethodsTrie(TrieIndexSetUpMixin, TestDeleteNetMethods):
+    pass
+
+class TestClaimNetMethodsTrie(TrieIndexSetUpMixin, TestClaimNetMethods):
+    pass
+
+class TestAddGetTagMethodsTrie(TrieIndexSetUpMixin, TestAddGetTagMethods):
+    pass
+
+class TestGetTagsMethodsTrie(TrieIndexSetUpMixin, TestGetTagsMethods):
+    pass
+
+class TestDeleteTagsMethodsTrie(TrieIndexSetUpMixin, TestDeleteTagsMethods):
+    pass
+
+class TestModifyTagsMethodsTrie(TrieIndexSetUpMixin, TestModifyTagsMethods):
+    pass
+
+class TestClaimNetsMethodsTrie(TrieIndexSetUpMixin, TestClaimNetsMethods):
+    pass
+
+class TestTransactionsTrie(TrieIndexSetUpMixin, TestTransactions):
+    pass
+
+class TestImportNetsTrie(TrieIndexSetUpMixin, TestImportNets):
+    pass
+
+class TestIPv6MethodsTrie(TrieIndexSetUpMixin, TestIPv6Methods):
+    pass